@@ -1,6 +1,5 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response
 import os
-import sqlite3
 import unicodedata
 import re
 import requests
@@ -8,25 +7,134 @@ import time
 import uuid
 import datetime
 import json
-from bs4 import BeautifulSoup
+import asyncio
+import contextvars
+import threading
+import itertools
+import concurrent.futures
 from urllib.parse import quote_plus, urlencode
-from flask_session import Session
 import random
+import gc
+import hashlib
+from werkzeug.local import LocalProxy
+from cache_semantico import CacheSemantico
+from embeddings import carregar_modelo
+from cache_respostas import CacheRespostas, CacheBuscaWeb, CachePersistente
+from cliente_http import ClienteHTTP, ClienteHTTPAsync
+from extracao_html import extrair_resultados_lxml, extrair_resultados_bs4
+from orcamento_tokens import OrcamentoTokens
+from contexto_gemini import ContextoCacheGemini
+from banco_dados import BancoConversas
+from sessoes import configurar_sessao, ler_chave_secreta
+from roteador_intencoes import RoteadorIntencoes, normalizar as normalizar_intencao
+from respostas_prontas import RespostasProntas, caminho_faq_padrao
+from coalescencia import VooUnico
+from limites_gemini import ControleGemini, Disjuntor, LimitadorCota
+from fila_trabalhos import FilaTrabalhos
+from whatsapp import EnviadorCloudAPI, EnviadorRegistro, ProcessadorWhatsApp, assinatura_valida
+from instrumentacao import Instrumentacao
+from legislacao import IndiceLegislacao, formatar_trechos
 
-app = Flask(__name__)
-# Configuração da sessão Flask
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
-app.config['SESSION_TYPE'] = 'filesystem'
+class AppAdvogado(Flask):
+    """Flask que só lê ou gera a SECRET_KEY quando uma sessão é usada pela primeira vez
+
+    Assim importar o app (benchmarks, scripts) não cria secret_key.txt na pasta do
+    código; o servidor gera a chave antes do primeiro fork (ver precarregar).
+    """
+
+    @property
+    def secret_key(self):
+        if not self.config.get('SECRET_KEY'):
+            self.config['SECRET_KEY'] = ler_chave_secreta(os.path.dirname(os.path.abspath(__file__)))
+        return self.config['SECRET_KEY']
+
+    @secret_key.setter
+    def secret_key(self, valor):
+        self.config['SECRET_KEY'] = valor
+
+
+app = AppAdvogado(__name__)
+# Configuração da sessão Flask (backend escolhido em SESSION_BACKEND: cookie, sqlite ou filesystem)
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(days=31)
-Session(app)
+configurar_sessao(app, os.path.dirname(os.path.abspath(__file__)))
+
+def criar_recursos_compartilhados():
+    """Dados só de leitura, iguais em todos os workers: classificador de intenções, respostas prontas e índice da legislação
+    
+    Criados no processo principal antes do fork (ver precarregar), são herdados pelos
+    workers sem cópia enquanto não forem modificados.
+    """
+    pasta_app = os.path.dirname(os.path.abspath(__file__))
+    
+    # Artigos de lei do índice local (python legislacao.py ingerir), enviados ao Gemini junto com a
+    # pergunta; o índice é mapeado em memória e o modelo carregado só na primeira consulta
+    legislacao = IndiceLegislacao(
+        os.environ.get('LEGISLATION_INDEX_DIR', os.path.join(pasta_app, 'indice_legislacao')),
+        k=int(os.environ.get('LEGISLATION_TOP_K', '3')),
+        limiar=float(os.environ.get('LEGISLATION_MIN_SCORE', '0.35'))
+    )
+    legislacao.habilitado = os.environ.get('LEGISLATION_ENABLED', '1') == '1' and legislacao.existe()
+    
+    return {
+        # Classificador de intenções das perguntas, compilado uma única vez
+        'roteador_intencoes': RoteadorIntencoes(),
+        # Respostas prontas (sobre o bot e perguntas frequentes de FAQ_PATH), consultadas antes de tudo
+        'respostas_prontas': RespostasProntas(caminho_faq_padrao(pasta_app)),
+        'legislacao': legislacao,
+    }
 
 # Classe para gerenciar o chatbot
 class AdvogadoBot:
-    def __init__(self):
-        # Inicializar cache para consultas frequentes
-        self.cache_consultas = {}
-        self.tamanho_max_cache = 100
+    def __init__(self, recursos=None):
+        # Dados só de leitura compartilhados entre workers (sem `recursos`, o bot cria os seus)
+        recursos = recursos or criar_recursos_compartilhados()
+        
+        # Duração de cada etapa do atendimento (exportada em /metrics) e logs detalhados por requisição
+        self.instrumentacao = Instrumentacao()
+        self.log_detalhado = os.environ.get('LOG_VERBOSE', '0') == '1'
+        
+        # Inicializar cache para consultas frequentes (LRU com validade por entrada)
+        self.tamanho_max_cache = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '1000'))
+        self.ttl_cache = int(os.environ.get('ANSWER_CACHE_TTL', str(24 * 3600)))
+        # Respostas baseadas em dados da web (decisões recentes, notícias) expiram mais cedo
+        self.ttl_cache_web = int(os.environ.get('ANSWER_CACHE_TTL_WEB', str(30 * 60)))
+        self.cache_consultas = CacheRespostas(
+            max_entradas=self.tamanho_max_cache,
+            max_bytes=int(os.environ.get('ANSWER_CACHE_MAX_BYTES', str(5 * 1024 * 1024))),
+            ttl_padrao=self.ttl_cache
+        )
+        
+        # Cache semântico para perguntas parecidas (modelo carregado só na primeira consulta)
+        self.cache_semantico = CacheSemantico(
+            nome_modelo=os.environ.get('SEMANTIC_CACHE_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2'),
+            limiar=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+        )
+        self.cache_semantico.habilitado = os.environ.get('SEMANTIC_CACHE_ENABLED', '1') == '1'
+        
+        # Artigos de lei do índice local enviados ao Gemini junto com a pergunta
+        self.legislacao = recursos['legislacao']
+        
+        # Cliente HTTP com pool de conexões keep-alive para Gemini e DuckDuckGo
+        self.http = ClienteHTTP(
+            pool_conexoes=int(os.environ.get('HTTP_POOL_CONNECTIONS', '10')),
+            pool_max=int(os.environ.get('HTTP_POOL_MAXSIZE', '20')),
+            timeout_conexao=float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5')),
+            timeout_leitura=float(os.environ.get('HTTP_READ_TIMEOUT', '30')),
+            limites_por_host={
+                'https://generativelanguage.googleapis.com': int(os.environ.get('GEMINI_POOL_MAXSIZE', '20')),
+                'https://html.duckduckgo.com': int(os.environ.get('DUCKDUCKGO_POOL_MAXSIZE', '5')),
+            }
+        )
+        
+        # Threads para etapas independentes (histórico e buscas na web em paralelo)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.environ.get('RETRIEVAL_THREADS', '16')),
+            thread_name_prefix='recuperacao'
+        )
+        
+        # Cliente assíncrono usado pelo modo ASGI (criado sob demanda)
+        self.http_async = None
         
         # Inicializar banco de dados SQLite apenas para histórico
         self.inicializar_banco_dados()
@@ -69,39 +177,224 @@ class AdvogadoBot:
         É 18 de maio de 2025, então certifique-se de considerar possíveis mudanças nas leis até esta data.
         """
         
+        # Modelo e parâmetros de geração do Gemini (também compõem a versão do cache persistente)
+        self.modelo_gemini = 'gemini-1.5-flash-latest'
+        self.url_base_gemini = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+        self.url_duckduckgo = os.environ.get('DUCKDUCKGO_URL', 'https://html.duckduckgo.com/html/')
+        
+        # Orçamento de tokens de entrada por requisição ao Gemini
+        self.orcamento_tokens = OrcamentoTokens(
+            orcamento=int(os.environ.get('GEMINI_INPUT_TOKEN_BUDGET', '6000')),
+            caracteres_por_token=float(os.environ.get('GEMINI_CHARS_PER_TOKEN', '4'))
+        )
+        self.lock_tokens = threading.Lock()
+        self.estatisticas_tokens = dict.fromkeys(
+            ('requisicoes', 'sistema', 'sistema_em_cache', 'legislacao', 'web', 'historico', 'pergunta', 'total', 'acima_do_orcamento', 'ajustadas'), 0
+        )
+        
+        # Classificador de intenções e respostas prontas (sobre o bot e perguntas frequentes de FAQ_PATH)
+        self.roteador_intencoes = recursos['roteador_intencoes']
+        self.respostas_prontas = recursos['respostas_prontas']
+        
+        # Busca na web: prazo único para todas as variantes de consulta e limite de resultados combinados
+        self.prazo_busca_web = float(os.environ.get('WEB_SEARCH_DEADLINE', '8'))
+        self.max_resultados_web = int(os.environ.get('WEB_SEARCH_MAX_RESULTS', '5'))
+        self.parser_html = os.environ.get('HTML_PARSER', 'lxml')
+        
+        # Perguntas idênticas em andamento compartilham uma única busca na web e uma única
+        # chamada ao Gemini (a chave é a pergunta normalizada, a mesma do cache de respostas)
+        self.coalescer_requisicoes = os.environ.get('REQUEST_COALESCING', '1') == '1'
+        self.voo_busca_web = VooUnico('busca_web')
+        self.voo_gemini = VooUnico('gemini')
+        
+        # Cache dos resultados do DuckDuckGo, inclusive de buscas vazias ou com falha (cache negativo)
+        self.cache_buscas = CacheBuscaWeb(
+            max_entradas=int(os.environ.get('WEB_SEARCH_CACHE_MAX_ENTRIES', '500')),
+            ttl_padrao=int(os.environ.get('WEB_SEARCH_CACHE_TTL', '600')),
+            ttl_negativo=int(os.environ.get('WEB_SEARCH_CACHE_NEGATIVE_TTL', '60'))
+        )
+        self.config_geracao = {
+            "temperature": 0.7,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": 1024,
+        }
+        
+        # Cota do Gemini (requisições e tokens por minuto), disjuntor e novas tentativas
+        self.controle_gemini = ControleGemini(
+            LimitadorCota(
+                rpm=int(os.environ.get('GEMINI_RPM', '15')),
+                tpm=int(os.environ.get('GEMINI_TPM', '1000000'))
+            ),
+            Disjuntor(
+                limiar_falhas=int(os.environ.get('GEMINI_BREAKER_FAILURES', '5')),
+                tempo_aberto=float(os.environ.get('GEMINI_BREAKER_COOLDOWN', '30'))
+            ),
+            espera_maxima_fila=float(os.environ.get('GEMINI_MAX_QUEUE_WAIT', '10')),
+            espera_maxima_tentativa=float(os.environ.get('GEMINI_MAX_RETRY_WAIT', '20'))
+        )
+        
+        # Contexto em cache no servidor do Gemini com a persona (opcional)
+        self.contexto_gemini = None
+        if os.environ.get('GEMINI_CONTEXT_CACHE', '0') == '1':
+            self.contexto_gemini = ContextoCacheGemini(
+                self.http, self.url_base_gemini, self.modelo_gemini, self.ler_chave_api, self.prompt_sistema,
+                ttl=int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+            )
+        
+        # Cache persistente compartilhado entre workers e reinícios
+        self.cache_persistente = None
+        if os.environ.get('PERSISTENT_CACHE_ENABLED', '1') == '1':
+            self.inicializar_cache_persistente()
+        
+        # Mensagens do WhatsApp: fila durável consumida por workers em segundo plano
+        self.inicializar_whatsapp()
+        
+        self.instrumentacao.registrar_coletor(self.metricas_componentes)
+        
         print("Chatbot Advogado Virtual inicializado com sucesso!")
 
+    def obter_http_async(self):
+        """Retorna o cliente HTTP assíncrono, criado no primeiro uso (dentro do event loop)"""
+        if self.http_async is None:
+            self.http_async = ClienteHTTPAsync(
+                max_conexoes=int(os.environ.get('HTTP_POOL_MAXSIZE', '20')) * 5,
+                timeout_conexao=self.http.timeout_conexao,
+                timeout_leitura=self.http.timeout_leitura
+            )
+        return self.http_async
+    
     def inicializar_banco_dados(self):
         """Inicializa o banco de dados SQLite para armazenar histórico de conversas"""
-        db_path = os.path.join(os.path.dirname(__file__), 'chatbot_data.db')
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
-        
-        # Criar tabela de histórico de conversas se não existir
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historico_conversas (
-            id INTEGER PRIMARY KEY,
-            id_usuario TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            remetente TEXT NOT NULL,
-            mensagem TEXT NOT NULL,
-            plataforma TEXT DEFAULT 'web'
+        db_path = os.environ.get('CHATBOT_DB_PATH', os.path.join(os.path.dirname(__file__), 'chatbot_data.db'))
+        self.banco = BancoConversas(
+            db_path,
+            intervalo_gravacao=float(os.environ.get('DB_WRITE_INTERVAL', '0.2')),
+            tamanho_lote=int(os.environ.get('DB_WRITE_BATCH', '500')),
+            busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000')),
+            usuarios_em_memoria=int(os.environ.get('HISTORY_WINDOW_USERS', '10000')),
+            mensagens_em_memoria=int(os.environ.get('HISTORY_WINDOW_MESSAGES', '10')),
+            max_pendentes=int(os.environ.get('DB_MAX_PENDING', '100000'))
+        )
+    
+    def inicializar_cache_persistente(self):
+        """Abre o cache persistente e pré-carrega na memória as respostas mais acessadas"""
+        caminho = os.environ.get(
+            'PERSISTENT_CACHE_PATH',
+            os.path.join(os.path.dirname(__file__), 'cache_respostas.db')
+        )
+        versao = CachePersistente.calcular_versao(
+            self.modelo_gemini, self.prompt_sistema, json.dumps(self.config_geracao, sort_keys=True)
+        )
+        try:
+            self.cache_persistente = CachePersistente(caminho, versao)
+        except Exception as e:
+            print(f"Erro ao abrir o cache persistente: {e}")
+            self.cache_persistente = None
+            return
+        
+        quantidade_aquecimento = int(os.environ.get('ANSWER_CACHE_WARMUP', '200'))
+        if quantidade_aquecimento > 0:
+            entradas = self.cache_persistente.mais_acessadas(quantidade_aquecimento)
+            # Inserir da menos para a mais acessada, para que as mais acessadas fiquem no topo do LRU
+            for chave, resposta, ttl_restante in reversed(entradas):
+                self.cache_consultas.definir(chave, resposta, ttl=ttl_restante)
+            print(f"Cache pré-carregado com {len(entradas)} respostas persistidas")
+    
+    def inicializar_whatsapp(self):
+        """Abre a fila de mensagens do WhatsApp e inicia os workers que a consomem"""
+        fila = FilaTrabalhos(
+            # Por padrão, ao lado do banco de conversas
+            os.environ.get('WHATSAPP_QUEUE_PATH', os.path.join(os.path.dirname(os.path.abspath(self.banco.caminho)), 'fila_whatsapp.db')),
+            max_tentativas=int(os.environ.get('WHATSAPP_MAX_ATTEMPTS', '5')),
+            prazo_reserva=float(os.environ.get('WHATSAPP_JOB_LEASE', '300')),
+            retencao=int(os.environ.get('WHATSAPP_DEDUPE_TTL', str(7 * 24 * 3600)))
         )
-        ''')
-        
-        # Criar tabela de usuários se não existir
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id_usuario TEXT PRIMARY KEY,
-            nome TEXT,
-            telefone TEXT,
-            email TEXT,
-            data_primeiro_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            data_ultimo_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        
+        # Sem token da Cloud API, as respostas só são registradas (desenvolvimento local)
+        token = os.environ.get('WHATSAPP_TOKEN')
+        id_telefone = os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
+        if token and id_telefone:
+            enviador = EnviadorCloudAPI(
+                self.http, token, id_telefone,
+                url_base=os.environ.get('WHATSAPP_API_BASE', 'https://graph.facebook.com/v20.0')
+            )
+        else:
+            enviador = EnviadorRegistro()
+        
+        self.processador_whatsapp = ProcessadorWhatsApp(
+            fila, self.responder_whatsapp, enviador,
+            workers=int(os.environ.get('WHATSAPP_WORKERS', '2'))
         )
-        ''')
+        if self.processador_whatsapp.workers > 0:
+            self.processador_whatsapp.iniciar()
+    
+    def responder_whatsapp(self, telefone, texto):
+        """Responde uma mensagem do WhatsApp (chamado pelos workers da fila, fora do webhook)"""
+        id_usuario = f"whatsapp_{telefone}"
+        self.banco.registrar_usuario(id_usuario, telefone=telefone, novo=False)
+        return self.obter_resposta(texto, id_usuario=id_usuario, plataforma='whatsapp')
+    
+    def metricas_componentes(self):
+        """Métricas lidas das estatísticas dos componentes, a cada exportação de /metrics"""
+        caches = {
+            'exato': self.cache_consultas.estatisticas(),
+            'semantico': self.cache_semantico.estatisticas(),
+            'busca_web': self.cache_buscas.estatisticas(),
+        }
+        if self.cache_persistente:
+            caches['persistente'] = self.cache_persistente.estatisticas()
+        gemini = self.controle_gemini.estatisticas()
+        banco = self.banco.estatisticas()
+        fila = self.processador_whatsapp.fila.estatisticas()
+        with self.lock_tokens:
+            tokens = dict(self.estatisticas_tokens)
         
-        self.conn.commit()
+        return [
+            ('cache_acertos_total', 'counter', 'Acertos por cache',
+             [({'cache': nome}, dados['acertos']) for nome, dados in caches.items()]),
+            ('cache_falhas_total', 'counter', 'Falhas por cache',
+             [({'cache': nome}, dados['falhas']) for nome, dados in caches.items()]),
+            ('cache_entradas', 'gauge', 'Entradas nos caches em memória',
+             [({'cache': nome}, dados['entradas']) for nome, dados in caches.items() if 'entradas' in dados]),
+            ('gemini_tokens_entrada_total', 'counter', 'Tokens de entrada estimados enviados ao Gemini, por parte do prompt',
+             [({'parte': parte}, tokens[parte]) for parte in ('sistema', 'legislacao', 'web', 'historico', 'pergunta')]),
+            ('gemini_respostas_429_total', 'counter', 'Respostas 429 recebidas do Gemini', [({}, gemini['respostas_429'])]),
+            ('gemini_novas_tentativas_total', 'counter', 'Novas tentativas de chamadas ao Gemini', [({}, gemini['novas_tentativas'])]),
+            ('gemini_recusadas_total', 'counter', 'Chamadas ao Gemini recusadas antes de serem feitas',
+             [({'motivo': 'cota'}, gemini['cota']['recusadas']), ({'motivo': 'disjuntor'}, gemini['disjuntor']['recusadas'])]),
+            ('gemini_disjuntor_aberto', 'gauge', '1 enquanto o disjuntor do Gemini não está fechado',
+             [({}, int(gemini['disjuntor']['estado'] != 'fechado'))]),
+            ('legislacao_consultas_total', 'counter', 'Buscas no índice da legislação, por resultado',
+             [({'resultado': 'com_trechos'}, self.legislacao.consultas_com_resultado),
+              ({'resultado': 'sem_trechos'}, self.legislacao.consultas - self.legislacao.consultas_com_resultado)]),
+            ('coalescidas_total', 'counter', 'Chamadas externas evitadas por coalescência',
+             [({'chamada': 'busca_web'}, self.voo_busca_web.coalescidas), ({'chamada': 'gemini'}, self.voo_gemini.coalescidas)]),
+            ('banco_gravacoes_pendentes', 'gauge', 'Gravações do histórico na fila', [({}, banco['pendentes'])]),
+            ('banco_transacoes_total', 'counter', 'Transações de gravação do histórico', [({}, banco['transacoes'])]),
+            ('banco_gravacao_segundos_total', 'counter', 'Tempo dentro das transações de gravação do histórico',
+             [({}, self.banco.tempo_gravacao)]),
+            ('banco_erros_gravacao_total', 'counter', 'Lotes do histórico que falharam ao gravar (ex.: banco bloqueado)',
+             [({}, banco['erros_gravacao'])]),
+            ('banco_gravacoes_descartadas_total', 'counter', 'Gravações do histórico descartadas (recusadas pelo SQLite ou fila cheia)',
+             [({}, banco['gravacoes_descartadas'])]),
+            ('banco_janela_total', 'counter', 'Leituras de histórico atendidas pela janela em memória ou pelo SQLite',
+             [({'origem': 'memoria'}, banco['janela']['acertos']), ({'origem': 'sqlite'}, banco['janela']['falhas'])]),
+            ('whatsapp_fila_profundidade', 'gauge', 'Mensagens do WhatsApp aguardando processamento', [({}, fila['profundidade'])]),
+            ('whatsapp_fila_em_processamento', 'gauge', 'Mensagens do WhatsApp em processamento', [({}, fila['em_processamento'])]),
+            ('whatsapp_fila_atraso_segundos', 'gauge', 'Espera da mensagem mais antiga ainda não respondida',
+             [({}, fila['atraso_mais_antigo_s'])]),
+            ('whatsapp_mensagens_total', 'counter', 'Mensagens do WhatsApp por resultado (neste processo)',
+             [({'resultado': 'concluida'}, fila['concluidos']), ({'resultado': 'repetida'}, fila['duplicados']),
+              ({'resultado': 'falha'}, fila['falhas_definitivas'])]),
+        ]
+    
+    def guardar_no_cache(self, pergunta_normalizada, resposta, ttl=None):
+        """Guarda a resposta no cache em memória e agenda a gravação no cache persistente"""
+        ttl = ttl if ttl is not None else self.ttl_cache
+        self.cache_consultas.definir(pergunta_normalizada, resposta, ttl=ttl)
+        if self.cache_persistente:
+            self.cache_persistente.definir(pergunta_normalizada, resposta, ttl)
     
     def normalizar_texto(self, texto):
         """Normaliza o texto para melhorar correspondência no cache"""
@@ -143,34 +436,28 @@ class AdvogadoBot:
         """Obtém o ID do usuário da sessão ou cria um novo ID"""
         if 'user_id' not in session:
             session['user_id'] = f"web_{uuid.uuid4()}"
+            session.permanent = True
             
             # Registrar novo usuário no banco de dados
-            try:
-                self.cursor.execute(
-                    "INSERT INTO usuarios (id_usuario) VALUES (?)",
-                    (session['user_id'],)
-                )
-                self.conn.commit()
-            except Exception as e:
-                print(f"Erro ao registrar novo usuário: {e}")
+            self.banco.registrar_usuario(session['user_id'])
         
         return session['user_id']
     
+    def obter_id_usuario_existente(self):
+        """ID do usuário se o visitante já tiver sessão; não cria usuário nem grava a sessão"""
+        if app.session_interface.get_cookie_name(app) not in request.cookies:
+            return None
+        return session.get('user_id')
+    
     def salvar_mensagem(self, id_usuario, remetente, mensagem, plataforma='web'):
         """Salva uma mensagem no histórico de conversas"""
+        return self.salvar_mensagens(id_usuario, [(remetente, mensagem)], plataforma)
+    
+    def salvar_mensagens(self, id_usuario, mensagens, plataforma='web'):
+        """Salva uma lista de (remetente, mensagem) no histórico; a gravação é feita em lote, em segundo plano"""
         try:
-            self.cursor.execute(
-                "INSERT INTO historico_conversas (id_usuario, remetente, mensagem, plataforma) VALUES (?, ?, ?, ?)",
-                (id_usuario, remetente, mensagem, plataforma)
-            )
-            
-            # Atualizar data do último contato
-            self.cursor.execute(
-                "UPDATE usuarios SET data_ultimo_contato = CURRENT_TIMESTAMP WHERE id_usuario = ?",
-                (id_usuario,)
-            )
-            
-            self.conn.commit()
+            with self.instrumentacao.medir('salvar_mensagem'):
+                self.banco.salvar_mensagens(id_usuario, mensagens, plataforma)
             return True
         except Exception as e:
             print(f"Erro ao salvar mensagem no histórico: {e}")
@@ -179,18 +466,156 @@ class AdvogadoBot:
     def obter_historico_usuario(self, id_usuario, limite=10):
         """Obtém o histórico recente de conversas do usuário"""
         try:
-            self.cursor.execute(
-                "SELECT remetente, mensagem FROM historico_conversas WHERE id_usuario = ? ORDER BY timestamp DESC LIMIT ?",
-                (id_usuario, limite)
-            )
-            # Inverter a ordem para ficar cronológico (mais antigo primeiro)
-            historico = list(reversed(self.cursor.fetchall()))
-            return historico
+            # Já vem em ordem cronológica (mais antigo primeiro)
+            with self.instrumentacao.medir('historico'):
+                return self.banco.obter_historico(id_usuario, limite)
         except Exception as e:
             print(f"Erro ao obter histórico do usuário: {e}")
             return []
     
-    def consultar_gemini(self, pergunta, historico=None, tentativas=3, atraso_inicial=1, forcar_web=False, dados_web=None):
+    def montar_payload_gemini(self, pergunta, historico=None, forcar_web=False, dados_web=None, dados_legislacao=None):
+        """Monta o payload (contents + generationConfig) enviado à API Gemini
+        
+        O histórico e os dados da web são ajustados ao orçamento de tokens de entrada;
+        os trechos da legislação (poucos e curtos) não são cortados.
+        
+        Returns:
+            tuple: (payload, contagem), onde contagem traz a estimativa de tokens por parte do prompt.
+        """
+        # Ajustar histórico e dados da web ao orçamento (persona, pergunta e instruções não são cortadas)
+        estimar = self.orcamento_tokens.estimar
+        tokens_fixos = estimar(self.prompt_sistema) + estimar(pergunta)
+        contexto_legislacao = None
+        if dados_legislacao:
+            contexto_legislacao = f"TRECHOS DA LEGISLAÇÃO relacionados à pergunta (cite os artigos quando forem pertinentes):\n\n{dados_legislacao}"
+            tokens_fixos += estimar(contexto_legislacao)
+        if dados_web or forcar_web:
+            tokens_fixos += 200  # Instruções que acompanham os dados da web
+        historico, dados_web, ajustes = self.orcamento_tokens.ajustar(tokens_fixos, historico, dados_web)
+        
+        # Preparar o contexto da conversa para o Gemini
+        contents = []
+        
+        # A persona vai no campo de instrução de sistema ou, se ativo, em um contexto em cache no servidor
+        contexto_cache = self.contexto_gemini.obter_nome() if self.contexto_gemini else None
+        
+        # Artigos de lei encontrados no índice local vêm antes dos dados da web
+        if contexto_legislacao:
+            if self.log_detalhado:
+                print(f"📚 Trechos da legislação adicionados ao contexto ({len(dados_legislacao)} caracteres)")
+            contents.append({
+                "role": "user",
+                "parts": [{"text": contexto_legislacao}]
+            })
+          # Usar as informações da web fornecidas como parâmetro
+        informacoes_web = dados_web
+        
+        # Se forçar uso da web ou encontrou informações, adicionar ao contexto
+        if informacoes_web:
+            if self.log_detalhado:
+                print(f"✅ Adicionando dados da web ao contexto do Gemini ({len(dados_web)} caracteres, forcar_web={forcar_web})")
+            # Instruções para usar as informações da web (reforçadas para perguntas sobre atualidades)
+            if forcar_web:
+                # Instrução mais enfática para usar as informações da web
+                web_context = f"INFORMAÇÕES ATUALIZADAS DA WEB (Use estas informações como base principal para sua resposta):\n\n{informacoes_web}\n\nINSTRUÇÃO CRÍTICA: Sua resposta DEVE incorporar estas informações atualizadas da web. NUNCA diga que você não tem acesso à internet ou a informações atualizadas, pois você tem estes dados atuais agora. Comece sua resposta mencionando que você está fornecendo informações recentes obtidas de fontes confiáveis. Se a pergunta for sobre decisões do STF ou jurisprudência, essas informações da web são especialmente relevantes e devem ser a base principal da sua resposta."
+                contents.append({
+                    "role": "user",
+                    "parts": [{"text": web_context}]
+                })
+                if self.log_detalhado:
+                    print(f"✅ Contexto web adicionado (forçado): {len(web_context)} caracteres")
+            else:
+                # Instrução padrão para outros tipos de perguntas
+                web_context = f"Informações atualizadas encontradas na web que podem ajudar a responder:\n\n{informacoes_web}\n\nUse essas informações para complementar seu conhecimento ao responder a pergunta a seguir."
+                contents.append({
+                    "role": "user",
+                    "parts": [{"text": web_context}]
+                })
+                if self.log_detalhado:
+                    print(f"✅ Contexto web adicionado (normal): {len(web_context)} caracteres")
+        # Se não encontramos na web e é forçado a usar, indicar ao usuário
+        elif forcar_web:
+            if self.log_detalhado:
+                print("⚠️ Não foram encontradas informações na web, mas a busca foi solicitada")
+            contents.append({
+                "role": "user",
+                "parts": [{
+                    "text": "INSTRUÇÃO IMPORTANTE: Foi solicitada uma busca por informações atualizadas sobre este assunto, mas não foram encontrados resultados relevantes na web neste momento. Informe ao usuário que você tentou obter dados recentes sobre este tópico específico mas não encontrou informações relevantes. Sugira que ele tente uma pergunta mais específica ou consulte diretamente o site oficial da instituição mencionada."
+                }]
+            })
+        
+        # Adicionar contexto do histórico (se houver)
+        if historico:
+            for role, text in historico:
+                gemini_role = "user" if role == "user" else "model"
+                contents.append({
+                    "role": gemini_role,
+                    "parts": [{"text": text}]
+                })
+        
+        # Adicionar a pergunta atual
+        contents.append({
+            "role": "user",
+            "parts": [{"text": pergunta}]
+        })
+          # Montar o payload para a API
+        data = {
+            "contents": contents,
+            "generationConfig": self.config_geracao
+        }
+        if contexto_cache:
+            data["cachedContent"] = contexto_cache
+        else:
+            data["systemInstruction"] = {"parts": [{"text": self.prompt_sistema}]}
+        
+        # Prévia do payload enviado (LOG_VERBOSE=1)
+        if self.log_detalhado:
+            print(f"🔍 Enviando {len(contents)} mensagens para o Gemini")
+            for i, content in enumerate(contents):
+                role = content.get('role', 'unknown')
+                text_preview = content.get('parts', [{}])[0].get('text', '')[:100]
+                print(f"  [{i}] {role}: {text_preview}...")
+        
+        # Contagem estimada de tokens por parte do prompt
+        total = sum(estimar(parte.get('text', '')) for content in contents for parte in content['parts'])
+        tokens_sistema = 0 if contexto_cache else estimar(self.prompt_sistema)
+        total += tokens_sistema
+        contagem = {
+            'sistema': tokens_sistema,
+            'historico': sum(estimar(mensagem) for _, mensagem in historico),
+            'pergunta': estimar(pergunta),
+            'legislacao': estimar(contexto_legislacao) if contexto_legislacao else 0,
+        }
+        contagem['web'] = total - sum(contagem.values())
+        contagem.update(
+            total=total, orcamento=self.orcamento_tokens.orcamento, mensagens_historico=len(historico),
+            sistema_em_cache=estimar(self.prompt_sistema) if contexto_cache else 0, **ajustes
+        )
+        self.registrar_tokens(contagem)
+        
+        return data, contagem
+    
+    def registrar_tokens(self, contagem):
+        """Acumula os totais de tokens por parte do prompt (e exibe a contagem com LOG_VERBOSE=1)"""
+        if self.log_detalhado:
+            print(
+                f"🔢 Tokens estimados: total={contagem['total']}/{contagem['orcamento']} "
+                f"(sistema={contagem['sistema']}, legislacao={contagem['legislacao']}, web={contagem['web']}, historico={contagem['historico']}, "
+                f"pergunta={contagem['pergunta']}, sistema_em_cache={contagem['sistema_em_cache']}; resumidas={contagem['mensagens_resumidas']}, "
+                f"removidas={contagem['mensagens_removidas']}, web_removidos={contagem['resultados_web_removidos']})"
+            )
+        with self.lock_tokens:
+            totais = self.estatisticas_tokens
+            totais['requisicoes'] += 1
+            for parte in ('sistema', 'sistema_em_cache', 'legislacao', 'web', 'historico', 'pergunta', 'total'):
+                totais[parte] += contagem[parte]
+            totais['acima_do_orcamento'] += contagem['total'] > contagem['orcamento']
+            totais['ajustadas'] += any(
+                contagem[chave] for chave in ('mensagens_resumidas', 'mensagens_removidas', 'resultados_web_removidos', 'web_cortada')
+            )
+    
+    def consultar_gemini(self, pergunta, historico=None, tentativas=3, atraso_inicial=1, forcar_web=False, dados_web=None,
+                         dados_legislacao=None):
         """Consulta a API Gemini com a pergunta e o histórico da conversa
         
         Args:
@@ -200,136 +625,141 @@ class AdvogadoBot:
             atraso_inicial (int, optional): Atraso inicial entre tentativas. Defaults to 1.
             forcar_web (bool, optional): Se deve forçar o uso de dados da web. Defaults to False.
             dados_web (str, optional): Informações obtidas da web. Defaults to None.
+            dados_legislacao (str, optional): Trechos da legislação do índice local. Defaults to None.
         """
         try:
             chave_api = self.ler_chave_api()
             if not chave_api:
                 return False, "Por favor, configure a chave da API Gemini para que eu possa processar suas perguntas adequadamente."
 
-            base_url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent'
+            base_url = f'{self.url_base_gemini}/models/{self.modelo_gemini}:generateContent'
             headers = {'Content-Type': 'application/json'}
             params = {'key': chave_api}
             
-            # Preparar o contexto da conversa para o Gemini
-            contents = []
-            
-            # Adicionar o prompt de sistema como primeira mensagem
-            contents.append({
-                "role": "user",  # Gemini usa 'user' para prompt de sistema também
-                "parts": [{"text": self.prompt_sistema}]
-            })
-              # Usar as informações da web fornecidas como parâmetro
-            informacoes_web = dados_web
+            data, contagem = self.montar_payload_gemini(pergunta, historico, forcar_web, dados_web, dados_legislacao)
+
+            for tentativa in range(1, tentativas + 1):
+                # Respeitar a cota e o disjuntor antes de cada chamada
+                espera, motivo = self.controle_gemini.liberar(contagem['total'])
+                if motivo:
+                    return False, self.mensagem_recusa_gemini(motivo)
+                if espera:
+                    time.sleep(espera)
+                
+                ultima = tentativa == tentativas
+                try:
+                    response = self.http.post(base_url, headers=headers, params=params, json=data, timeout_leitura=30)
+                except requests.exceptions.Timeout:
+                    falha = "A resposta está demorando muito. Por favor, tente novamente mais tarde."
+                    espera = self.controle_gemini.registrar_erro_conexao(tentativa, atraso_inicial, ultima)
+                except requests.exceptions.RequestException:
+                    # Falha de conexão, corpo truncado (ChunkedEncodingError) etc.
+                    falha = "Por favor, verifique sua conexão com a internet."
+                    espera = self.controle_gemini.registrar_erro_conexao(tentativa, atraso_inicial, ultima)
+                except Exception:
+                    # Erro inesperado: a chamada de teste do disjuntor meio aberto não pode ficar presa
+                    self.controle_gemini.disjuntor.desistir()
+                    raise
+                else:
+                    # 429 e 5xx são repetidos com backoff com jitter (ou após o Retry-After)
+                    espera = self.controle_gemini.registrar_resposta(response, tentativa, atraso_inicial, ultima)
+                    if espera is None:
+                        return self.interpretar_resposta_gemini(response)
+                    falha = None
+                    print(f"⚠️ Gemini respondeu {response.status_code}; nova tentativa em {espera:.1f}s")
+                
+                if espera is None:
+                    return False, falha
+                time.sleep(espera)
+
+            return False, "Não foi possível obter uma resposta no momento."
+
+        except Exception as e:
+            print(f"Ocorreu um erro ao consultar a API: {str(e)}")
+            return False, "Ocorreu um erro ao processar sua solicitação."
+    
+    def mensagem_recusa_gemini(self, motivo):
+        """Mensagem ao usuário quando a chamada ao Gemini é recusada antes de ser feita"""
+        if motivo == 'disjuntor':
+            return "O serviço de respostas está instável no momento. Por favor, tente novamente em alguns instantes."
+        return "Desculpe, estamos com alta demanda no momento. Por favor, tente novamente em alguns instantes."
+    
+    def interpretar_resposta_gemini(self, response):
+        """Converte a resposta HTTP do generateContent em (sucesso, texto)"""
+        if response.status_code == 200:
+            dados = response.json()
             
-            # DEBUG: Verificar os dados que chegaram da web
-            print(f"🔍 DEBUG consultar_gemini - dados_web recebidos: {dados_web is not None}")
-            print(f"🔍 DEBUG consultar_gemini - forcar_web: {forcar_web}")
-            if dados_web:
-                print(f"🔍 DEBUG consultar_gemini - Tamanho dos dados da web: {len(dados_web)} caracteres")
-                print(f"🔍 DEBUG consultar_gemini - Primeiros 200 chars: {dados_web[:200]}...")
+            if 'usageMetadata' in dados and self.log_detalhado:
+                print(f"🔢 Tokens informados pelo Gemini: entrada={dados['usageMetadata'].get('promptTokenCount')}, "
+                      f"em cache={dados['usageMetadata'].get('cachedContentTokenCount', 0)}, "
+                      f"saída={dados['usageMetadata'].get('candidatesTokenCount')}")
             
-            # Se forçar uso da web ou encontrou informações, adicionar ao contexto
-            if informacoes_web:
-                print("✅ Adicionando dados da web ao contexto do Gemini")
-                # Instruções para usar as informações da web (reforçadas para perguntas sobre atualidades)
-                if forcar_web:
-                    # Instrução mais enfática para usar as informações da web
-                    web_context = f"INFORMAÇÕES ATUALIZADAS DA WEB (Use estas informações como base principal para sua resposta):\n\n{informacoes_web}\n\nINSTRUÇÃO CRÍTICA: Sua resposta DEVE incorporar estas informações atualizadas da web. NUNCA diga que você não tem acesso à internet ou a informações atualizadas, pois você tem estes dados atuais agora. Comece sua resposta mencionando que você está fornecendo informações recentes obtidas de fontes confiáveis. Se a pergunta for sobre decisões do STF ou jurisprudência, essas informações da web são especialmente relevantes e devem ser a base principal da sua resposta."
-                    contents.append({
-                        "role": "user",
-                        "parts": [{"text": web_context}]
-                    })
-                    print(f"✅ Contexto web adicionado (forçado): {len(web_context)} caracteres")
-                else:
-                    # Instrução padrão para outros tipos de perguntas
-                    web_context = f"Informações atualizadas encontradas na web que podem ajudar a responder:\n\n{informacoes_web}\n\nUse essas informações para complementar seu conhecimento ao responder a pergunta a seguir."
-                    contents.append({
-                        "role": "user",
-                        "parts": [{"text": web_context}]
-                    })
-                    print(f"✅ Contexto web adicionado (normal): {len(web_context)} caracteres")
-            # Se não encontramos na web e é forçado a usar, indicar ao usuário
-            elif forcar_web:
-                print("⚠️ Não foram encontradas informações na web, mas a busca foi solicitada")
-                contents.append({
-                    "role": "user",
-                    "parts": [{
-                        "text": "INSTRUÇÃO IMPORTANTE: Foi solicitada uma busca por informações atualizadas sobre este assunto, mas não foram encontrados resultados relevantes na web neste momento. Informe ao usuário que você tentou obter dados recentes sobre este tópico específico mas não encontrou informações relevantes. Sugira que ele tente uma pergunta mais específica ou consulte diretamente o site oficial da instituição mencionada."
-                    }]
-                })
+            if 'candidates' in dados and len(dados['candidates']) > 0:
+                resposta = dados['candidates'][0]['content']['parts'][0]['text']
+                resposta = resposta.replace('***', '').replace('**', '')
+                if self.log_detalhado:
+                    print(f"✅ Resposta do Gemini recebida: {len(resposta)} caracteres")
+                return True, resposta
             else:
-                print("ℹ️ Nenhum dado da web será usado nesta consulta")
-            
+                return False, "Não consegui formular uma resposta. Poderia reformular sua pergunta?"
+        else:
+            print(f"Erro na requisição: {response.status_code} - {response.text}")
             
-            # Adicionar contexto do histórico (se houver)
-            if historico:
-                for role, text in historico:
-                    gemini_role = "user" if role == "user" else "model"
-                    contents.append({
-                        "role": gemini_role,
-                        "parts": [{"text": text}]
-                    })
+            # Se for erro de limite de API ou tokens, informar ao usuário
+            if response.status_code in [429, 400]:
+                return False, "Desculpe, estamos com alta demanda no momento. Por favor, tente novamente em alguns instantes."
             
-            # Adicionar a pergunta atual
-            contents.append({
-                "role": "user",
-                "parts": [{"text": pergunta}]
-            })
-              # Montar o payload para a API
-            data = {
-                "contents": contents,
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "topK": 40,
-                    "topP": 0.95,
-                    "maxOutputTokens": 1024,
-                }
-            }
+            return False, "Houve um erro ao processar sua pergunta."
+    
+    async def consultar_gemini_async(self, pergunta, historico=None, tentativas=3, atraso_inicial=1, forcar_web=False, dados_web=None,
+                                     dados_legislacao=None):
+        """Versão assíncrona de consultar_gemini: a espera pela API e o backoff não bloqueiam o event loop"""
+        try:
+            chave_api = self.ler_chave_api()
+            if not chave_api:
+                return False, "Por favor, configure a chave da API Gemini para que eu possa processar suas perguntas adequadamente."
+
+            base_url = f'{self.url_base_gemini}/models/{self.modelo_gemini}:generateContent'
+            headers = {'Content-Type': 'application/json'}
+            params = {'key': chave_api}
             
-            # DEBUG: Log do payload sendo enviado
-            print(f"🔍 DEBUG - Enviando {len(contents)} mensagens para o Gemini")
-            for i, content in enumerate(contents):
-                role = content.get('role', 'unknown')
-                text_preview = content.get('parts', [{}])[0].get('text', '')[:100]
-                print(f"  [{i}] {role}: {text_preview}...")
+            if self.contexto_gemini:
+                # Criar/renovar o contexto em cache fora do event loop
+                await asyncio.to_thread(self.contexto_gemini.obter_nome)
+            data, contagem = self.montar_payload_gemini(pergunta, historico, forcar_web, dados_web, dados_legislacao)
+            http_async = self.obter_http_async()
 
-            atraso = atraso_inicial
             for tentativa in range(1, tentativas + 1):
+                espera, motivo = self.controle_gemini.liberar(contagem['total'])
+                if motivo:
+                    return False, self.mensagem_recusa_gemini(motivo)
+                
+                ultima = tentativa == tentativas
                 try:
-                    response = requests.post(base_url, headers=headers, params=params, json=data, timeout=30)
-                    
-                    if response.status_code == 200:
-                        dados = response.json()
-                        
-                        if 'candidates' in dados and len(dados['candidates']) > 0:
-                            resposta = dados['candidates'][0]['content']['parts'][0]['text']
-                            resposta = resposta.replace('***', '').replace('**', '')
-                            print(f"✅ Resposta do Gemini recebida: {len(resposta)} caracteres")
-                            return True, resposta
-                        else:
-                            return False, "Não consegui formular uma resposta. Poderia reformular sua pergunta?"
-                    else:
-                        print(f"Erro na requisição: {response.status_code} - {response.text}")
-                        
-                        # Se for erro de limite de API ou tokens, informar ao usuário
-                        if response.status_code in [429, 400]:
-                            return False, "Desculpe, estamos com alta demanda no momento. Por favor, tente novamente em alguns instantes."
-                        
-                        return False, "Houve um erro ao processar sua pergunta."
-                        
-                except requests.exceptions.ConnectionError:
-                    if tentativa < tentativas:
-                        time.sleep(atraso)
-                        atraso *= 2  # Backoff exponencial
-                        continue
-                    return False, "Por favor, verifique sua conexão com a internet."
-                    
+                    if espera:
+                        await asyncio.sleep(espera)
+                    response = await http_async.post(base_url, headers=headers, params=params, json=data, timeout_leitura=30)
                 except requests.exceptions.Timeout:
-                    if tentativa < tentativas:
-                        time.sleep(atraso)
-                        atraso *= 2  # Backoff exponencial
-                        continue
-                    return False, "A resposta está demorando muito. Por favor, tente novamente mais tarde."
+                    falha = "A resposta está demorando muito. Por favor, tente novamente mais tarde."
+                    espera = self.controle_gemini.registrar_erro_conexao(tentativa, atraso_inicial, ultima)
+                except requests.exceptions.RequestException:
+                    # Falha de conexão, corpo truncado (ChunkedEncodingError) etc.
+                    falha = "Por favor, verifique sua conexão com a internet."
+                    espera = self.controle_gemini.registrar_erro_conexao(tentativa, atraso_inicial, ultima)
+                except BaseException:
+                    # Erro inesperado ou cancelamento: a chamada de teste do disjuntor meio aberto não pode ficar presa
+                    self.controle_gemini.disjuntor.desistir()
+                    raise
+                else:
+                    espera = self.controle_gemini.registrar_resposta(response, tentativa, atraso_inicial, ultima)
+                    if espera is None:
+                        return self.interpretar_resposta_gemini(response)
+                    falha = None
+                    print(f"⚠️ Gemini respondeu {response.status_code}; nova tentativa em {espera:.1f}s")
+                
+                if espera is None:
+                    return False, falha
+                await asyncio.sleep(espera)
 
             return False, "Não foi possível obter uma resposta no momento."
 
@@ -337,242 +767,783 @@ class AdvogadoBot:
             print(f"Ocorreu um erro ao consultar a API: {str(e)}")
             return False, "Ocorreu um erro ao processar sua solicitação."
     
-    def obter_resposta(self, pergunta_usuario):
-        """Obtém resposta para a pergunta do usuário usando exclusivamente a API Gemini"""
-        # Normalizar a pergunta para o cache
-        pergunta_normalizada = self.normalizar_texto(pergunta_usuario)
-          # Verificar cache primeiro para perguntas comuns
-        if pergunta_normalizada in self.cache_consultas:
-            print("Resposta encontrada no cache!")
-            return self.cache_consultas[pergunta_normalizada], True
-        
-        # Verificar se é uma pergunta sobre atualidades que exige busca na web
-        pergunta_lower = pergunta_usuario.lower()
-          # Lista de termos que indicam perguntas sobre atualidades/notícias recentes
-        termos_atualidade = [
-            "recente", "recentes", "última", "últimas", "atual", "atuais", 
-            "nova", "novas", "novo", "novos", "novidade", "novidades",
-            "ontem", "hoje", "semana", "mês", "ano", "decisão", "decisões"
-        ]
+    def consultar_gemini_stream(self, pergunta, historico=None, tentativas=3, atraso_inicial=1, forcar_web=False, dados_web=None,
+                                dados_legislacao=None):
+        """Consulta a API Gemini pelo endpoint streamGenerateContent (SSE)
         
-        # Lista de entidades específicas sobre as quais sempre buscar na web
-        entidades_busca_web = ["stf", "supremo", "tribunal federal", "stj", "tribunal de justiça", "jurisprudência"]
+        Produz ('parcial', texto) à medida que os trechos chegam e, por último,
+        ('fim', (sucesso, resposta_completa)). Novas tentativas só são feitas se a
+        falha ocorrer antes do primeiro trecho ser enviado; se a transmissão cair
+        depois disso, o fim traz sucesso=False e o texto recebido com um aviso, para
+        que a resposta incompleta não seja salva no histórico nem nos caches.
+        """
+        chave_api = self.ler_chave_api()
+        if not chave_api:
+            yield 'fim', (False, "Por favor, configure a chave da API Gemini para que eu possa processar suas perguntas adequadamente.")
+            return
         
-        # Verificar se a pergunta contém termos sobre atualidades ou entidades específicas
-        pergunta_sobre_atualidade = any(termo in pergunta_lower for termo in termos_atualidade)
-        pergunta_sobre_entidade_web = any(entidade in pergunta_lower for entidade in entidades_busca_web)
+        base_url = f'{self.url_base_gemini}/models/{self.modelo_gemini}:streamGenerateContent'
+        headers = {'Content-Type': 'application/json'}
+        params = {'key': chave_api, 'alt': 'sse'}
         
-        # Se é sobre entidade específica ou atualidade, força busca na web
-        forcar_busca_web = pergunta_sobre_atualidade or pergunta_sobre_entidade_web
-          # Verificar se é uma pergunta DIRETA e ESPECÍFICA sobre o chatbot
-        resposta = None
+        try:
+            data, contagem = self.montar_payload_gemini(pergunta, historico, forcar_web, dados_web, dados_legislacao)
+        except Exception as e:
+            print(f"Ocorreu um erro ao consultar a API: {str(e)}")
+            yield 'fim', (False, "Ocorreu um erro ao processar sua solicitação.")
+            return
         
-        # Detectar perguntas muito específicas sobre o criador (sem contexto de conversa)
-        perguntas_diretas_criador = [
-            "quem te criou", "quem criou você", "quem é seu criador", "quem desenvolveu você",
-            "quem fez você", "quem é o seu desenvolvedor"
-        ]
+        inicio = time.perf_counter()
+        partes = []
+        pendente = ''
+        interrompida = False
+        for tentativa in range(1, tentativas + 1):
+            espera, motivo = self.controle_gemini.liberar(contagem['total'])
+            if motivo:
+                yield 'fim', (False, self.mensagem_recusa_gemini(motivo))
+                return
+            if espera:
+                time.sleep(espera)
+            
+            ultima = tentativa == tentativas
+            registrada = False
+            try:
+                with self.http.post(base_url, headers=headers, params=params, json=data, stream=True, timeout_leitura=30) as response:
+                    # 429 e 5xx antes do primeiro trecho são repetidos com backoff com jitter (ou após o Retry-After)
+                    espera = self.controle_gemini.registrar_resposta(response, tentativa, atraso_inicial, ultima)
+                    registrada = True
+                    if espera is not None:
+                        print(f"⚠️ Gemini respondeu {response.status_code}; nova tentativa em {espera:.1f}s")
+                    elif response.status_code != 200:
+                        print(f"Erro na requisição: {response.status_code} - {response.text}")
+                        if response.status_code in [429, 400]:
+                            yield 'fim', (False, "Desculpe, estamos com alta demanda no momento. Por favor, tente novamente em alguns instantes.")
+                        else:
+                            yield 'fim', (False, "Houve um erro ao processar sua pergunta.")
+                        return
+                    else:
+                        for linha in response.iter_lines(chunk_size=None, decode_unicode=True):
+                            if not linha or not linha.startswith('data:'):
+                                continue
+                            evento = json.loads(linha[5:].strip())
+                            candidatos = evento.get('candidates') or []
+                            if not candidatos:
+                                continue
+                            texto = ''.join(p.get('text', '') for p in candidatos[0].get('content', {}).get('parts', []))
+                            if not texto:
+                                continue
+                            if not partes and self.log_detalhado:
+                                print(f"✅ Primeiro trecho do Gemini em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+                            partes.append(texto)
+                            
+                            # Remover marcadores de negrito sem cortar um '**' dividido entre dois trechos
+                            texto = (pendente + texto).replace('***', '').replace('**', '')
+                            pendente = texto[len(texto.rstrip('*')):]
+                            texto = texto[:len(texto) - len(pendente)]
+                            if texto:
+                                yield 'parcial', texto
+                if espera is not None:
+                    time.sleep(espera)
+                    continue
+                break
+            except requests.exceptions.RequestException as e:
+                # Falha de conexão, timeout, corpo truncado (ChunkedEncodingError) etc.
+                if not partes:
+                    espera = self.controle_gemini.registrar_erro_conexao(tentativa, atraso_inicial, ultima)
+                    if espera is not None:
+                        time.sleep(espera)
+                        continue
+                    if isinstance(e, requests.exceptions.Timeout):
+                        yield 'fim', (False, "A resposta está demorando muito. Por favor, tente novamente mais tarde.")
+                    else:
+                        yield 'fim', (False, "Por favor, verifique sua conexão com a internet.")
+                    return
+                print(f"Transmissão do Gemini interrompida: {e}")
+                interrompida = True
+                break
+            except Exception as e:
+                print(f"Ocorreu um erro ao consultar a API: {str(e)}")
+                if not registrada:
+                    # A chamada de teste do disjuntor meio aberto não pode ficar presa
+                    self.controle_gemini.disjuntor.desistir()
+                if not partes:
+                    yield 'fim', (False, "Ocorreu um erro ao processar sua solicitação.")
+                    return
+                interrompida = True
+                break
         
-        # Detectar perguntas específicas sobre propósito/finalidade
-        perguntas_diretas_proposito = [
-            "qual sua finalidade", "qual seu propósito", "para que você serve", 
-            "por que foi criado", "qual seu objetivo", "qual sua função"
-        ]
+        if pendente:
+            yield 'parcial', pendente
         
-        # Detectar perguntas amplas sobre o bot
-        perguntas_amplas_bot = [
-            "me fale sobre você", "me conte sobre você", "sua história", 
-            "quem é você", "sobre você"
-        ]
+        if not partes:
+            yield 'fim', (False, "Não consegui formular uma resposta. Poderia reformular sua pergunta?")
+            return
         
-        # Verificar se é uma pergunta DIRETA sobre o criador (sem contexto)
-        pergunta_direta_criador = any(frase in pergunta_lower for frase in perguntas_diretas_criador)
+        resposta = ''.join(partes).replace('***', '').replace('**', '')
+        if interrompida:
+            # O usuário já viu os trechos; a resposta incompleta não conta como sucesso
+            yield 'fim', (False, f"{resposta}\n\n(A resposta foi interrompida. Por favor, tente novamente.)")
+            return
+        if self.log_detalhado:
+            print(f"✅ Resposta do Gemini transmitida: {len(resposta)} caracteres em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        yield 'fim', (True, resposta)
+    
+    def obter_resposta(self, pergunta_usuario, id_usuario=None, plataforma='web'):
+        """Obtém resposta para a pergunta do usuário usando exclusivamente a API Gemini
         
-        # Verificar se é uma pergunta DIRETA sobre propósito
-        pergunta_direta_proposito = any(frase in pergunta_lower for frase in perguntas_diretas_proposito)
+        Sem id_usuario, o usuário é o da sessão Flask (rotas web).
+        """
+        resposta, contexto = self.preparar_consulta(pergunta_usuario, id_usuario, plataforma)
+        if resposta is not None:
+            return resposta, True
         
-        # Verificar se é uma pergunta ampla sobre o bot
-        pergunta_ampla = any(frase in pergunta_lower for frase in perguntas_amplas_bot)
+        # Consultar API do Gemini com o histórico, a pergunta e os dados da web (quando disponíveis)
+        sucesso, resposta = self.consultar_gemini_coalescido(contexto)
         
-        # REGRA IMPORTANTE: Só responder automaticamente se for uma pergunta MUITO específica
-        # e não contiver outros contextos que indiquem uma conversa sobre outros temas
+        self.concluir_consulta(contexto, sucesso, resposta)
+        return resposta, sucesso
+    
+    @staticmethod
+    def argumentos_gemini(contexto):
+        return {
+            'pergunta': contexto['pergunta'],
+            'historico': contexto['historico'],
+            'forcar_web': contexto['forcar_busca_web'],
+            'dados_web': contexto['dados_web'],
+            'dados_legislacao': contexto['dados_legislacao']
+        }
+    
+    @staticmethod
+    def chave_coalescencia(contexto):
+        """Chave da chamada ao Gemini: a pergunta e, se houver, um hash do histórico que vai no prompt
         
-        # Palavras que indicam contexto de conversa sobre outros assuntos
-        contextos_outros = [
-            "faculdade", "universidade", "recomend", "indic", "sugir", "curso", 
-            "estud", "escola", "ensino", "educação", "graduação", "qual", "onde"
-        ]
+        Sem o histórico na chave, quem esperasse a chamada de outro usuário receberia uma
+        resposta escrita a partir da conversa dele.
+        """
+        if not contexto['historico']:
+            return contexto['pergunta_normalizada']
+        resumo = hashlib.sha256(json.dumps(contexto['historico'], ensure_ascii=False).encode('utf-8')).hexdigest()
+        return f"{contexto['pergunta_normalizada']}|{resumo}"
+    
+    def consultar_gemini_coalescido(self, contexto):
+        """Consulta o Gemini; perguntas idênticas (com o mesmo histórico) em andamento esperam e compartilham a mesma chamada"""
+        with self.instrumentacao.medir('gemini'):
+            if not self.coalescer_requisicoes:
+                return self.consultar_gemini(**self.argumentos_gemini(contexto))
+            return self.voo_gemini.executar(self.chave_coalescencia(contexto), self.consultar_gemini, **self.argumentos_gemini(contexto))
+    
+    async def consultar_gemini_coalescido_async(self, contexto):
+        """Versão assíncrona de consultar_gemini_coalescido"""
+        with self.instrumentacao.medir('gemini'):
+            if not self.coalescer_requisicoes:
+                return await self.consultar_gemini_async(**self.argumentos_gemini(contexto))
+            return await self.voo_gemini.executar_async(
+                self.chave_coalescencia(contexto), lambda: self.consultar_gemini_async(**self.argumentos_gemini(contexto))
+            )
+    
+    def obter_resposta_stream(self, contexto):
+        """Gera a resposta do Gemini em partes, a partir do contexto criado por preparar_consulta
+        
+        Produz ('parcial', texto) para cada trecho recebido e, ao final, ('fim', (sucesso, resposta)).
+        A resposta completa é salva no histórico e no cache quando a transmissão termina.
+        Se a mesma pergunta, com o mesmo histórico, já estiver sendo respondida (por streaming
+        ou não), espera por essa resposta e a envia em um único trecho.
+        """
+        sucesso, resposta = False, "Não foi possível obter uma resposta no momento."
+        inicio = time.perf_counter()
+        chave = self.chave_coalescencia(contexto)
+        chamada, lider = self.voo_gemini.entrar(chave) if self.coalescer_requisicoes else (None, True)
+        if not lider:
+            sucesso, resposta = VooUnico.aguardar(chamada)
+            if sucesso:
+                yield 'parcial', resposta
+        else:
+            try:
+                for tipo, dados in self.consultar_gemini_stream(**self.argumentos_gemini(contexto)):
+                    if tipo == 'parcial':
+                        yield tipo, dados
+                    else:
+                        sucesso, resposta = dados
+            finally:
+                # Também se o cliente desconectar no meio: quem espera recebe a falha padrão
+                if chamada is not None:
+                    self.voo_gemini.concluir(chave, chamada, (sucesso, resposta))
+        
+        self.instrumentacao.registrar_duracao('gemini', time.perf_counter() - inicio)
+        self.concluir_consulta(contexto, sucesso, resposta)
+        yield 'fim', (sucesso, resposta)
+    
+    def verificar_caches(self, pergunta_usuario, pergunta_normalizada):
+        """Procura a resposta nos caches em memória, persistente e semântico
         
-        # Se a pergunta contém contextos sobre outros assuntos, NÃO usar resposta automática
-        tem_outro_contexto = any(contexto in pergunta_lower for contexto in contextos_outros)
+        Returns:
+            tuple: (resposta ou None, vetor). `vetor` é o embedding da pergunta feito para o
+            cache semântico (None se ele não chegou a ser consultado), reaproveitado na busca
+            da legislação e ao guardar a resposta.
+        """
+        with self.instrumentacao.medir('cache'):
+            return self._verificar_caches(pergunta_usuario, pergunta_normalizada)
+    
+    def _verificar_caches(self, pergunta_usuario, pergunta_normalizada):
+        # Verificar cache primeiro para perguntas comuns
+        resposta_cache = self.cache_consultas.obter(pergunta_normalizada)
+        if resposta_cache is not None:
+            if self.log_detalhado:
+                print("Resposta encontrada no cache!")
+            return resposta_cache, None
+        
+        # Verificar o cache persistente (compartilhado entre workers)
+        if self.cache_persistente:
+            entrada_persistente = self.cache_persistente.obter(pergunta_normalizada)
+            if entrada_persistente:
+                resposta_cache, ttl_restante = entrada_persistente
+                if self.log_detalhado:
+                    print("Resposta encontrada no cache persistente!")
+                self.cache_consultas.definir(pergunta_normalizada, resposta_cache, ttl=ttl_restante)
+                return resposta_cache, None
+        
+        # Verificar cache semântico para perguntas com outras palavras mas mesmo sentido
+        # (a pergunta original, com acentos, é embutida uma vez só por consulta)
+        vetor = self.cache_semantico.embutir(pergunta_usuario)
+        resposta_semelhante = self.cache_semantico.buscar(pergunta_usuario, exibir=self.log_detalhado, vetor=vetor)
+        if resposta_semelhante:
+            self.guardar_no_cache(pergunta_normalizada, resposta_semelhante)
+            return resposta_semelhante, None
+        
+        return None, vetor
+    
+    def classificar_pergunta(self, pergunta_usuario):
+        """Detecta se a pergunta exige busca na web e se tem resposta pronta (sobre o bot ou FAQ)
+        
+        Returns:
+            dict: forcar_busca_web, sobre_atualidade, sobre_entidade_web e resposta_pronta
+            (texto da resposta automática ou None).
+        """
+        # Todas as intenções em uma única passada (termos sem acento e com limite de palavra)
+        pergunta_normalizada = normalizar_intencao(pergunta_usuario)
+        intencoes = self.roteador_intencoes.classificar(pergunta_normalizada, ja_normalizado=True)
+        
+        # Perguntas sobre atualidades ou entidades específicas (STF, STJ...) forçam busca na web
+        pergunta_sobre_atualidade = 'atualidade' in intencoes
+        pergunta_sobre_entidade_web = 'entidade_web' in intencoes
+        forcar_busca_web = pergunta_sobre_atualidade or pergunta_sobre_entidade_web
+        
+        # Verificar se é uma pergunta DIRETA e ESPECÍFICA sobre o chatbot
+        pergunta_direta_criador = 'criador' in intencoes
+        pergunta_direta_proposito = 'proposito' in intencoes
+        pergunta_ampla = 'sobre_bot' in intencoes
+        
+        # REGRA IMPORTANTE: Só responder automaticamente se for uma pergunta MUITO específica
+        # e não contiver outros contextos (faculdade, curso, "qual", "onde"...) fora da própria
+        # frase sobre o bot ("qual sua finalidade" não conta como outro contexto)
+        tem_outro_contexto = 'outro_contexto' in intencoes
+        frases_bot = [intencoes[nome] for nome in ('criador', 'proposito', 'sobre_bot') if nome in intencoes]
+        if frases_bot and tem_outro_contexto:
+            restante = pergunta_normalizada
+            for frase in frases_bot:
+                restante = re.sub(rf'\b{re.escape(frase)}\b', ' ', restante)
+            tem_outro_contexto = 'outro_contexto' in self.roteador_intencoes.classificar(restante, ja_normalizado=True)
         
         # Só responder automaticamente se for pergunta direta SEM outros contextos
+        intencao_bot = None
         if pergunta_direta_criador and not tem_outro_contexto:
-            resposta = "Fui criado por Paulo Ricardo, um desenvolvedor estudante de análise e desenvolvimento de sistemas pela Unicarioca."
-        
+            intencao_bot = 'criador'
         elif pergunta_direta_proposito and not tem_outro_contexto:
-            resposta = "Fui criado por Paulo Ricardo para ser um apoio nos estudos da sua esposa Esther Rodrigues, estudante de direito pela Unicarioca. Sou um assistente jurídico virtual que fornece informações sobre leis e procedimentos legais no Brasil."
-        
+            intencao_bot = 'proposito'
         elif pergunta_ampla and not tem_outro_contexto:
-            resposta = """Sou um assistente jurídico virtual chamado Advogado Virtual, criado por Paulo Ricardo, estudante de análise e desenvolvimento de sistemas pela Unicarioca. 
-            
-Fui desenvolvido para apoiar os estudos da sua esposa dele, Esther Rodrigues, que estuda direito na mesma universidade. Minha função é fornecer informações gerais sobre leis e procedimentos legais no Brasil."""
+            intencao_bot = 'sobre_bot'
         
-        # Se encontrou uma resposta específica para estas perguntas
-        if resposta:
-            # Obter ID do usuário da sessão
-            id_usuario = self.obter_ou_criar_id_usuario()
-            
-            # Salvar a interação no histórico
-            self.salvar_mensagem(id_usuario, "user", pergunta_usuario)
-            self.salvar_mensagem(id_usuario, "bot", resposta)
-            
-            # Adicionar ao cache
-            if len(self.cache_consultas) < self.tamanho_max_cache:
-                self.cache_consultas[pergunta_normalizada] = resposta
-                
-            return resposta, True
-          # Obter ID do usuário da sessão
-        id_usuario = self.obter_ou_criar_id_usuario()
+        # Perguntas frequentes (pergunta inteira) ou a resposta sobre o bot
+        resposta = self.respostas_prontas.buscar(pergunta_normalizada, intencao_bot)
         
-        # Obter histórico recente da conversa
-        historico = self.obter_historico_usuario(id_usuario)
+        return {
+            'forcar_busca_web': forcar_busca_web,
+            'sobre_atualidade': pergunta_sobre_atualidade,
+            'sobre_entidade_web': pergunta_sobre_entidade_web,
+            'resposta_pronta': resposta
+        }
+    
+    def registrar_resposta_pronta(self, id_usuario, pergunta_usuario, resposta, plataforma='web'):
+        """Agenda no histórico uma resposta automática (sem consulta ao Gemini)
+        
+        A gravação entra na fila do BancoConversas, gravada em lote em segundo plano. Não
+        vai para os caches: a tabela de respostas prontas já é consultada antes deles.
+        Visitantes ainda sem sessão não têm histórico onde registrar a interação.
+        """
+        self.instrumentacao.contar('respostas', origem='resposta_pronta')
+        if id_usuario:
+            self.salvar_mensagens(id_usuario, [("user", pergunta_usuario), ("bot", resposta)], plataforma)
+    
+    def montar_contexto(self, pergunta_usuario, pergunta_normalizada, id_usuario, historico, classificacao, dados_web,
+                        dados_legislacao=None, plataforma='web', vetor=None):
+        """Agrupa os dados necessários para consultar o Gemini e concluir a consulta"""
+        return {
+            'pergunta': pergunta_usuario,
+            'pergunta_normalizada': pergunta_normalizada,
+            'id_usuario': id_usuario,
+            'plataforma': plataforma,
+            'historico': historico,
+            'forcar_busca_web': classificacao['forcar_busca_web'],
+            'dados_web': dados_web,
+            'dados_legislacao': dados_legislacao,
+            # Embedding da pergunta (cache semântico), reaproveitado ao guardar a resposta
+            'vetor': vetor
+        }
+    
+    def registrar_busca_web(self, pergunta_usuario, classificacao):
+        if not self.log_detalhado:
+            return
+        if classificacao['sobre_entidade_web']:
+            print(f"Pergunta sobre entidade específica detectada: {pergunta_usuario}")
+        if classificacao['sobre_atualidade']:
+            print(f"Pergunta sobre atualidade detectada: {pergunta_usuario}")
+        print("Iniciando busca na web...")
+    
+    def registrar_resultado_busca_web(self, dados_web):
+        if not self.log_detalhado:
+            return
+        if dados_web:
+            print(f"✅ Dados da web encontrados e serão passados para o Gemini: {dados_web[:200]}...")
+        else:
+            print("❌ Nenhum dado da web foi encontrado")
+    
+    def preparar_consulta(self, pergunta_usuario, id_usuario=None, plataforma='web'):
+        """Executa as etapas anteriores à chamada ao Gemini (cache, respostas prontas, histórico, busca na web)
+        
+        Args:
+            pergunta_usuario (str): A pergunta do usuário
+            id_usuario (str, optional): ID do usuário. Se omitido, é obtido da sessão Flask.
+            plataforma (str, optional): Origem da conversa gravada no histórico ('web' ou 'whatsapp')
+        
+        Returns:
+            tuple: (resposta, contexto). Se resposta não for None, ela já pode ser devolvida ao
+            usuário; caso contrário, contexto traz os dados necessários para consultar o Gemini.
+        """
+        # Respostas prontas primeiro: sem caches, sem criar usuário e sem gravar a sessão
+        with self.instrumentacao.medir('classificacao'):
+            classificacao = self.classificar_pergunta(pergunta_usuario)
+        if classificacao['resposta_pronta']:
+            resposta = classificacao['resposta_pronta']
+            self.registrar_resposta_pronta(id_usuario or self.obter_id_usuario_existente(), pergunta_usuario, resposta, plataforma)
+            return resposta, None
+        
+        # Normalizar a pergunta para o cache
+        with self.instrumentacao.medir('normalizacao'):
+            pergunta_normalizada = self.normalizar_texto(pergunta_usuario)
+        resposta_cache, vetor = self.verificar_caches(pergunta_usuario, pergunta_normalizada)
+        if resposta_cache is not None:
+            self.instrumentacao.contar('respostas', origem='cache')
+            return resposta_cache, None
+        
+        # Obter ID do usuário da sessão
+        id_usuario = id_usuario or self.obter_ou_criar_id_usuario()
+        
+        # Obter histórico recente da conversa (em paralelo com a busca na web, se houver)
+        # (levando o contexto, para que a duração entre nos tempos desta requisição)
+        futuro_historico = self.executor.submit(contextvars.copy_context().run, self.obter_historico_usuario, id_usuario)
+        futuro_legislacao = None
+        if self.legislacao.habilitado:
+            futuro_legislacao = self.executor.submit(contextvars.copy_context().run, self.buscar_legislacao, pergunta_usuario, vetor)
         
         # Dados da web são inicialmente None (não utilizados)
         dados_web = None
-          # Para perguntas sobre atualidades ou entidades específicas, realizar a busca na web
-        if forcar_busca_web:
-            if pergunta_sobre_entidade_web:
-                print(f"Pergunta sobre entidade específica detectada: {pergunta_usuario}")
-            if pergunta_sobre_atualidade:
-                print(f"Pergunta sobre atualidade detectada: {pergunta_usuario}")
-                
-            print("Iniciando busca na web...")
-            dados_web = self.buscar_na_web(pergunta_usuario)
-            print("Busca na web concluída.")
-            print(f"Dados obtidos da web: {dados_web}")  # Debug
-            if dados_web:
-                print("✅ Dados da web encontrados e serão passados para o Gemini")
-            else:
-                print("❌ Nenhum dado da web foi encontrado")
+        # Para perguntas sobre atualidades ou entidades específicas, realizar a busca na web
+        if classificacao['forcar_busca_web']:
+            self.registrar_busca_web(pergunta_usuario, classificacao)
+            dados_web = self.buscar_na_web_coalescida(pergunta_usuario, pergunta_normalizada)
+            self.registrar_resultado_busca_web(dados_web)
         
-        # Consultar API do Gemini com o histórico, a pergunta e os dados da web (quando disponíveis)
-        sucesso, resposta = self.consultar_gemini(
-            pergunta=pergunta_usuario, 
-            historico=historico, 
-            forcar_web=forcar_busca_web, 
-            dados_web=dados_web
+        historico = futuro_historico.result()
+        dados_legislacao = futuro_legislacao.result() if futuro_legislacao else None
+        
+        return None, self.montar_contexto(
+            pergunta_usuario, pergunta_normalizada, id_usuario, historico, classificacao, dados_web, dados_legislacao, plataforma, vetor
+        )
+    
+    async def preparar_consulta_async(self, pergunta_usuario, id_usuario):
+        """Versão assíncrona de preparar_consulta: acesso a disco em threads e busca na web sem bloquear o event loop"""
+        # Apenas memória (a gravação no histórico fica na fila do BancoConversas): sem thread
+        with self.instrumentacao.medir('classificacao'):
+            classificacao = self.classificar_pergunta(pergunta_usuario)
+        if classificacao['resposta_pronta']:
+            resposta = classificacao['resposta_pronta']
+            self.registrar_resposta_pronta(id_usuario, pergunta_usuario, resposta)
+            return resposta, None
+        
+        with self.instrumentacao.medir('normalizacao'):
+            pergunta_normalizada = self.normalizar_texto(pergunta_usuario)
+        resposta_cache, vetor = await asyncio.to_thread(self.verificar_caches, pergunta_usuario, pergunta_normalizada)
+        if resposta_cache is not None:
+            self.instrumentacao.contar('respostas', origem='cache')
+            return resposta_cache, None
+        
+        tarefa_historico = asyncio.ensure_future(asyncio.to_thread(self.obter_historico_usuario, id_usuario))
+        tarefa_legislacao = None
+        if self.legislacao.habilitado:
+            # Embedding da pergunta e produto com a matriz: CPU fora do event loop
+            tarefa_legislacao = asyncio.ensure_future(asyncio.to_thread(self.buscar_legislacao, pergunta_usuario, vetor))
+        
+        dados_web = None
+        if classificacao['forcar_busca_web']:
+            self.registrar_busca_web(pergunta_usuario, classificacao)
+            dados_web = await self.buscar_na_web_coalescida_async(pergunta_usuario, pergunta_normalizada)
+            self.registrar_resultado_busca_web(dados_web)
+        
+        historico = await tarefa_historico
+        dados_legislacao = await tarefa_legislacao if tarefa_legislacao else None
+        
+        return None, self.montar_contexto(
+            pergunta_usuario, pergunta_normalizada, id_usuario, historico, classificacao, dados_web, dados_legislacao, vetor=vetor
         )
-          # Salvar a interação no histórico
-        self.salvar_mensagem(id_usuario, "user", pergunta_usuario)
-        if sucesso:
-            self.salvar_mensagem(id_usuario, "bot", resposta)
+    
+    async def obter_resposta_async(self, pergunta_usuario, id_usuario):
+        """Versão assíncrona de obter_resposta, para uso em servidores ASGI (ver asgi.py)
+        
+        O ID do usuário é recebido explicitamente, pois não há sessão Flask ativa no event loop.
+        """
+        resposta, contexto = await self.preparar_consulta_async(pergunta_usuario, id_usuario)
+        if resposta is not None:
+            return resposta, True
+        
+        sucesso, resposta = await self.consultar_gemini_coalescido_async(contexto)
+        
+        # Gravações no SQLite em thread separada para não bloquear o event loop
+        await asyncio.to_thread(self.concluir_consulta, contexto, sucesso, resposta)
+        return resposta, sucesso
+    
+    def concluir_consulta(self, contexto, sucesso, resposta):
+        """Salva a interação no histórico e guarda a resposta no cache"""
+        self.instrumentacao.contar('respostas', origem='gemini' if sucesso else 'falha')
+        
+        # Salvar a interação no histórico
+        plataforma = contexto.get('plataforma', 'web')
+        if not sucesso:
+            self.salvar_mensagem(contexto['id_usuario'], "user", contexto['pergunta'], plataforma)
+        else:
+            self.salvar_mensagens(contexto['id_usuario'], [("user", contexto['pergunta']), ("bot", resposta)], plataforma)
             
             # Guardar no cache se for uma resposta bem sucedida
-            # Apenas se o cache não estiver cheio
-            if len(self.cache_consultas) < self.tamanho_max_cache:
-                self.cache_consultas[pergunta_normalizada] = resposta
-                
-        return resposta, sucesso
+            # Respostas sobre atualidades usam validade curta e ficam fora do cache semântico,
+            # que não expira entradas
+            pergunta_normalizada = contexto['pergunta_normalizada']
+            if contexto['forcar_busca_web']:
+                self.guardar_no_cache(pergunta_normalizada, resposta, ttl=self.ttl_cache_web)
+            else:
+                self.guardar_no_cache(pergunta_normalizada, resposta)
+                self.cache_semantico.adicionar(contexto['pergunta'], resposta, vetor=contexto.get('vetor'))
 
-    def buscar_na_web(self, pergunta):
-        """Busca informações jurídicas na web usando DuckDuckGo"""
+    def buscar_legislacao(self, pergunta, vetor=None):
+        """Trechos da legislação parecidos com a pergunta, no índice local, formatados para o Gemini
+        
+        `vetor` é o embedding da pergunta já feito pelo cache semântico; só é usado se o
+        índice tiver sido gerado com o mesmo modelo.
+        
+        Returns:
+            str: Um trecho por linha ("- Lei, Art. N ..."), ou None se nada passar do limiar.
+        """
         try:
-            print(f"Buscando informações na web para: {pergunta}")
-              # Usar apenas DuckDuckGo para busca
-            resultados_duckduckgo = self.buscar_duckduckgo(pergunta)
-            if resultados_duckduckgo:
-                return f"INFORMAÇÕES ATUAIS DA WEB:\n\n{resultados_duckduckgo}"
-                
+            with self.instrumentacao.medir('legislacao'):
+                if vetor is not None and not self.legislacao.usa_modelo(self.cache_semantico.nome_modelo):
+                    vetor = None
+                trechos = self.legislacao.buscar(pergunta, vetor=vetor)
+        except Exception as e:
+            print(f"Erro na busca da legislação: {str(e)}")
             return None
+        if self.log_detalhado:
+            encontrados = ', '.join(f"{trecho['lei']} {trecho['artigo']} ({trecho['similaridade']:.2f})" for trecho in trechos)
+            print(f"📚 Legislação: {encontrados or 'nenhum trecho acima do limiar'}")
+        return formatar_trechos(trechos) if trechos else None
+    
+    def buscar_na_web(self, pergunta):
+        """Busca informações jurídicas na web usando DuckDuckGo
+        
+        Quando há mais de uma variante de consulta (ex.: sites do STF/Conjur/JOTA e a consulta
+        genérica), as buscas são feitas em paralelo sob um único prazo; os resultados que
+        chegarem a tempo são combinados e deduplicados.
+        """
+        try:
+            if self.log_detalhado:
+                print(f"Buscando informações na web para: {pergunta}")
+            consultas = self.consultas_busca_web(pergunta)
+            
+            futuros = [
+                self.executor.submit(contextvars.copy_context().run, self.buscar_itens_duckduckgo, query)
+                for query in consultas
+            ]
+            concluidos, pendentes = concurrent.futures.wait(futuros, timeout=self.prazo_busca_web)
+            if pendentes:
+                print(f"⚠️ {len(pendentes)} busca(s) não terminaram dentro do prazo de {self.prazo_busca_web}s")
+            
+            # Manter a ordem de prioridade das consultas ao combinar os resultados
+            listas = [futuro.result() for futuro in futuros if futuro in concluidos]
+            return self.combinar_resultados_web(listas)
             
         except Exception as e:
             print(f"Erro ao buscar na web: {str(e)}")
             return None
 
-    def buscar_duckduckgo(self, pergunta):
-        """Busca informações no DuckDuckGo (alternativa gratuita ao Google/SerpAPI)"""
+    async def buscar_na_web_async(self, pergunta):
+        """Versão assíncrona de buscar_na_web"""
         try:
-            print(f"🔍 Iniciando busca no DuckDuckGo para: {pergunta}")
+            if self.log_detalhado:
+                print(f"Buscando informações na web para: {pergunta}")
+            consultas = self.consultas_busca_web(pergunta)
             
-            # Lista de user agents para rotação
-            user_agents = [
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
-                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15'
-            ]
+            tarefas = [asyncio.ensure_future(self.buscar_itens_duckduckgo_async(query)) for query in consultas]
+            concluidas, pendentes = await asyncio.wait(tarefas, timeout=self.prazo_busca_web)
+            for tarefa in pendentes:
+                tarefa.cancel()
+            if pendentes:
+                print(f"⚠️ {len(pendentes)} busca(s) não terminaram dentro do prazo de {self.prazo_busca_web}s")
             
-            # Adicionar termos específicos para busca jurídica
-            pergunta_lower = pergunta.lower()
-            if "stf" in pergunta_lower or "supremo" in pergunta_lower:
-                query = pergunta + " site:stf.jus.br OR site:conjur.com.br OR site:jota.info"
-            else:
-                query = pergunta + " jurisprudência legislação brasil direito"
-                
-            print(f"🔍 Query de busca: {query}")
+            listas = [tarefa.result() for tarefa in tarefas if tarefa in concluidas]
+            return self.combinar_resultados_web(listas)
             
-            params = {
-                'q': query,
-                'kl': 'br-pt',  # Localização: Brasil, idioma português
-                'ia': 'web'     # Solicitar resultados da web
-            }
+        except Exception as e:
+            print(f"Erro ao buscar na web: {str(e)}")
+            return None
+
+    def buscar_na_web_coalescida(self, pergunta, pergunta_normalizada):
+        """buscar_na_web com uma única busca para perguntas idênticas em andamento"""
+        with self.instrumentacao.medir('busca_web'):
+            if not self.coalescer_requisicoes:
+                return self.buscar_na_web(pergunta)
+            return self.voo_busca_web.executar(pergunta_normalizada, self.buscar_na_web, pergunta)
+    
+    async def buscar_na_web_coalescida_async(self, pergunta, pergunta_normalizada):
+        """Versão assíncrona de buscar_na_web_coalescida"""
+        with self.instrumentacao.medir('busca_web'):
+            if not self.coalescer_requisicoes:
+                return await self.buscar_na_web_async(pergunta)
+            return await self.voo_busca_web.executar_async(pergunta_normalizada, lambda: self.buscar_na_web_async(pergunta))
+    
+    def combinar_resultados_web(self, listas_de_itens):
+        """Intercala, deduplica (pela fonte) e formata os resultados de várias buscas"""
+        vistos = set()
+        itens = []
+        for grupo in itertools.zip_longest(*[lista or [] for lista in listas_de_itens]):
+            for item in grupo:
+                if item is None:
+                    continue
+                titulo, snippet, url = item
+                chave = url.lower().strip() if url != "URL não disponível" else titulo.lower().strip()
+                if chave in vistos:
+                    continue
+                vistos.add(chave)
+                itens.append(item)
+        
+        itens = itens[:self.max_resultados_web]
+        if not itens:
+            return None
+        
+        resultados = "\n".join(f"- {titulo}: {snippet} [Fonte: {url}]" for titulo, snippet, url in itens)
+        return f"INFORMAÇÕES ATUAIS DA WEB:\n\n{resultados}"
+
+    def consultas_busca_web(self, pergunta):
+        """Retorna as variantes de consulta ao DuckDuckGo, em ordem de prioridade"""
+        consulta_generica = pergunta + " jurisprudência legislação brasil direito"
+        
+        # Adicionar termos específicos para busca jurídica
+        if 'stf' in self.roteador_intencoes.classificar(pergunta):
+            return [pergunta + " site:stf.jus.br OR site:conjur.com.br OR site:jota.info", consulta_generica]
+        return [consulta_generica]
+
+    def montar_busca_duckduckgo(self, query):
+        """Monta a URL e os cabeçalhos da busca no DuckDuckGo para a consulta"""
+        # Lista de user agents para rotação
+        user_agents = [
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15'
+        ]
             
-            url = f"https://html.duckduckgo.com/html/?{urlencode(params)}"
+        
+        params = {
+            'q': query,
+            'kl': 'br-pt',  # Localização: Brasil, idioma português
+            'ia': 'web'     # Solicitar resultados da web
+        }
+        
+        url = f"{self.url_duckduckgo}?{urlencode(params)}"
+        if self.log_detalhado:
             print(f"🔍 URL de busca: {url}")
+        
+        headers = {
+            'User-Agent': random.choice(user_agents),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Referer': 'https://duckduckgo.com/',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Cache-Control': 'max-age=0'
+        }
+        return url, headers
+
+    def extrair_resultados_duckduckgo(self, html):
+        """Extrai até 3 resultados (título, trecho, fonte) do HTML da busca do DuckDuckGo
+        
+        Usa o parser incremental do lxml, que para após os 3 primeiros resultados; o
+        BeautifulSoup fica como alternativa se ele falhar (ou se HTML_PARSER=bs4).
+        """
+        resultados = None
+        if self.parser_html == 'lxml':
+            try:
+                resultados = extrair_resultados_lxml(html, limite=3)
+            except Exception as e:
+                print(f"⚠️ Falha no parser lxml, usando BeautifulSoup: {e}")
+        
+        if resultados is None:
+            resultados = extrair_resultados_bs4(html, limite=3)
+        
+        if self.log_detalhado:
+            print(f"🔍 Encontrados {len(resultados)} resultados")
+        return resultados
+
+    def buscar_itens_duckduckgo(self, query):
+        """Executa uma consulta no DuckDuckGo e retorna a lista de (título, trecho, fonte)
+        
+        Os resultados ficam em cache pela consulta normalizada (incluindo o sufixo site:).
+        """
+        chave = self.normalizar_texto(query)
+        itens = self.cache_buscas.obter_busca(chave)
+        if itens is not None:
+            if self.log_detalhado:
+                print(f"🔍 Busca encontrada no cache ({len(itens)} resultados)")
+            return itens
+        
+        inicio = time.perf_counter()
+        itens = []
+        try:
+            url, headers = self.montar_busca_duckduckgo(query)
             
-            headers = {
-                'User-Agent': random.choice(user_agents),
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Referer': 'https://duckduckgo.com/',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Cache-Control': 'max-age=0'
-            }
-            
-            resposta = requests.get(url, headers=headers, timeout=10)
-            print(f"🔍 Status da resposta: {resposta.status_code}")
+            resposta = self.http.get(url, headers=headers, timeout_leitura=10)
             
             if resposta.status_code != 200:
                 print(f"❌ Erro na busca: Status {resposta.status_code}")
-                return None
-                
-            # Parse HTML
-            soup = BeautifulSoup(resposta.text, 'lxml')
-            
-            # Extrair os resultados da busca
-            resultados = []
+            else:
+                itens = self.extrair_resultados_duckduckgo(resposta.text)
             
-            # Procurar por resultados
-            for resultado in soup.select('.result')[:3]:  # Limitar a 3 resultados
-                titulo_elemento = resultado.select_one('.result__title')
-                snippet_elemento = resultado.select_one('.result__snippet')
-                url_elemento = resultado.select_one('.result__url')
-                
-                if titulo_elemento and snippet_elemento:
-                    titulo = titulo_elemento.get_text(strip=True)
-                    snippet = snippet_elemento.get_text(strip=True)
-                    url = url_elemento.get_text(strip=True) if url_elemento else "URL não disponível"
-                    
-                    resultados.append(f"- {titulo}: {snippet} [Fonte: {url}]")
+        except Exception as e:
+            print(f"❌ Erro ao buscar no DuckDuckGo: {str(e)}")
+        
+        duracao = time.perf_counter() - inicio
+        self.instrumentacao.registrar_duracao('duckduckgo', duracao)
+        self.cache_buscas.definir_busca(chave, itens, duracao)
+        return itens
+
+    async def buscar_itens_duckduckgo_async(self, query):
+        """Versão assíncrona de buscar_itens_duckduckgo (o parse do HTML roda em uma thread)"""
+        chave = self.normalizar_texto(query)
+        itens = self.cache_buscas.obter_busca(chave)
+        if itens is not None:
+            if self.log_detalhado:
+                print(f"🔍 Busca encontrada no cache ({len(itens)} resultados)")
+            return itens
+        
+        inicio = time.perf_counter()
+        itens = []
+        try:
+            url, headers = self.montar_busca_duckduckgo(query)
             
-            print(f"🔍 Encontrados {len(resultados)} resultados")
-            resultado_final = "\n".join(resultados) if resultados else None
+            resposta = await self.obter_http_async().get(url, headers=headers, timeout_leitura=10)
             
-            if resultado_final:
-                print(f"✅ Resultados encontrados: {resultado_final[:200]}...")
+            if resposta.status_code != 200:
+                print(f"❌ Erro na busca: Status {resposta.status_code}")
             else:
-                print("❌ Nenhum resultado encontrado")
-                
-            return resultado_final
+                itens = await asyncio.to_thread(self.extrair_resultados_duckduckgo, resposta.text)
             
         except Exception as e:
             print(f"❌ Erro ao buscar no DuckDuckGo: {str(e)}")
-            return None
+        
+        duracao = time.perf_counter() - inicio
+        self.instrumentacao.registrar_duracao('duckduckgo', duracao)
+        self.cache_buscas.definir_busca(chave, itens, duracao)
+        return itens
 
-# Inicializar o chatbot
-chatbot = AdvogadoBot()
+    def buscar_duckduckgo(self, pergunta):
+        """Busca informações no DuckDuckGo (alternativa gratuita ao Google/SerpAPI)"""
+        itens = self.buscar_itens_duckduckgo(self.consultas_busca_web(pergunta)[0])
+        resultado_final = "\n".join(f"- {titulo}: {snippet} [Fonte: {url}]" for titulo, snippet, url in itens) or None
+        
+        if self.log_detalhado:
+            print(f"✅ Resultados encontrados: {resultado_final[:200]}..." if resultado_final else "❌ Nenhum resultado encontrado")
+        
+        return resultado_final
+
+# Um AdvogadoBot por processo, criado no primeiro uso. Com um servidor que faz fork dos
+# workers depois de importar o app (gunicorn --preload, ver gunicorn.conf.py), cada worker
+# cria o seu, com as próprias conexões SQLite, threads e pools HTTP
+_recursos_compartilhados = None
+_chatbot_do_processo = None
+_chatbots_herdados = []
+_lock_chatbot = threading.Lock()
+
+def recursos_compartilhados():
+    global _recursos_compartilhados
+    with _lock_chatbot:
+        if _recursos_compartilhados is None:
+            _recursos_compartilhados = criar_recursos_compartilhados()
+        return _recursos_compartilhados
+
+def obter_chatbot():
+    """O AdvogadoBot deste processo, criado na primeira chamada"""
+    global _chatbot_do_processo
+    if _chatbot_do_processo is None:
+        recursos = recursos_compartilhados()
+        with _lock_chatbot:
+            if _chatbot_do_processo is None:
+                _chatbot_do_processo = AdvogadoBot(recursos)
+    return _chatbot_do_processo
+
+def _descartar_chatbot_herdado():
+    """No processo filho de um fork: as threads do bot do pai não existem mais, o filho cria o seu"""
+    global _chatbot_do_processo, _lock_chatbot
+    if _chatbot_do_processo is not None:
+        print("⚠️ AdvogadoBot criado antes do fork: o worker vai criar outro (chame precarregar, não obter_chatbot, antes do fork)")
+        # Mantido referenciado: fechar as conexões herdadas poderia afetar as do processo pai
+        _chatbots_herdados.append(_chatbot_do_processo)
+        _chatbot_do_processo = None
+    _lock_chatbot = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_descartar_chatbot_herdado)
+
+def precarregar():
+    """Prepara o processo principal para o fork dos workers (hook when_ready de gunicorn.conf.py)
+    
+    Carrega o que é só leitura e igual em todos os workers, para que essas páginas de
+    memória sejam compartilhadas (copy-on-write) em vez de repetidas em cada processo:
+    o lxml, o classificador de intenções, as respostas prontas e o índice da
+    legislação, já mapeado e no cache de páginas, e a SECRET_KEY. Com PRELOAD_EMBEDDINGS_MODEL=1, também
+    o modelo de embeddings. O AdvogadoBot não é criado aqui.
+    """
+    inicio = time.perf_counter()
+    import lxml.etree  # noqa: F401 (parser dos resultados do DuckDuckGo)
+    # Gera secret_key.txt uma só vez, antes do fork, em vez de cada worker disputar o arquivo
+    app.secret_key
+    
+    recursos = recursos_compartilhados()
+    legislacao = recursos['legislacao']
+    legislacao.abrir(aquecer=True)
+    if os.environ.get('PRELOAD_EMBEDDINGS_MODEL', '0') == '1':
+        # Os tokenizadores do Hugging Face não aceitam threads criadas antes do fork
+        os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+        if legislacao.habilitado:
+            legislacao.carregar()
+        if os.environ.get('SEMANTIC_CACHE_ENABLED', '1') == '1':
+            try:
+                carregar_modelo(os.environ.get('SEMANTIC_CACHE_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2'))
+            except Exception as e:
+                print(f"⚠️ Modelo do cache semântico não pré-carregado: {e}")
+    
+    # Os objetos criados até aqui saem do coletor de lixo cíclico: sem isso, a primeira
+    # coleta em cada worker escreveria no cabeçalho de todos eles e desfaria o compartilhamento
+    gc.collect()
+    gc.freeze()
+    print(f"Recursos compartilhados carregados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+chatbot = LocalProxy(obter_chatbot)
 
 @app.route('/')
 def home():
@@ -581,27 +1552,146 @@ def home():
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get('question', ''), str):
+        return jsonify({'answer': 'Requisição inválida.', 'used_api': False}), 400
     question = data.get('question', '')
     
     if not question:
         return jsonify({'answer': 'Por favor, faça uma pergunta.', 'used_api': False})
     
-    # Processar a resposta
-    answer, used_api = chatbot.obter_resposta(question)
+    # Com "timings": true no corpo (ou ?timings=1), a resposta traz a duração de cada etapa
+    incluir_tempos = bool(data.get('timings')) or request.args.get('timings') == '1'
+    tempos, token = chatbot.instrumentacao.coletar_tempos() if incluir_tempos else (None, None)
+    inicio = time.perf_counter()
+    try:
+        # Processar a resposta
+        answer, used_api = chatbot.obter_resposta(question)
+    finally:
+        chatbot.instrumentacao.registrar_duracao('requisicao', time.perf_counter() - inicio)
+        if token is not None:
+            chatbot.instrumentacao.encerrar_coleta(token)
     
     # Verificar se a resposta menciona informações da web
     buscou_web = "INFORMAÇÕES ATUAIS DA WEB" in answer or "Fonte:" in answer
     
-    return jsonify({
+    resposta = {
         'answer': answer,
         'used_api': used_api,
         'web_search': buscou_web
+    }
+    if incluir_tempos:
+        resposta['timings_ms'] = tempos
+    return jsonify(resposta)
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Versão da rota /api/chat que envia a resposta em partes (Server-Sent Events)"""
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get('question', ''), str):
+        return jsonify({'answer': 'Requisição inválida.', 'used_api': False}), 400
+    question = data.get('question', '')
+    
+    def evento(dados):
+        return f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+    
+    if not question:
+        resposta_vazia = evento({'type': 'done', 'answer': 'Por favor, faça uma pergunta.', 'used_api': False, 'web_search': False})
+        return Response(resposta_vazia, mimetype='text/event-stream')
+    
+    # Cache, histórico, sessão e busca na web são resolvidos antes de iniciar a transmissão
+    inicio_requisicao = time.perf_counter()
+    resposta_pronta, contexto = chatbot.preparar_consulta(question)
+    
+    def gerar():
+        inicio = time.perf_counter()
+        if resposta_pronta is not None:
+            yield evento({'type': 'chunk', 'text': resposta_pronta})
+            answer, used_api = resposta_pronta, True
+        else:
+            answer, used_api = None, False
+            for tipo, dados in chatbot.obter_resposta_stream(contexto):
+                if tipo == 'parcial':
+                    yield evento({'type': 'chunk', 'text': dados})
+                else:
+                    used_api, answer = dados
+        
+        chatbot.instrumentacao.registrar_duracao('requisicao_stream', time.perf_counter() - inicio_requisicao)
+        buscou_web = "INFORMAÇÕES ATUAIS DA WEB" in answer or "Fonte:" in answer
+        yield evento({
+            'type': 'done',
+            'answer': answer,
+            'used_api': used_api,
+            'web_search': buscou_web,
+            'elapsed_ms': round((time.perf_counter() - inicio) * 1000, 1)
+        })
+    
+    return Response(gerar(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(chatbot.instrumentacao.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'exato': chatbot.cache_consultas.estatisticas(),
+        'persistente': chatbot.cache_persistente.estatisticas() if chatbot.cache_persistente else None,
+        'semantico': chatbot.cache_semantico.estatisticas(),
+        'busca_web': chatbot.cache_buscas.estatisticas(),
+        'respostas_prontas': chatbot.respostas_prontas.estatisticas()
+    })
+
+@app.route('/api/tokens/stats', methods=['GET'])
+def tokens_stats():
+    with chatbot.lock_tokens:
+        totais = dict(chatbot.estatisticas_tokens)
+    requisicoes = totais['requisicoes'] or 1
+    return jsonify({
+        'orcamento': chatbot.orcamento_tokens.orcamento,
+        'totais': totais,
+        'media_por_requisicao': {
+            parte: round(totais[parte] / requisicoes, 1)
+            for parte in ('sistema', 'sistema_em_cache', 'legislacao', 'web', 'historico', 'pergunta', 'total')
+        },
+        'contexto_cache': chatbot.contexto_gemini.estatisticas() if chatbot.contexto_gemini else None
+    })
+
+@app.route('/api/legislation/stats', methods=['GET'])
+def legislation_stats():
+    return jsonify(chatbot.legislacao.estatisticas())
+
+@app.route('/api/gemini/stats', methods=['GET'])
+def gemini_stats():
+    return jsonify(chatbot.controle_gemini.estatisticas())
+
+@app.route('/api/http/stats', methods=['GET'])
+def http_stats():
+    return jsonify(chatbot.http.estatisticas())
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    return jsonify(chatbot.banco.estatisticas())
+
+@app.route('/api/coalescing/stats', methods=['GET'])
+def coalescing_stats():
+    return jsonify({
+        'habilitada': chatbot.coalescer_requisicoes,
+        'busca_web': chatbot.voo_busca_web.estatisticas(),
+        'gemini': chatbot.voo_gemini.estatisticas()
     })
 
-# Endpoint para suporte futuro ao WhatsApp Business API
+@app.route('/api/session/stats', methods=['GET'])
+def session_stats():
+    interface = app.session_interface
+    return jsonify({
+        'backend': os.environ.get('SESSION_BACKEND', 'cookie'),
+        **(interface.estatisticas() if hasattr(interface, 'estatisticas') else {})
+    })
+
+# Webhook do WhatsApp Business API (Cloud API)
 @app.route('/api/whatsapp/webhook', methods=['GET', 'POST'])
 def whatsapp_webhook():
-    # Esta é apenas a estrutura básica para implementação futura
     if request.method == 'GET':
         # Verificação do webhook pelo WhatsApp
         mode = request.args.get('hub.mode')
@@ -615,9 +1705,19 @@ def whatsapp_webhook():
         return jsonify({'status': 'error', 'message': 'Verificação de webhook falhou'}), 403
     
     elif request.method == 'POST':
-        # Aqui seria implementada a lógica para processar mensagens do WhatsApp
-        # Implementação futura
-        return jsonify({'status': 'success'}), 200
+        # Com o App Secret configurado, só aceitar notificações assinadas pela Meta
+        app_secret = os.environ.get('WHATSAPP_APP_SECRET')
+        if app_secret and not assinatura_valida(request.get_data(), request.headers.get('X-Hub-Signature-256'), app_secret):
+            return jsonify({'status': 'error', 'message': 'Assinatura inválida'}), 403
+        
+        # Só enfileirar e confirmar na hora: a resposta é gerada e enviada pelos workers da fila.
+        # Se a gravação falhar, o erro 500 faz a Meta reenviar a notificação mais tarde
+        novas, repetidas = chatbot.processador_whatsapp.receber(request.get_json(silent=True) or {})
+        return jsonify({'status': 'success', 'enfileiradas': novas, 'repetidas': repetidas}), 200
+
+@app.route('/api/whatsapp/stats', methods=['GET'])
+def whatsapp_stats():
+    return jsonify(chatbot.processador_whatsapp.estatisticas())
 
 if __name__ == '__main__':
     # Obter o endereço IP da máquina para exibir na mensagem
@@ -629,5 +1729,10 @@ if __name__ == '__main__':
     print(f"Acesse pelo computador: http://127.0.0.1:5000/")
     print(f"Acesse pelo celular na mesma rede: http://{local_ip}:5000/")
     
+    # Com o recarregador do modo debug, só o processo que atende as requisições cria o bot
+    # (o WhatsApp começa a ser processado sem esperar a primeira requisição)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        obter_chatbot()
+    
     # Permitir conexões externas usando o IP 0.0.0.0 e exibindo o endereço IP da máquina
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,211 @@
+"""Arquivamento e retenção do histórico de conversas.
+
+Move as mensagens mais antigas que N dias da tabela historico_conversas para
+arquivos JSONL compactados com gzip, um por mês (arquivo_conversas/AAAA-MM.jsonl.gz),
+apaga-as do banco em lotes e libera o espaço com VACUUM incremental. Os arquivos são
+só de acréscimo: cada execução adiciona um novo membro gzip ao fim do arquivo do mês.
+
+O VACUUM incremental precisa ser ativado uma vez com um VACUUM completo (--vacuum),
+que reconstrói o banco com bloqueio exclusivo durante toda a operação: rode-o com o
+app parado. Sem ele, o arquivamento funciona com o app no ar, e as páginas liberadas
+são reaproveitadas pelas novas mensagens em vez de devolvidas ao sistema.
+
+Uso:
+    python arquivamento.py arquivar --dias 180 [--vacuum]
+    python arquivamento.py exportar web_1234... [--saida historico.jsonl]
+    python arquivamento.py estatisticas
+
+Cada lote é gravado e sincronizado no disco antes de ser apagado do banco. Se a
+execução for interrompida entre as duas etapas, as mensagens daquele lote podem
+aparecer duas vezes no arquivo; a exportação descarta as repetidas (mesmo id, data,
+remetente e texto).
+"""
+import argparse
+import datetime
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_BANCO = os.environ.get('CHATBOT_DB_PATH', os.path.join(PASTA_APP, 'chatbot_data.db'))
+PASTA_ARQUIVO = os.environ.get('HISTORY_ARCHIVE_DIR', os.path.join(PASTA_APP, 'arquivo_conversas'))
+
+COLUNAS = ('id', 'id_usuario', 'timestamp', 'remetente', 'mensagem', 'plataforma')
+
+
+def conectar(caminho):
+    conn = sqlite3.connect(caminho, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def preparar_vacuum_incremental(conn):
+    """Ativa auto_vacuum=INCREMENTAL; em um banco existente isso exige um VACUUM completo (uma única vez)
+
+    O VACUUM completo bloqueia o banco até terminar: só deve rodar com o app parado.
+    """
+    modo = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if modo == 2:
+        return
+    print("🧹 Ativando VACUUM incremental (VACUUM completo, feito só uma vez)...")
+    inicio = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('VACUUM')
+    print(f"🧹 VACUUM completo em {time.perf_counter() - inicio:.1f}s")
+
+
+def _caminho_mes(pasta, timestamp):
+    return os.path.join(pasta, f"{str(timestamp)[:7]}.jsonl.gz")
+
+
+def _gravar_lote(pasta, linhas):
+    """Acrescenta as mensagens aos arquivos dos respectivos meses e sincroniza no disco"""
+    por_mes = {}
+    for linha in linhas:
+        por_mes.setdefault(_caminho_mes(pasta, linha[2]), []).append(linha)
+
+    for caminho, mensagens in por_mes.items():
+        conteudo = ''.join(json.dumps(dict(zip(COLUNAS, mensagem)), ensure_ascii=False) + '\n' for mensagem in mensagens)
+        with open(caminho, 'ab') as arquivo:
+            # Cada lote vira um membro gzip independente; gzip.open lê todos em sequência
+            arquivo.write(gzip.compress(conteudo.encode('utf-8')))
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+
+
+def arquivar(caminho_banco, pasta, dias, tamanho_lote=5000, paginas_vacuum=2000, vacuum=False):
+    """Arquiva e apaga do banco as mensagens com mais de `dias` dias
+
+    Com vacuum=True, ativa antes o VACUUM incremental, se preciso (app parado).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    limite = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = conectar(caminho_banco)
+    if vacuum:
+        preparar_vacuum_incremental(conn)
+    elif conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        print("ℹ️ VACUUM incremental desativado: o espaço liberado será reaproveitado, mas o arquivo não diminui "
+              "(ative uma vez com --vacuum, com o app parado)")
+
+    print(f"📦 Arquivando mensagens anteriores a {limite} (UTC) em {pasta}")
+    inicio = time.perf_counter()
+    ultimo_id = 0
+    total = 0
+    while True:
+        # Percorrer pelo id (chave primária) evita reler a tabela inteira a cada lote
+        linhas = conn.execute(
+            f"SELECT {', '.join(COLUNAS)} FROM historico_conversas WHERE id > ? AND timestamp < ? ORDER BY id LIMIT ?",
+            (ultimo_id, limite, tamanho_lote)
+        ).fetchall()
+        if not linhas:
+            break
+
+        _gravar_lote(pasta, linhas)
+        with conn:
+            conn.executemany("DELETE FROM historico_conversas WHERE id = ?", ((linha[0],) for linha in linhas))
+        # Devolver ao sistema parte das páginas liberadas, sem bloquear o banco por muito tempo.
+        # executescript roda o PRAGMA até o fim; com execute() o sqlite3 libera uma única página
+        conn.executescript(f'PRAGMA incremental_vacuum({int(paginas_vacuum)});')
+
+        ultimo_id = linhas[-1][0]
+        total += len(linhas)
+        if total % (tamanho_lote * 10) < tamanho_lote:
+            print(f"   {total} mensagens arquivadas...")
+
+    conn.executescript('PRAGMA incremental_vacuum;')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    print(f"✅ {total} mensagens arquivadas em {time.perf_counter() - inicio:.1f}s "
+          f"(banco com {os.path.getsize(caminho_banco) / 1024 / 1024:.1f} MB)")
+    return total
+
+
+def exportar_usuario(caminho_banco, pasta, id_usuario):
+    """Retorna todo o histórico do usuário (arquivo + banco), em ordem cronológica"""
+    def chave(mensagem):
+        # O id sozinho não basta: bancos anteriores à migração 3 (AUTOINCREMENT) podem ter
+        # reaproveitado ids de mensagens arquivadas em mensagens novas
+        return mensagem['id'], str(mensagem['timestamp']), mensagem['remetente'], mensagem['mensagem']
+
+    mensagens = {}
+    for caminho in sorted(glob.glob(os.path.join(pasta, '*.jsonl.gz'))):
+        with gzip.open(caminho, 'rt', encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                mensagem = json.loads(linha)
+                if mensagem['id_usuario'] == id_usuario:
+                    mensagens[chave(mensagem)] = mensagem
+
+    conn = conectar(caminho_banco)
+    for linha in conn.execute(
+        f"SELECT {', '.join(COLUNAS)} FROM historico_conversas WHERE id_usuario = ?", (id_usuario,)
+    ):
+        mensagem = dict(zip(COLUNAS, linha))
+        mensagens[chave(mensagem)] = mensagem
+    conn.close()
+
+    return sorted(mensagens.values(), key=lambda m: (str(m['timestamp']), m['id']))
+
+
+def estatisticas(caminho_banco, pasta):
+    conn = conectar(caminho_banco)
+    mensagens, mais_antiga = conn.execute("SELECT COUNT(*), MIN(timestamp) FROM historico_conversas").fetchone()
+    paginas_livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    conn.close()
+
+    arquivos = sorted(glob.glob(os.path.join(pasta, '*.jsonl.gz')))
+    return {
+        'banco': caminho_banco,
+        'tamanho_banco': os.path.getsize(caminho_banco),
+        'mensagens_no_banco': mensagens,
+        'mensagem_mais_antiga': mais_antiga,
+        'paginas_livres': paginas_livres,
+        'vacuum_incremental': auto_vacuum == 2,
+        'arquivos': {os.path.basename(caminho): os.path.getsize(caminho) for caminho in arquivos},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Arquivamento e retenção do histórico de conversas')
+    parser.add_argument('--banco', default=CAMINHO_BANCO, help='arquivo SQLite com o histórico')
+    parser.add_argument('--pasta', default=PASTA_ARQUIVO, help='pasta dos arquivos mensais compactados')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    comando_arquivar = comandos.add_parser('arquivar', help='arquiva e apaga do banco as mensagens antigas')
+    comando_arquivar.add_argument('--dias', type=int, default=int(os.environ.get('HISTORY_RETENTION_DAYS', '180')),
+                                  help='mantém no banco apenas as mensagens dos últimos N dias')
+    comando_arquivar.add_argument('--lote', type=int, default=5000, help='mensagens apagadas por transação')
+    comando_arquivar.add_argument('--vacuum', action='store_true',
+                                  help='ativa o VACUUM incremental com um VACUUM completo, que bloqueia o banco (rode com o app parado)')
+
+    comando_exportar = comandos.add_parser('exportar', help='exporta todo o histórico de um usuário em JSONL')
+    comando_exportar.add_argument('id_usuario')
+    comando_exportar.add_argument('--saida', help='arquivo de saída (padrão: saída padrão)')
+
+    comandos.add_parser('estatisticas', help='tamanho do banco e dos arquivos')
+
+    args = parser.parse_args()
+
+    if args.comando == 'arquivar':
+        arquivar(args.banco, args.pasta, args.dias, args.lote, vacuum=args.vacuum)
+    elif args.comando == 'exportar':
+        mensagens = exportar_usuario(args.banco, args.pasta, args.id_usuario)
+        saida = open(args.saida, 'w', encoding='utf-8') if args.saida else sys.stdout
+        try:
+            for mensagem in mensagens:
+                saida.write(json.dumps(mensagem, ensure_ascii=False) + '\n')
+        finally:
+            if args.saida:
+                saida.close()
+        print(f"✅ {len(mensagens)} mensagens exportadas", file=sys.stderr)
+    else:
+        print(json.dumps(estatisticas(args.banco, args.pasta), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Ponto de entrada ASGI do Advogado Virtual.
+
+Execute com:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+A rota POST /api/chat é atendida de forma assíncrona (HTTP assíncrono para Gemini e
+DuckDuckGo, backoff com asyncio.sleep e gravações no SQLite em threads), de modo que
+um único processo mantém centenas de conversas em andamento sem ocupar uma thread
+por requisição. As demais rotas do Flask continuam funcionando, executadas em um
+pool de threads.
+"""
+import asyncio
+import json
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+from flask import session
+from werkzeug.test import EnvironBuilder
+
+from app import app as app_flask, chatbot
+
+# Rotas Flask (síncronas) executadas em um pool de threads
+app_wsgi = WSGIMiddleware(app_flask, workers=int(os.environ.get('ASGI_WSGI_THREADS', '10')))
+
+CHAT_ASYNC_HABILITADO = os.environ.get('ASYNC_CHAT_ENABLED', '1') == '1'
+
+
+def resolver_usuario(caminho, cabecalhos):
+    """Abre a sessão Flask da requisição e retorna (id_usuario, cabeçalhos Set-Cookie)
+
+    Usa a mesma interface de sessão configurada no app Flask, para que o usuário
+    seja o mesmo nas rotas síncronas e assíncronas.
+    """
+    ambiente = EnvironBuilder(path=caminho, method='POST', headers=cabecalhos).get_environ()
+    with app_flask.request_context(ambiente):
+        id_usuario = chatbot.obter_ou_criar_id_usuario()
+        resposta = app_flask.response_class()
+        app_flask.session_interface.save_session(app_flask, session._get_current_object(), resposta)
+        return id_usuario, resposta.headers.getlist('Set-Cookie')
+
+
+def ler_usuario_existente(caminho, cabecalhos):
+    """ID do usuário de uma sessão já existente, sem criar usuário nem gravar a sessão"""
+    ambiente = EnvironBuilder(path=caminho, method='POST', headers=cabecalhos).get_environ()
+    with app_flask.request_context(ambiente):
+        return chatbot.obter_id_usuario_existente()
+
+
+async def responder_pronta(scope, send, question, resposta):
+    """Resposta da tabela de respostas prontas: nenhuma sessão criada ou gravada e nenhum acesso síncrono ao SQLite"""
+    cabecalhos = [(nome.decode('latin-1'), valor.decode('latin-1')) for nome, valor in scope['headers']]
+    id_usuario = None
+    if any(nome.lower() == 'cookie' for nome, _ in cabecalhos):
+        id_usuario = await asyncio.to_thread(ler_usuario_existente, scope['path'], cabecalhos)
+    chatbot.registrar_resposta_pronta(id_usuario, question, resposta)
+    await enviar_json(send, 200, {'answer': resposta, 'used_api': True, 'web_search': False})
+
+
+async def ler_corpo(receive):
+    corpo = b''
+    while True:
+        mensagem = await receive()
+        corpo += mensagem.get('body', b'')
+        if not mensagem.get('more_body'):
+            return corpo
+
+
+async def enviar_json(send, status, dados, cookies=()):
+    corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+    cabecalhos = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(corpo)).encode()),
+    ]
+    cabecalhos += [(b'set-cookie', cookie.encode('latin-1')) for cookie in cookies]
+    await send({'type': 'http.response.start', 'status': status, 'headers': cabecalhos})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+async def chat_async(scope, receive, send):
+    """Equivalente assíncrono da rota /api/chat do app Flask"""
+    try:
+        data = json.loads(await ler_corpo(receive) or b'{}')
+    except ValueError:
+        data = None
+    # JSON válido mas que não é um objeto ([], "texto") também é uma requisição inválida
+    if not isinstance(data, dict) or not isinstance(data.get('question', ''), str):
+        await enviar_json(send, 400, {'answer': 'Requisição inválida.', 'used_api': False})
+        return
+
+    question = data.get('question', '')
+    if not question:
+        await enviar_json(send, 200, {'answer': 'Por favor, faça uma pergunta.', 'used_api': False})
+        return
+
+    # Respostas prontas antes de resolver a sessão (a classificação é só memória; nas demais
+    # perguntas ela se repete em preparar_consulta_async, ao custo de alguns microssegundos)
+    resposta_pronta = chatbot.classificar_pergunta(question)['resposta_pronta']
+    if resposta_pronta:
+        await responder_pronta(scope, send, question, resposta_pronta)
+        return
+
+    incluir_tempos = bool(data.get('timings')) or b'timings=1' in scope.get('query_string', b'')
+    # Cada requisição roda em sua própria tarefa: a coleta não precisa ser encerrada
+    tempos = chatbot.instrumentacao.coletar_tempos()[0] if incluir_tempos else None
+    inicio = time.perf_counter()
+    try:
+        cabecalhos = [(nome.decode('latin-1'), valor.decode('latin-1')) for nome, valor in scope['headers']]
+        id_usuario, cookies = await asyncio.to_thread(resolver_usuario, scope['path'], cabecalhos)
+
+        answer, used_api = await chatbot.obter_resposta_async(question, id_usuario)
+    except Exception as e:
+        print(f"Erro ao processar mensagem assíncrona: {e}")
+        await enviar_json(send, 500, {
+            'answer': 'Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.',
+            'used_api': False
+        })
+        return
+    finally:
+        chatbot.instrumentacao.registrar_duracao('requisicao', time.perf_counter() - inicio)
+
+    # Verificar se a resposta menciona informações da web
+    buscou_web = "INFORMAÇÕES ATUAIS DA WEB" in answer or "Fonte:" in answer
+
+    resposta = {
+        'answer': answer,
+        'used_api': used_api,
+        'web_search': buscou_web
+    }
+    if incluir_tempos:
+        resposta['timings_ms'] = tempos
+    await enviar_json(send, 200, resposta, cookies)
+
+
+async def ciclo_de_vida(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            if chatbot.http_async is not None:
+                await chatbot.http_async.fechar()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await ciclo_de_vida(receive, send)
+        return
+
+    if (CHAT_ASYNC_HABILITADO and scope['type'] == 'http'
+            and scope['path'] == '/api/chat' and scope['method'] == 'POST'):
+        await chat_async(scope, receive, send)
+        return
+
+    await app_wsgi(scope, receive, send)
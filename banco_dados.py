@@ -0,0 +1,413 @@
+import atexit
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class BancoConversas:
+    """Acesso ao banco SQLite de usuários e histórico de conversas, seguro entre threads.
+
+    Cada thread usa a sua própria conexão (modo WAL, para que leituras não esperem pelas
+    gravações). As gravações vão para uma fila e são feitas por uma única thread em
+    segundo plano, que agrupa as mensagens e as atualizações de data_ultimo_contato de
+    vários usuários em uma só transação. As mensagens ainda na fila já aparecem em
+    obter_historico, para que a conversa continue coerente antes da gravação.
+
+    Um lote que falha volta para a fila. Depois de `tentativas_lote` falhas seguidas, os
+    itens são gravados um a um, e os que o SQLite recusa (restrição violada, valor
+    inválido) são descartados com um aviso, para não travarem as gravações seguintes.
+    A fila tem no máximo `max_pendentes` itens: com o banco inacessível por muito
+    tempo, os mais antigos são descartados.
+
+    As últimas mensagens dos usuários ativos ficam em uma janela em memória (um deque
+    de tamanho fixo por usuário, com descarte LRU dos usuários inativos), de modo que
+    durante uma conversa a leitura do histórico não passa pelo SQLite. A janela só vale
+    para este processo: com vários workers sem roteamento fixo por usuário, a conversa
+    atendida por workers diferentes não incluiria as mensagens gravadas pelos outros,
+    então deve ficar desligada (usuarios_em_memoria=0; o gunicorn.conf.py faz isso
+    quando há mais de um worker).
+
+    O esquema é versionado na tabela versoes_esquema: ao abrir o banco, as migrações
+    de MIGRACOES ainda não aplicadas são executadas em ordem.
+    """
+
+    # Migrações do esquema, em ordem: (versão, descrição, comandos SQL)
+    MIGRACOES = [
+        (1, 'tabelas de histórico e usuários', [
+            '''
+            CREATE TABLE IF NOT EXISTS historico_conversas (
+                id INTEGER PRIMARY KEY,
+                id_usuario TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                remetente TEXT NOT NULL,
+                mensagem TEXT NOT NULL,
+                plataforma TEXT DEFAULT 'web'
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id_usuario TEXT PRIMARY KEY,
+                nome TEXT,
+                telefone TEXT,
+                email TEXT,
+                data_primeiro_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                data_ultimo_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ]),
+        (2, 'índice do histórico por usuário e data', [
+            # O rowid (id) entra implicitamente no fim do índice e desempata ORDER BY timestamp DESC, id DESC
+            'CREATE INDEX IF NOT EXISTS idx_historico_usuario_timestamp ON historico_conversas (id_usuario, timestamp)',
+            'ANALYZE historico_conversas',
+        ]),
+        (3, 'AUTOINCREMENT nos ids do histórico', [
+            # Sem AUTOINCREMENT, o SQLite reaproveita os maiores ids depois que o arquivamento
+            # (arquivamento.py) os apaga, e o arquivo passaria a ter ids repetidos
+            '''
+            CREATE TABLE historico_conversas_nova (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_usuario TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                remetente TEXT NOT NULL,
+                mensagem TEXT NOT NULL,
+                plataforma TEXT DEFAULT 'web'
+            )
+            ''',
+            'INSERT INTO historico_conversas_nova (id, id_usuario, timestamp, remetente, mensagem, plataforma) '
+            'SELECT id, id_usuario, timestamp, remetente, mensagem, plataforma FROM historico_conversas',
+            'DROP TABLE historico_conversas',
+            'ALTER TABLE historico_conversas_nova RENAME TO historico_conversas',
+            'CREATE INDEX IF NOT EXISTS idx_historico_usuario_timestamp ON historico_conversas (id_usuario, timestamp)',
+            'ANALYZE historico_conversas',
+        ]),
+    ]
+
+    def __init__(self, caminho, intervalo_gravacao=0.2, tamanho_lote=500, busy_timeout_ms=5000,
+                 usuarios_em_memoria=10000, mensagens_em_memoria=10, tentativas_lote=3, max_pendentes=100000):
+        self.caminho = caminho
+        self.intervalo_gravacao = intervalo_gravacao
+        self.tamanho_lote = tamanho_lote
+        self.busy_timeout_ms = busy_timeout_ms
+        self.tentativas_lote = tentativas_lote
+        self.max_pendentes = max_pendentes
+
+        self._local = threading.local()
+        # Fila de gravações: ('usuario', (id_usuario, telefone)) ou ('mensagem', (id_usuario, remetente, mensagem, plataforma, timestamp))
+        self._pendentes = []
+        # Itens do início da fila que fazem parte do lote sendo gravado (não podem ser descartados)
+        self._em_gravacao = 0
+        self._condicao = threading.Condition()
+        # Ímpar enquanto um lote está sendo gravado; permite a leitura consistente de banco + fila
+        self._versao_gravacao = 0
+        self._encerrar = threading.Event()
+
+        # Janela em memória: id_usuario -> deque das últimas mensagens (remetente, mensagem), em ordem LRU.
+        # Protegida pela mesma condição da fila, para ficar coerente com as gravações pendentes
+        self.usuarios_em_memoria = usuarios_em_memoria
+        self.mensagens_em_memoria = mensagens_em_memoria
+        self._janelas = OrderedDict()
+        self.acertos_janela = 0
+        self.falhas_janela = 0
+
+        self.mensagens_gravadas = 0
+        self.transacoes = 0
+        self.erros_gravacao = 0
+        self.falhas_seguidas = 0
+        self.gravacoes_descartadas = 0
+        # Tempo dentro das transações de gravação (inclui a espera pelo lock de escrita do SQLite)
+        self.tempo_gravacao = 0.0
+        self.maior_gravacao = 0.0
+
+        self.versao_esquema = self._migrar(self._conexao())
+
+        self._thread = threading.Thread(target=self._gravar_em_segundo_plano, name='banco-conversas', daemon=True)
+        self._thread.start()
+        atexit.register(self.encerrar)
+
+    def _migrar(self, conn):
+        """Aplica as migrações pendentes e retorna a versão final do esquema
+
+        Cada migração roda em uma transação com bloqueio de escrita (BEGIN IMMEDIATE),
+        então vários processos iniciando ao mesmo tempo aplicam cada uma só uma vez.
+        """
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS versoes_esquema (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        conn.commit()
+
+        nivel_isolamento = conn.isolation_level
+        conn.isolation_level = None
+        try:
+            for versao, descricao, comandos in self.MIGRACOES:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    aplicada = conn.execute("SELECT 1 FROM versoes_esquema WHERE versao = ?", (versao,)).fetchone()
+                    if not aplicada:
+                        inicio = time.perf_counter()
+                        for comando in comandos:
+                            conn.execute(comando)
+                        conn.execute("INSERT INTO versoes_esquema (versao, descricao) VALUES (?, ?)", (versao, descricao))
+                        print(f"🗄️ Migração {versao} aplicada ({descricao}) em {time.perf_counter() - inicio:.2f}s")
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            conn.isolation_level = nivel_isolamento
+
+        return conn.execute("SELECT MAX(versao) FROM versoes_esquema").fetchone()[0]
+
+    def _conexao(self):
+        """Retorna a conexão SQLite da thread atual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=self.busy_timeout_ms / 1000)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _agora():
+        # Mesmo formato de CURRENT_TIMESTAMP (UTC), registrado no momento em que a mensagem chega
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+    def _enfileirar(self, itens):
+        # Chamado com self._condicao adquirida
+        self._pendentes.extend(itens)
+        excesso = len(self._pendentes) - self.max_pendentes
+        if self.max_pendentes and excesso > 0:
+            # Banco inacessível há muito tempo: descartar os itens mais antigos fora do lote em gravação
+            if not self.gravacoes_descartadas:
+                print(f"⚠️ Fila de gravação do histórico cheia ({self.max_pendentes} itens): descartando as mais antigas")
+            del self._pendentes[self._em_gravacao:self._em_gravacao + excesso]
+            self.gravacoes_descartadas += excesso
+        if len(self._pendentes) >= self.tamanho_lote:
+            self._condicao.notify()
+
+    def _guardar_janela(self, id_usuario, mensagens):
+        # Chamado com self._condicao adquirida
+        if not self.usuarios_em_memoria:
+            return
+        self._janelas[id_usuario] = deque(
+            ((sys.intern(remetente), mensagem) for remetente, mensagem in mensagens), maxlen=self.mensagens_em_memoria
+        )
+        self._janelas.move_to_end(id_usuario)
+        while len(self._janelas) > self.usuarios_em_memoria:
+            self._janelas.popitem(last=False)
+
+    def registrar_usuario(self, id_usuario, telefone=None, novo=True):
+        """Agenda o cadastro de um usuário (ignorado se ele já existir)
+
+        Com novo=False (usuário que pode já ter histórico, como um número do WhatsApp),
+        a janela em memória não é tocada.
+        """
+        with self._condicao:
+            self._enfileirar([('usuario', (id_usuario, telefone))])
+            if novo:
+                # Usuário novo não tem histórico: a janela vazia já está completa
+                self._guardar_janela(id_usuario, [])
+
+    def salvar_mensagens(self, id_usuario, mensagens, plataforma='web'):
+        """Agenda a gravação de uma lista de (remetente, mensagem) do mesmo usuário"""
+        agora = self._agora()
+        with self._condicao:
+            self._enfileirar([
+                ('mensagem', (id_usuario, remetente, mensagem, plataforma, agora))
+                for remetente, mensagem in mensagens
+            ])
+            janela = self._janelas.get(id_usuario)
+            if janela is not None:
+                janela.extend((sys.intern(remetente), mensagem) for remetente, mensagem in mensagens)
+                self._janelas.move_to_end(id_usuario)
+
+    def descartar_janela(self, id_usuario=None):
+        """Remove da memória a janela de um usuário (ou de todos), forçando a próxima leitura no SQLite"""
+        with self._condicao:
+            if id_usuario is None:
+                self._janelas.clear()
+            else:
+                self._janelas.pop(id_usuario, None)
+
+    def obter_historico(self, id_usuario, limite=10):
+        """Retorna as últimas `limite` mensagens do usuário como (remetente, mensagem), em ordem cronológica"""
+        if limite <= self.mensagens_em_memoria:
+            with self._condicao:
+                janela = self._janelas.get(id_usuario)
+                if janela is not None:
+                    self._janelas.move_to_end(id_usuario)
+                    self.acertos_janela += 1
+                    return list(janela)[-limite:] if limite else []
+
+        self.falhas_janela += 1
+        while True:
+            versao = self._versao_gravacao
+            if versao % 2:
+                # Um lote está sendo gravado; aguardar para não ler a mesma mensagem duas vezes
+                time.sleep(0.001)
+                continue
+
+            linhas = self._conexao().execute(
+                "SELECT remetente, mensagem FROM historico_conversas WHERE id_usuario = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (id_usuario, limite)
+            ).fetchall()
+            with self._condicao:
+                pendentes = [
+                    (dados[1], dados[2]) for tipo, dados in self._pendentes
+                    if tipo == 'mensagem' and dados[0] == id_usuario
+                ]
+                if versao == self._versao_gravacao:
+                    historico = list(reversed(linhas)) + pendentes
+                    # Carregar a janela ainda com a condição adquirida, antes de qualquer nova mensagem
+                    if limite >= self.mensagens_em_memoria:
+                        self._guardar_janela(id_usuario, historico)
+                    break
+
+        return historico[-limite:] if limite else []
+
+    def _gravar_lote(self, lote):
+        usuarios = []
+        mensagens = []
+        for tipo, dados in lote:
+            if tipo == 'usuario':
+                usuarios.append(dados)
+            else:
+                mensagens.append(dados)
+        # Uma atualização de data_ultimo_contato por usuário no lote
+        contatos = {}
+        for id_usuario, _, _, _, timestamp in mensagens:
+            contatos[id_usuario] = timestamp
+
+        conn = self._conexao()
+        inicio = time.perf_counter()
+        with conn:
+            if usuarios:
+                conn.executemany("INSERT OR IGNORE INTO usuarios (id_usuario, telefone) VALUES (?, ?)", usuarios)
+            if mensagens:
+                conn.executemany(
+                    "INSERT INTO historico_conversas (id_usuario, remetente, mensagem, plataforma, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    mensagens
+                )
+            if contatos:
+                conn.executemany(
+                    "UPDATE usuarios SET data_ultimo_contato = ? WHERE id_usuario = ?",
+                    [(timestamp, id_usuario) for id_usuario, timestamp in contatos.items()]
+                )
+        duracao = time.perf_counter() - inicio
+        self.mensagens_gravadas += len(mensagens)
+        self.transacoes += 1
+        self.tempo_gravacao += duracao
+        self.maior_gravacao = max(self.maior_gravacao, duracao)
+
+    def _gravar_item_a_item(self, lote):
+        """Grava os itens do lote um a um, descartando os recusados; retorna quantos saem da fila
+
+        Um erro operacional (banco bloqueado, disco) não é culpa do item: interrompe a
+        passagem, e o item e os seguintes continuam na fila.
+        """
+        for indice, item in enumerate(lote):
+            try:
+                self._gravar_lote([item])
+            except sqlite3.OperationalError:
+                if not indice:
+                    raise
+                return indice
+            except sqlite3.Error as e:
+                self.gravacoes_descartadas += 1
+                print(f"⚠️ Gravação do histórico descartada ({item[0]} de {item[1][0]}): {e}")
+        return len(lote)
+
+    def _gravar_pendentes(self):
+        """Grava um lote da fila; os itens só saem da fila depois do commit. Retorna None em caso de erro"""
+        with self._condicao:
+            lote = self._pendentes[:self.tamanho_lote]
+            self._em_gravacao = len(lote)
+        if not lote:
+            return 0
+
+        self._versao_gravacao += 1
+        try:
+            if self.falhas_seguidas >= self.tentativas_lote:
+                # O lote falhou várias vezes seguidas: isolar os itens que o SQLite recusa
+                gravados = self._gravar_item_a_item(lote)
+            else:
+                self._gravar_lote(lote)
+                gravados = len(lote)
+        except sqlite3.Error as e:
+            # Os itens continuam na fila e serão gravados na próxima tentativa
+            self.erros_gravacao += 1
+            self.falhas_seguidas += 1
+            print(f"Erro ao gravar histórico de conversas: {e}")
+            return None
+        else:
+            if gravados == len(lote):
+                self.falhas_seguidas = 0
+            with self._condicao:
+                del self._pendentes[:gravados]
+                self._condicao.notify_all()
+        finally:
+            with self._condicao:
+                self._em_gravacao = 0
+            self._versao_gravacao += 1
+        return gravados
+
+    def _gravar_em_segundo_plano(self):
+        while not self._encerrar.is_set():
+            with self._condicao:
+                if len(self._pendentes) < self.tamanho_lote:
+                    self._condicao.wait(self.intervalo_gravacao)
+            if self._gravar_pendentes() is None:
+                # Evitar repetir imediatamente uma gravação que acabou de falhar
+                self._encerrar.wait(self.intervalo_gravacao)
+
+    def descarregar(self, timeout=None):
+        """Aguarda até que a fila de gravações esteja vazia"""
+        limite = None if timeout is None else time.time() + timeout
+        with self._condicao:
+            while self._pendentes:
+                self._condicao.notify_all()
+                restante = None if limite is None else limite - time.time()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicao.wait(restante if restante is not None else 0.1)
+        return True
+
+    def encerrar(self):
+        """Grava o que estiver pendente e para a thread de gravação"""
+        if self._encerrar.is_set():
+            return
+        self._encerrar.set()
+        with self._condicao:
+            self._condicao.notify_all()
+        self._thread.join(timeout=5)
+        while self._pendentes and self._gravar_pendentes():
+            pass
+
+    def estatisticas(self):
+        return {
+            'caminho': self.caminho,
+            'versao_esquema': self.versao_esquema,
+            'pendentes': len(self._pendentes),
+            'mensagens_gravadas': self.mensagens_gravadas,
+            'transacoes': self.transacoes,
+            'erros_gravacao': self.erros_gravacao,
+            'gravacoes_descartadas': self.gravacoes_descartadas,
+            'max_pendentes': self.max_pendentes,
+            'tempo_medio_transacao_ms': round(self.tempo_gravacao / self.transacoes * 1000, 2) if self.transacoes else 0.0,
+            'maior_transacao_ms': round(self.maior_gravacao * 1000, 2),
+            'janela': {
+                'usuarios': len(self._janelas),
+                'max_usuarios': self.usuarios_em_memoria,
+                'mensagens_por_usuario': self.mensagens_em_memoria,
+                'acertos': self.acertos_janela,
+                'falhas': self.falhas_janela,
+            },
+        }
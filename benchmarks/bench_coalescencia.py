@@ -0,0 +1,132 @@
+"""Chamadas externas feitas quando muitos usuários enviam a mesma pergunta ao mesmo tempo.
+
+Sobe os servidores falsos do Gemini e do DuckDuckGo (que devolve a página salva em
+benchmarks/fixtures/duckduckgo_stf.html após uma latência fixa) e dispara a mesma
+pergunta sobre o STF de vários clientes simultâneos, com e sem a coalescência
+(REQUEST_COALESCING). Em cada rodada a pergunta é nova, para que nenhuma resposta já
+esteja em cache. Mede as buscas no DuckDuckGo, as chamadas ao Gemini e a latência
+pelas rotas /api/chat (threads), /api/chat/stream (threads) e pelo modo assíncrono.
+
+Uso:
+    python benchmarks/bench_coalescencia.py [--clientes 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+import servidor_duckduckgo_falso  # noqa: E402
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+
+
+def disparar_threads(app, rota, pergunta, clientes):
+    latencias = []
+    barreira = threading.Barrier(clientes)
+
+    def cliente():
+        conexao = app.test_client()
+        barreira.wait()
+        inicio = time.perf_counter()
+        resposta = conexao.post(rota, json={'question': pergunta})
+        resposta.get_data()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    threads = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencias
+
+
+def disparar_async(chatbot, pergunta, clientes):
+    async def cliente(indice):
+        inicio = time.perf_counter()
+        await chatbot.obter_resposta_async(pergunta, f"bench_{indice}")
+        return (time.perf_counter() - inicio) * 1000
+
+    async def todos():
+        try:
+            return await asyncio.gather(*(cliente(i) for i in range(clientes)))
+        finally:
+            await chatbot.http_async.fechar()
+            chatbot.http_async = None
+
+    return asyncio.run(todos())
+
+
+def recusas_gemini(chatbot):
+    """Chamadas ao Gemini recusadas antes de serem feitas (cota ou disjuntor)"""
+    estatisticas = chatbot.controle_gemini.estatisticas()
+    return estatisticas['cota']['recusadas'] + estatisticas['disjuntor']['recusadas']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Coalescência de perguntas idênticas simultâneas')
+    parser.add_argument('--clientes', type=int, default=20)
+    parser.add_argument('--latencia-gemini', type=float, default=0.5)
+    parser.add_argument('--latencia-busca', type=float, default=0.3)
+    args = parser.parse_args()
+
+    gemini, url_gemini = iniciar_em_segundo_plano(latencia_base=args.latencia_gemini, latencia_por_token=0)
+    duckduckgo, url_duckduckgo = servidor_duckduckgo_falso.iniciar_em_segundo_plano(latencia=args.latencia_busca)
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_coalescencia_')
+    os.environ.update({
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        # Sem a cota do plano gratuito: recusas do limitador pareceriam chamadas coalescidas
+        'GEMINI_RPM': '0',
+        'GEMINI_TPM': '0',
+        'DUCKDUCKGO_URL': url_duckduckgo,
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+
+    import contextlib
+    import io
+
+    from app import app, chatbot
+
+    modos = {
+        '/api/chat': lambda pergunta: disparar_threads(app, '/api/chat', pergunta, args.clientes),
+        '/api/chat/stream': lambda pergunta: disparar_threads(app, '/api/chat/stream', pergunta, args.clientes),
+        'assíncrono': lambda pergunta: disparar_async(chatbot, pergunta, args.clientes),
+    }
+
+    print(f"{args.clientes} clientes simultâneos com a mesma pergunta "
+          f"(Gemini {args.latencia_gemini * 1000:.0f} ms, DuckDuckGo {args.latencia_busca * 1000:.0f} ms)\n")
+    print(f"{'rota':<18} {'coalescência':<13} {'buscas':>7} {'Gemini':>7} {'p50 (ms)':>9} {'máx (ms)':>9}")
+    rodada = 0
+    for nome, disparar in modos.items():
+        for coalescer in (False, True):
+            rodada += 1
+            chatbot.coalescer_requisicoes = coalescer
+            pergunta = f"Qual a decisão mais recente do STF sobre o tema {rodada}?"
+            buscas, chamadas = duckduckgo.buscas, gemini.contadores['requisicoes']
+            recusadas = recusas_gemini(chatbot)
+            # Os logs de cada requisição ficam fora da saída do benchmark
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencias = disparar(pergunta)
+            if recusas_gemini(chatbot) != recusadas:
+                sys.exit(f"{nome}: chamadas ao Gemini recusadas pela cota ou pelo disjuntor; a comparação não vale "
+                         f"({chatbot.controle_gemini.estatisticas()})")
+            print(f"{nome:<18} {'sim' if coalescer else 'não':<13} {duckduckgo.buscas - buscas:>7} "
+                  f"{gemini.contadores['requisicoes'] - chamadas:>7} {statistics.median(latencias):>9.0f} "
+                  f"{max(latencias):>9.0f}")
+
+    print(f"\nbusca_web: {chatbot.voo_busca_web.estatisticas()}")
+    print(f"gemini: {chatbot.voo_gemini.estatisticas()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Mede o efeito do contexto em cache do Gemini (GEMINI_CONTEXT_CACHE) sobre os tokens de entrada.
+
+Sobe o servidor falso do Gemini, envia a mesma sequência de perguntas com a persona
+em systemInstruction e depois com a persona em um contexto em cache, e compara os
+tokens de entrada cobrados como novos e a latência por requisição.
+
+Uso:
+    python benchmarks/bench_contexto_cache.py [requisicoes]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+
+PERGUNTAS = [
+    "Quais são os requisitos da usucapião extraordinária?",
+    "Como funciona a guarda compartilhada?",
+    "Qual o prazo para contestação no procedimento comum?",
+    "O que é habeas corpus?",
+]
+
+HISTORICO = [
+    ('usuario', 'Olá, preciso de ajuda com um contrato de aluguel.'),
+    ('bot', 'Claro! Conte-me mais sobre a situação do contrato.'),
+]
+
+
+def medir(bot, servidor, requisicoes):
+    antes = dict(servidor.contadores)
+    latencias = []
+    for i in range(requisicoes):
+        inicio = time.perf_counter()
+        sucesso, _ = bot.consultar_gemini(PERGUNTAS[i % len(PERGUNTAS)], HISTORICO)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if not sucesso:
+            print("ATENÇÃO: requisição sem sucesso")
+    depois = servidor.contadores
+    entrada = depois['tokens_entrada'] - antes['tokens_entrada']
+    em_cache = depois['tokens_em_cache'] - antes['tokens_em_cache']
+    return {
+        'entrada_por_req': entrada / requisicoes,
+        'novos_por_req': (entrada - em_cache) / requisicoes,
+        'p50_ms': statistics.median(latencias),
+    }
+
+
+def main():
+    requisicoes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    servidor, url_base = iniciar_em_segundo_plano(latencia_base=0.02, latencia_por_token=0.0002)
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_contexto_')
+    os.environ.update({
+        'GEMINI_API_BASE': url_base,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'GEMINI_CONTEXT_CACHE': '0',
+    })
+
+    from app import AdvogadoBot
+
+    resultados = {'systemInstruction': medir(AdvogadoBot(), servidor, requisicoes)}
+    os.environ['GEMINI_CONTEXT_CACHE'] = '1'
+    bot_cache = AdvogadoBot()
+    resultados['cachedContent'] = medir(bot_cache, servidor, requisicoes)
+
+    print(f"\n{'modo':<18} {'entrada/req':>12} {'novos/req':>10} {'p50 (ms)':>9}")
+    for modo, r in resultados.items():
+        print(f"{modo:<18} {r['entrada_por_req']:>12.0f} {r['novos_por_req']:>10.0f} {r['p50_ms']:>9.1f}")
+
+    base, cache = resultados['systemInstruction'], resultados['cachedContent']
+    print(f"\nTokens novos por requisição: -{(1 - cache['novos_por_req'] / base['novos_por_req']) * 100:.0f}% "
+          f"| contexto: {bot_cache.contexto_gemini.estatisticas()}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Micro-benchmark dos extratores de resultados do DuckDuckGo.
+
+Compara o parser incremental do lxml com o caminho BeautifulSoup sobre as páginas
+salvas em benchmarks/fixtures e confere que ambos produzem os mesmos resultados.
+
+Uso:
+    python benchmarks/bench_extracao_html.py [repeticoes]
+"""
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extracao_html import extrair_resultados_bs4, extrair_resultados_lxml  # noqa: E402
+
+PASTA_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def medir(funcao, html, repeticoes):
+    tempos = timeit.repeat(lambda: funcao(html), number=1, repeat=repeticoes)
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000, tempos[int(len(tempos) * 0.95) - 1] * 1000
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print(f"{'fixture':<36} {'tamanho':>9} {'parser':<6} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for caminho in sorted(glob.glob(os.path.join(PASTA_FIXTURES, 'duckduckgo_*.html'))):
+        with open(caminho, encoding='utf-8') as arquivo:
+            html = arquivo.read()
+
+        if extrair_resultados_lxml(html) != extrair_resultados_bs4(html):
+            print(f"ATENÇÃO: resultados diferentes entre os parsers em {caminho}")
+
+        nome = os.path.basename(caminho)
+        p50_lxml, p95_lxml = medir(extrair_resultados_lxml, html, repeticoes)
+        p50_bs4, p95_bs4 = medir(extrair_resultados_bs4, html, repeticoes)
+        print(f"{nome:<36} {len(html):>9} {'lxml':<6} {p50_lxml:>9.3f} {p95_lxml:>9.3f}")
+        print(f"{'':<36} {'':>9} {'bs4':<6} {p50_bs4:>9.3f} {p95_bs4:>9.3f}   ({p50_bs4 / p50_lxml:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
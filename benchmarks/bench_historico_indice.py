@@ -0,0 +1,122 @@
+"""Latência da busca de histórico antes e depois da migração com o índice (id_usuario, timestamp).
+
+Cria um banco com o esquema original (sem índice), popula milhões de mensagens de
+muitos usuários, mede a consulta de obter_historico e então abre o banco com
+BancoConversas, que aplica as migrações pendentes, e mede de novo.
+
+Uso:
+    python benchmarks/bench_historico_indice.py [--mensagens 2000000] [--usuarios 20000] [--consultas 200]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_dados import BancoConversas  # noqa: E402
+
+CONSULTA_HISTORICO = (
+    "SELECT remetente, mensagem FROM historico_conversas WHERE id_usuario = ? ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+
+
+def criar_banco_original(caminho, mensagens, usuarios):
+    """Esquema anterior às migrações, como criado pelas versões antigas do app"""
+    conn = sqlite3.connect(caminho)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+    CREATE TABLE historico_conversas (
+        id INTEGER PRIMARY KEY,
+        id_usuario TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        remetente TEXT NOT NULL,
+        mensagem TEXT NOT NULL,
+        plataforma TEXT DEFAULT 'web'
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE usuarios (
+        id_usuario TEXT PRIMARY KEY,
+        nome TEXT,
+        telefone TEXT,
+        email TEXT,
+        data_primeiro_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        data_ultimo_contato TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.executemany("INSERT INTO usuarios (id_usuario) VALUES (?)", ((f"web_{i}",) for i in range(usuarios)))
+
+    inicio_tempo = time.time() - mensagens
+    aleatorio = random.Random(42)
+
+    def linhas():
+        # Mensagens de usuários intercalados, como no tráfego real
+        for i in range(mensagens):
+            yield (
+                f"web_{aleatorio.randrange(usuarios)}",
+                time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(inicio_tempo + i)),
+                'user' if i % 2 == 0 else 'bot',
+                f"Mensagem de teste número {i} sobre direito do consumidor e prazos processuais.",
+            )
+
+    conn.executemany(
+        "INSERT INTO historico_conversas (id_usuario, timestamp, remetente, mensagem) VALUES (?, ?, ?, ?)", linhas()
+    )
+    conn.commit()
+    conn.close()
+
+
+def medir(conn, usuarios, consultas):
+    aleatorio = random.Random(7)
+    tempos = []
+    for _ in range(consultas):
+        id_usuario = f"web_{aleatorio.randrange(usuarios)}"
+        inicio = time.perf_counter()
+        conn.execute(CONSULTA_HISTORICO, (id_usuario, 10)).fetchall()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return statistics.median(tempos), tempos[int(len(tempos) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do índice do histórico de conversas')
+    parser.add_argument('--mensagens', type=int, default=2_000_000)
+    parser.add_argument('--usuarios', type=int, default=20_000)
+    parser.add_argument('--consultas', type=int, default=200)
+    args = parser.parse_args()
+
+    caminho = os.path.join(tempfile.mkdtemp(prefix='bench_historico_'), 'chatbot.db')
+    inicio = time.perf_counter()
+    criar_banco_original(caminho, args.mensagens, args.usuarios)
+    print(f"Banco populado com {args.mensagens} mensagens de {args.usuarios} usuários "
+          f"em {time.perf_counter() - inicio:.1f}s ({os.path.getsize(caminho) / 1024 / 1024:.0f} MB)")
+
+    conn = sqlite3.connect(caminho)
+    plano_antes = conn.execute("EXPLAIN QUERY PLAN " + CONSULTA_HISTORICO, ('web_0', 10)).fetchall()
+    p50_antes, p95_antes = medir(conn, args.usuarios, max(args.consultas // 10, 5))
+    conn.close()
+
+    inicio = time.perf_counter()
+    banco = BancoConversas(caminho)
+    duracao_migracao = time.perf_counter() - inicio
+    banco.encerrar()
+
+    conn = sqlite3.connect(caminho)
+    plano_depois = conn.execute("EXPLAIN QUERY PLAN " + CONSULTA_HISTORICO, ('web_0', 10)).fetchall()
+    p50_depois, p95_depois = medir(conn, args.usuarios, args.consultas)
+    conn.close()
+
+    print(f"Migração para a versão {banco.versao_esquema} em {duracao_migracao:.1f}s\n")
+    print(f"{'':<8} {'p50 (ms)':>10} {'p95 (ms)':>10}  plano")
+    print(f"{'antes':<8} {p50_antes:>10.2f} {p95_antes:>10.2f}  {'; '.join(linha[-1] for linha in plano_antes)}")
+    print(f"{'depois':<8} {p50_depois:>10.3f} {p95_depois:>10.3f}  {'; '.join(linha[-1] for linha in plano_depois)}")
+    print(f"\nBusca de histórico {p50_antes / p50_depois:.0f}x mais rápida (p50)")
+
+
+if __name__ == '__main__':
+    main()
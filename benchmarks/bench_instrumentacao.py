@@ -0,0 +1,108 @@
+"""Custo da instrumentação e do log detalhado em /api/chat.
+
+Sobe os servidores falsos do Gemini e do DuckDuckGo (sem latência, para que o tempo
+gasto no próprio processo apareça) e envia perguntas novas, que passam por todas as
+etapas (busca na web, Gemini, gravação), com o log detalhado desligado e ligado
+(LOG_VERBOSE). A saída vai para /dev/null, como em um servidor cujo log é
+descartado; num terminal ou arquivo real o custo é maior.
+
+Mostra também o custo de uma medição de etapa (instrumentacao.medir), o resumo dos
+histogramas e um exemplo de timings_ms devolvido por /api/chat.
+
+Uso:
+    python benchmarks/bench_instrumentacao.py [--perguntas 200]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+import servidor_duckduckgo_falso  # noqa: E402
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+
+
+def medir_rodada(cliente, rotulo, quantidade):
+    latencias = []
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        for indice in range(quantidade):
+            pergunta = f"Qual a lei atual sobre o prazo {rotulo}-{indice} de garantia em 2024?"
+            inicio = time.perf_counter()
+            resposta = cliente.post('/api/chat', json={'question': pergunta})
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            assert resposta.status_code == 200, resposta.status_code
+    latencias.sort()
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Custo da instrumentação e do log detalhado')
+    parser.add_argument('--perguntas', type=int, default=200, help='perguntas por rodada')
+    args = parser.parse_args()
+
+    _, url_gemini = iniciar_em_segundo_plano(latencia_base=0, latencia_por_token=0)
+    _, url_duckduckgo = servidor_duckduckgo_falso.iniciar_em_segundo_plano(latencia=0)
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_instrumentacao_')
+    os.environ.update({
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'GEMINI_RPM': '0',
+        'DUCKDUCKGO_URL': url_duckduckgo,
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app, chatbot
+    cliente = app.test_client()
+
+    # Aquecimento: conexões, compilação das expressões regulares, esquema do banco
+    chatbot.log_detalhado = False
+    medir_rodada(cliente, 'aquecimento', 10)
+
+    resultados = {}
+    for rotulo, detalhado in (('silencioso', False), ('detalhado', True), ('silencioso-2', False)):
+        chatbot.log_detalhado = detalhado
+        resultados[rotulo] = medir_rodada(cliente, rotulo, args.perguntas)
+    chatbot.log_detalhado = False
+
+    print(f"{args.perguntas} perguntas novas por rodada (busca na web + Gemini), servidores falsos sem latência\n")
+    for rotulo, latencias in resultados.items():
+        print(f"  {rotulo:<13} p50 {statistics.median(latencias):6.2f} ms | "
+              f"p95 {latencias[int(len(latencias) * 0.95) - 1]:6.2f} ms | média {statistics.fmean(latencias):6.2f} ms")
+
+    instrumentacao = chatbot.instrumentacao
+    repeticoes = 200_000
+
+    def uma_medicao():
+        with instrumentacao.medir('bench'):
+            pass
+
+    custo = min(timeit.repeat(uma_medicao, number=repeticoes, repeat=3)) / repeticoes * 1e6
+    print(f"\nCusto de uma medição de etapa (medir): {custo:.2f} µs")
+    inicio = time.perf_counter()
+    texto = instrumentacao.exportar()
+    print(f"GET /metrics: {len(texto.splitlines())} linhas geradas em {(time.perf_counter() - inicio) * 1000:.2f} ms")
+
+    print("\nResumo dos histogramas (ms):")
+    for etapa, dados in instrumentacao.resumo().items():
+        if etapa != 'bench':
+            print(f"  {etapa:<16} {dados}")
+
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        resposta = cliente.post('/api/chat', json={'question': 'Qual a lei atual sobre usucapião em 2024?', 'timings': True})
+    print(f"\ntimings_ms de uma pergunta: {json.dumps(resposta.get_json()['timings_ms'], ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Ingestão e busca no índice local da legislação.
+
+Gera um corpus sintético no formato dos textos do Planalto (títulos, capítulos,
+artigos com incisos e parágrafos, notas de alteração e dispositivos vetados), do
+tamanho da CLT + CDC + Código Civil + Constituição, e mede:
+
+- a ingestão (divisão em artigos, embeddings e gravação do índice) e o tamanho do índice;
+- a abertura do índice com mmap e a memória do processo (RSS) antes e depois das buscas;
+- a latência da busca (embedding da pergunta + produto com a matriz + leitura dos k trechos);
+- a recuperação: um pedaço do texto de cada artigo sorteado deve trazer o próprio artigo entre os k primeiros.
+
+Por fim, indexa o CDC de exemplo (benchmarks/fixtures/legislacao/cdc.txt), envia
+perguntas a /api/chat com o servidor falso do Gemini e mostra os trechos enviados e
+os tokens da legislação no prompt (GET /api/tokens/stats).
+
+Com --embeddings hash (o padrão quando o sentence-transformers não está instalado),
+os vetores vêm de um hash das palavras: a latência da busca e os tamanhos
+continuam representativos, mas não a qualidade semântica nem o custo do modelo.
+
+Uso:
+    python benchmarks/bench_legislacao.py [--artigos 5000] [--buscas 500] [--embeddings hash|modelo]
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+import legislacao  # noqa: E402
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+
+VOCABULARIO = """
+consumidor fornecedor empregado empregador contrato produto serviço prazo dias anos salário jornada
+trabalho férias rescisão aviso prévio indenização dano moral material responsabilidade solidária
+vício defeito garantia reparação restituição quantia paga abatimento preço substituição oferta
+publicidade enganosa abusiva cláusula nula pleno direito obrigação credor devedor pagamento juros
+mora multa posse propriedade usucapião imóvel bem móvel herança herdeiro testamento cônjuge
+companheiro união estável casamento divórcio guarda filhos alimentos pensão tutela curatela
+capacidade civil menor idade pessoa natural jurídica domicílio prescrição decadência ação
+pretensão juiz processo prova ônus inversão hipossuficiente estabelecimento comercial telefone
+domicílio arrependimento reflexão valores atualizados monetariamente horas extraordinárias
+adicional noturno insalubridade periculosidade gestante estabilidade acidente sindicato convenção
+acordo coletivo greve fundo garantia tempo serviço depósito conta vinculada saque liberdade
+igualdade vida segurança saúde educação moradia lazer previdência assistência município estado
+união tributo imposto competência lei complementar ordinária decreto regulamento federal
+""".split()
+
+
+def sem_acentos(texto):
+    return ''.join(c for c in unicodedata.normalize('NFD', texto.lower()) if unicodedata.category(c) != 'Mn')
+
+
+def criar_embutir_hash(dimensao):
+    """Embeddings de hash (palavras e pares de palavras), normalizados: substituto do modelo sem dependências"""
+    def embutir(textos):
+        vetores = np.zeros((len(textos), dimensao), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            palavras = re.findall(r'\w{3,}', sem_acentos(texto))
+            for termo in palavras + [f"{a} {b}" for a, b in zip(palavras, palavras[1:])]:
+                codigo = zlib.crc32(termo.encode('utf-8'))
+                vetores[linha, codigo % dimensao] += 1.0 if codigo & 0x80000000 else -1.0
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        return vetores / np.maximum(normas, 1e-12)
+    return embutir
+
+
+def gerar_corpus(pasta, artigos, semente):
+    """Grava leis sintéticas no formato do Planalto; retorna o número de artigos gerado"""
+    aleatorio = random.Random(semente)
+
+    def frase(minimo, maximo):
+        return ' '.join(aleatorio.choice(VOCABULARIO) for _ in range(aleatorio.randint(minimo, maximo)))
+
+    romanos = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X', 'XI', 'XII']
+    leis = ['clt', 'cdc', 'codigo_civil', 'cf88']
+    por_lei = artigos // len(leis)
+    for nome in leis:
+        linhas = []
+        for numero in range(1, por_lei + 1):
+            if numero % 40 == 1:
+                linhas += ['', f"TÍTULO {romanos[(numero // 400) % 12]}", f"Do {frase(2, 4).capitalize()}"]
+            if numero % 10 == 1:
+                linhas += ['', f"CAPÍTULO {romanos[(numero // 10) % 12]}", f"Das {frase(2, 5).capitalize()}"]
+            marca = f"{numero}º" if numero < 10 else f"{numero}."
+            if aleatorio.random() < 0.02:
+                linhas += ['', f"Art. {marca} (Revogado pela Lei nº {aleatorio.randint(8000, 14000)}, de 2017)"]
+                continue
+            nota = f" (Redação dada pela Lei nº {aleatorio.randint(8000, 14000)}, de 2017)" if aleatorio.random() < 0.2 else ''
+            linhas += ['', f"Art. {marca} {frase(15, 40).capitalize()}.{nota}"]
+            for inciso in romanos[:aleatorio.choice([0, 0, 2, 4, 8])]:
+                texto = '(VETADO)' if aleatorio.random() < 0.05 else f"{frase(6, 20)};"
+                linhas.append(f"{inciso} - {texto}")
+            for paragrafo in range(1, aleatorio.choice([1, 1, 2, 3])):
+                linhas.append(f"§ {paragrafo}º {frase(10, 30).capitalize()}.")
+        with open(os.path.join(pasta, f"{nome}.txt"), 'w', encoding='utf-8') as arquivo:
+            arquivo.write('\n'.join(linhas) + '\n')
+    return por_lei * len(leis)
+
+
+def ler_rss():
+    """(RSS total, parte em arquivos mapeados) do processo, em MB (Linux)"""
+    valores = {}
+    with open('/proc/self/status') as arquivo:
+        for linha in arquivo:
+            chave, _, valor = linha.partition(':')
+            if chave in ('VmRSS', 'RssFile'):
+                valores[chave] = int(valor.split()[0]) / 1024
+    return valores.get('VmRSS', 0.0), valores.get('RssFile', 0.0)
+
+
+def tamanho_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(pasta, nome)) for nome in os.listdir(pasta)) / 1024 / 1024
+
+
+def medir_corpus(args, embutir, pasta_temporaria):
+    pasta_leis = os.path.join(pasta_temporaria, 'leis')
+    pasta_indice = os.path.join(pasta_temporaria, 'indice')
+    os.makedirs(pasta_leis)
+    gerados = gerar_corpus(pasta_leis, args.artigos, args.semente)
+    arquivos = [os.path.join(pasta_leis, nome) for nome in os.listdir(pasta_leis)]
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        manifesto = legislacao.construir_indice(arquivos, pasta_indice, embutir=embutir)
+    tempo_ingestao = time.perf_counter() - inicio
+    print(f"Corpus sintético: {gerados} artigos em {len(arquivos)} leis -> {manifesto['trechos']} trechos "
+          f"({manifesto['dimensao']} dimensões)")
+    print(f"  ingestão            {tempo_ingestao:7.2f} s ({manifesto['trechos'] / tempo_ingestao:,.0f} trechos/s)")
+    print(f"  tamanho do índice   {tamanho_pasta(pasta_indice):7.2f} MB")
+
+    rss_antes, _ = ler_rss()
+    indice = legislacao.IndiceLegislacao(pasta_indice, k=args.k, limiar=-1.0, embutir=embutir)
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        indice.carregar()
+    print(f"  abertura (mmap)     {(time.perf_counter() - inicio) * 1000:7.2f} ms")
+    rss_aberto, _ = ler_rss()
+
+    # Consultas: um pedaço do texto de trechos sorteados (sem o número do artigo)
+    aleatorio = random.Random(args.semente)
+    alvos = [aleatorio.randrange(manifesto['trechos']) for _ in range(args.buscas)]
+    latencias = []
+    acertos = 0
+    for alvo in alvos:
+        palavras = re.sub(r'^Art\. \S+( \(continuação\))?', '', indice.trecho(alvo)['texto']).split()
+        inicio_pedaco = aleatorio.randrange(max(1, len(palavras) - 12))
+        pergunta = ' '.join(palavras[inicio_pedaco:inicio_pedaco + 12])
+        inicio = time.perf_counter()
+        encontrados = indice.buscar(pergunta)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        esperado = indice.trecho(alvo)
+        acertos += any(
+            trecho['lei'] == esperado['lei'] and trecho['artigo'] == esperado['artigo'] and trecho['parte'] == esperado['parte']
+            for trecho in encontrados
+        )
+    latencias.sort()
+    rss_depois, rss_arquivos = ler_rss()
+    print(f"  busca (k={args.k})         p50 {statistics.median(latencias):6.2f} ms | "
+          f"p95 {latencias[int(len(latencias) * 0.95) - 1]:6.2f} ms | {len(latencias)} buscas")
+    print(f"  recuperação@{args.k}       {acertos / len(alvos):7.1%} dos trechos encontrados pelo próprio texto")
+    print(f"  RSS do processo     {rss_antes:7.1f} MB antes | {rss_aberto:7.1f} MB aberto | "
+          f"{rss_depois:7.1f} MB após as buscas ({rss_arquivos:.1f} MB em arquivos mapeados, compartilháveis)")
+
+
+def medir_chat(args, embutir, pasta_temporaria):
+    pasta_indice = os.path.join(pasta_temporaria, 'indice_cdc')
+    with contextlib.redirect_stdout(io.StringIO()):
+        legislacao.construir_indice([os.path.join(PASTA_BENCHMARKS, 'fixtures', 'legislacao', 'cdc.txt')], pasta_indice, embutir=embutir)
+
+    _, url_gemini = iniciar_em_segundo_plano(latencia_base=0, latencia_por_token=0)
+    os.environ.update({
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'GEMINI_RPM': '0',
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'LEGISLATION_INDEX_DIR': pasta_indice,
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app, chatbot
+    if args.embeddings == 'hash':
+        chatbot.legislacao = legislacao.IndiceLegislacao(pasta_indice, k=args.k, limiar=args.limiar, embutir=embutir)
+    cliente = app.test_client()
+
+    print("\n/api/chat com o CDC de exemplo no índice:")
+    perguntas = [
+        "Quanto tempo tenho para desistir de uma compra feita pela internet fora do estabelecimento?",
+        "O produto tem vício e o fornecedor não resolveu em trinta dias, posso pedir a restituição da quantia paga?",
+        "Qual o prazo para reclamar de vício aparente em produto durável?",
+    ]
+    for pergunta in perguntas:
+        trechos = chatbot.legislacao.buscar(pergunta)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resposta = cliente.post('/api/chat', json={'question': pergunta, 'timings': True})
+        tempos = resposta.get_json()['timings_ms']
+        artigos = ', '.join(f"{trecho['artigo']} ({trecho['similaridade']:.2f})" for trecho in trechos) or 'nenhum'
+        print(f"  {pergunta[:60]}...\n    trechos: {artigos} | etapa legislacao {tempos.get('legislacao', 0):.2f} ms")
+
+    tokens = cliente.get('/api/tokens/stats').get_json()
+    print(f"  tokens por requisição: {tokens['media_por_requisicao']}")
+    print(f"  GET /api/legislation/stats: {cliente.get('/api/legislation/stats').get_json()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestão e busca no índice local da legislação')
+    parser.add_argument('--artigos', type=int, default=5000, help='artigos do corpus sintético')
+    parser.add_argument('--buscas', type=int, default=500)
+    parser.add_argument('-k', type=int, default=3)
+    parser.add_argument('--limiar', type=float, default=0.1, help='similaridade mínima no teste de /api/chat com embeddings de hash')
+    parser.add_argument('--dimensao', type=int, default=384, help='dimensão dos embeddings de hash (a do MiniLM é 384)')
+    parser.add_argument('--embeddings', choices=('hash', 'modelo'), help='padrão: modelo, se o sentence-transformers estiver instalado')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    tem_modelo = importlib.util.find_spec('sentence_transformers') is not None
+    if args.embeddings is None:
+        args.embeddings = 'modelo' if tem_modelo else 'hash'
+    elif args.embeddings == 'modelo' and not tem_modelo:
+        sys.exit("--embeddings modelo precisa do sentence-transformers (pip install sentence-transformers); "
+                 "sem ele, use --embeddings hash")
+    # Com o modelo, construir_indice e IndiceLegislacao carregam o sentence-transformers do manifesto
+    embutir = criar_embutir_hash(args.dimensao) if args.embeddings == 'hash' else None
+    print(f"Embeddings: {args.embeddings}\n")
+
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_legislacao_')
+    medir_corpus(args, embutir, pasta_temporaria)
+    medir_chat(args, embutir, pasta_temporaria)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Cota, disjuntor e novas tentativas do Gemini (limites_gemini.py) contra o servidor falso.
+
+Três cenários determinísticos, cada um sem e com o controle de tráfego:
+
+1. pico: muitas perguntas ao mesmo tempo contra uma cota pequena do servidor (429
+   com Retry-After além do limite por janela). Conta quantos 429 o servidor
+   precisou enviar e quantos usuários ficaram sem resposta;
+2. indisponibilidade: o servidor responde 503 por alguns segundos enquanto
+   perguntas continuam chegando. Conta as chamadas feitas ao servidor fora do ar e
+   o tempo até os usuários receberem a mensagem de erro;
+3. Retry-After: um único 429 com Retry-After; a nova tentativa deve esperar o
+   prazo pedido (e o mesmo vale para /api/chat/stream).
+
+A cota e o tempo do disjuntor são reduzidos para segundos, para que o benchmark
+rode rápido; a lógica é a mesma usada com GEMINI_RPM/GEMINI_TPM por minuto.
+
+Uso:
+    python benchmarks/bench_limites_gemini.py
+"""
+import concurrent.futures
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+from limites_gemini import ControleGemini, Disjuntor, LimitadorCota  # noqa: E402
+
+JANELA = 2.0
+LIMITE_POR_JANELA = 10
+
+
+def sem_controle():
+    return ControleGemini(LimitadorCota(), Disjuntor(limiar_falhas=10 ** 9), espera_maxima_fila=60)
+
+
+def com_controle():
+    return ControleGemini(
+        LimitadorCota(rpm=LIMITE_POR_JANELA, periodo=JANELA),
+        Disjuntor(limiar_falhas=5, tempo_aberto=1.0),
+        espera_maxima_fila=10
+    )
+
+
+def perguntar(bot, indice):
+    inicio = time.perf_counter()
+    sucesso, _ = bot.consultar_gemini(f"Pergunta {indice} sobre direito do consumidor", atraso_inicial=0.5)
+    return sucesso, (time.perf_counter() - inicio) * 1000
+
+
+def cenario_pico(bot, servidor, clientes=30):
+    with servidor.lock:
+        servidor.limite_rpm, servidor.janela_cota, servidor.inicio_janela = LIMITE_POR_JANELA, JANELA, 0.0
+    antes = dict(servidor.contadores)
+    with concurrent.futures.ThreadPoolExecutor(clientes) as executor:
+        resultados = list(executor.map(lambda i: perguntar(bot, i), range(clientes)))
+    with servidor.lock:
+        servidor.limite_rpm = 0
+    latencias = [latencia for _, latencia in resultados]
+    return {
+        'sem resposta': sum(not sucesso for sucesso, _ in resultados),
+        '429 do servidor': servidor.contadores['respostas_429'] - antes['respostas_429'],
+        'p50 (ms)': statistics.median(latencias),
+        'máx (ms)': max(latencias),
+    }
+
+
+def cenario_indisponibilidade(bot, servidor, duracao_falha=3.0, duracao=4.0, clientes=5, intervalo=0.1):
+    antes = dict(servidor.contadores)
+    with servidor.lock:
+        servidor.indisponivel_ate = time.time() + duracao_falha
+    fim = time.perf_counter() + duracao
+    falhas = []
+    respondidas = []
+
+    def cliente(numero):
+        indice = 0
+        while time.perf_counter() < fim:
+            sucesso, latencia = perguntar(bot, f"{numero}-{indice}")
+            indice += 1
+            (respondidas if sucesso else falhas).append(latencia)
+            time.sleep(intervalo)
+
+    threads = [threading.Thread(target=cliente, args=(numero,)) for numero in range(clientes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'respondidas': len(respondidas),
+        'sem resposta': len(falhas),
+        '503 do servidor': servidor.contadores['respostas_5xx'] - antes['respostas_5xx'],
+        'p50 da falha (ms)': statistics.median(falhas) if falhas else 0,
+    }
+
+
+def cenario_retry_after(bot, servidor, app):
+    resultados = {}
+    for nome in ('generateContent', 'stream'):
+        with servidor.lock:
+            servidor.roteiro.extend([429])
+            servidor.retry_after_roteiro = 1
+        inicio = time.perf_counter()
+        if nome == 'stream':
+            corpo = app.test_client().post('/api/chat/stream', json={'question': 'Pergunta transmitida após um 429'}).get_data(as_text=True)
+            sucesso = '"used_api": true' in corpo
+        else:
+            sucesso, _ = bot.consultar_gemini('Pergunta após um 429', atraso_inicial=0.5)
+        resultados[nome] = (sucesso, (time.perf_counter() - inicio) * 1000)
+    return resultados
+
+
+def silencioso(funcao, *args):
+    """Executa o cenário sem os logs de cada requisição (inclusive os das threads)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return funcao(*args)
+
+
+def main():
+    servidor, url_base = iniciar_em_segundo_plano(latencia_base=0.05, latencia_por_token=0)
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_limites_')
+    os.environ.update({
+        'GEMINI_API_BASE': url_base,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+    from app import app, chatbot
+
+    print(f"\n1. Pico: 30 perguntas simultâneas, cota do servidor de {LIMITE_POR_JANELA} por {JANELA:.0f}s")
+    for nome, controle in (('sem controle', sem_controle), ('com controle', com_controle)):
+        chatbot.controle_gemini = controle()
+        time.sleep(JANELA)
+        resultado = silencioso(cenario_pico, chatbot, servidor)
+        print(f"   {nome:<13} " + ' | '.join(f"{chave}: {valor:.0f}" for chave, valor in resultado.items()))
+
+    print("\n2. Indisponibilidade: 503 por 3s, 5 clientes com uma pergunta a cada 100 ms (após a anterior) por 4s")
+    for nome, controle in (('sem controle', sem_controle), ('com controle', com_controle)):
+        chatbot.controle_gemini = controle()
+        resultado = silencioso(cenario_indisponibilidade, chatbot, servidor)
+        print(f"   {nome:<13} " + ' | '.join(f"{chave}: {valor:.0f}" for chave, valor in resultado.items()))
+        print(f"   {'':<13} disjuntor: {chatbot.controle_gemini.disjuntor.estatisticas()}")
+
+    print("\n3. Um 429 com Retry-After: 1")
+    chatbot.controle_gemini = com_controle()
+    for nome, (sucesso, latencia) in silencioso(cenario_retry_after, chatbot, servidor, app).items():
+        print(f"   {nome:<16} {'respondida' if sucesso else 'SEM RESPOSTA'} em {latencia:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
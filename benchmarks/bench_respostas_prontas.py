@@ -0,0 +1,103 @@
+"""Latência de /api/chat para respostas prontas (sobre o bot e perguntas frequentes).
+
+Usa o app completo com o FAQ de exemplo (respostas_prontas.exemplo.json) e um banco
+temporário, e confere que uma resposta pronta:
+
+- não cria usuário nem devolve Set-Cookie para um visitante novo;
+- não grava no SQLite durante a requisição (a interação fica na fila do
+  BancoConversas até a próxima gravação em lote);
+- para um visitante com sessão, entra no histórico dele.
+
+Como referência, mede também uma pergunta respondida pelo cache em memória, que
+passa pela sessão e pelos caches.
+
+Uso:
+    python benchmarks/bench_respostas_prontas.py [--requisicoes 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PASTA_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_RAIZ)
+
+PASTA_TEMPORARIA = tempfile.mkdtemp(prefix='bench_respostas_prontas_')
+os.environ.setdefault('CHATBOT_DB_PATH', os.path.join(PASTA_TEMPORARIA, 'chatbot.db'))
+os.environ.setdefault('PERSISTENT_CACHE_ENABLED', '0')
+os.environ.setdefault('SEMANTIC_CACHE_ENABLED', '0')
+os.environ.setdefault('SECRET_KEY', 'chave-do-benchmark')
+os.environ.setdefault('FAQ_PATH', os.path.join(PASTA_RAIZ, 'respostas_prontas.exemplo.json'))
+# Gravação em lote bem espaçada, para observar que a requisição só enfileira
+os.environ.setdefault('DB_WRITE_INTERVAL', '30')
+
+from app import app, chatbot  # noqa: E402
+
+CASOS = {
+    'sobre o bot': 'Quem te criou?',
+    'FAQ': 'O que é usucapião?',
+    'cache em memória': 'Quais são os direitos do inquilino?',
+}
+
+
+def medir(cliente, pergunta, requisicoes):
+    tempos = []
+    for _ in range(requisicoes):
+        inicio = time.perf_counter()
+        cliente.post('/api/chat', json={'question': pergunta})
+        tempos.append((time.perf_counter() - inicio) * 1_000_000)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latência de /api/chat para respostas prontas')
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    args = parser.parse_args()
+
+    chatbot.guardar_no_cache(chatbot.normalizar_texto(CASOS['cache em memória']), 'Resposta guardada no cache.')
+
+    # Visitante novo: nenhuma sessão criada e nada gravado no SQLite durante a requisição
+    transacoes_antes = chatbot.banco.estatisticas()['transacoes']
+    resposta = app.test_client().post('/api/chat', json={'question': CASOS['FAQ']})
+    estatisticas = chatbot.banco.estatisticas()
+    print(f"Visitante novo: Set-Cookie {'presente' if resposta.headers.get('Set-Cookie') else 'ausente'} | "
+          f"transações no SQLite durante a requisição: {estatisticas['transacoes'] - transacoes_antes} | "
+          f"pendentes na fila: {estatisticas['pendentes']}")
+
+    # Visitante com sessão: a resposta pronta entra no histórico dele
+    cliente = app.test_client()
+    # (a primeira pergunta vai ao Gemini, o que cria a sessão; sem chave de API, ela só falha)
+    cliente.post('/api/chat', json={'question': 'Como funciona a guarda compartilhada?'})
+    cliente.post('/api/chat', json={'question': CASOS['sobre o bot']})
+    with cliente.session_transaction() as sessao:
+        id_usuario = sessao['user_id']
+    registrada = chatbot.obter_historico_usuario(id_usuario)[-2:] == [
+        ('user', CASOS['sobre o bot']), ('bot', chatbot.respostas_prontas.respostas_bot['criador'])
+    ]
+    print(f"Visitante com sessão: resposta pronta no histórico: {'sim' if registrada else 'NÃO'}")
+
+    for pergunta in CASOS.values():
+        medir(cliente, pergunta, 200)
+    tempos = {nome: [] for nome in CASOS}
+    rodadas = 10
+    for _ in range(rodadas):
+        for nome, pergunta in CASOS.items():
+            tempos[nome] += medir(cliente, pergunta, args.requisicoes // rodadas)
+
+    print(f"\n{'caso':<18} {'p50 (µs)':>10} {'p95 (µs)':>10}")
+    for nome, amostras in tempos.items():
+        amostras.sort()
+        print(f"{nome:<18} {statistics.median(amostras):>10.0f} {amostras[int(len(amostras) * 0.95) - 1]:>10.0f}")
+
+    inicio = time.perf_counter()
+    for _ in range(args.requisicoes):
+        chatbot.classificar_pergunta(CASOS['FAQ'])
+    print(f"\nSó a consulta à tabela (classificar_pergunta): "
+          f"{(time.perf_counter() - inicio) / args.requisicoes * 1_000_000:.1f} µs por pergunta")
+    print(f"Acertos por entrada: {chatbot.respostas_prontas.estatisticas()['acertos']}")
+
+
+if __name__ == '__main__':
+    main()
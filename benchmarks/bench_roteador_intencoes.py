@@ -0,0 +1,134 @@
+"""Confere e mede o classificador de intenções (roteador_intencoes.py).
+
+Usa o corpus em benchmarks/fixtures/corpus_intencoes.jsonl, em que cada pergunta traz
+as intenções esperadas e a resposta automática esperada (criador, proposito,
+sobre_bot ou nenhuma). O script:
+
+1. confere o roteador e AdvogadoBot.classificar_pergunta contra o corpus
+   (sai com código 1 se alguma pergunta divergir);
+2. mostra quantas perguntas o método antigo (busca de substrings no texto em
+   minúsculas, com as listas recriadas a cada chamada) classificava errado;
+3. compara o tempo por pergunta dos dois métodos (e o do roteador sem a normalização).
+   Os dois ficam no mesmo patamar, alguns microssegundos por pergunta, e a maior
+   parte do tempo do roteador é a normalização (acentos e pontuação): o ganho do
+   roteador está nas perguntas classificadas certo, não na velocidade.
+
+Uso:
+    python benchmarks/bench_roteador_intencoes.py [repeticoes]
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+
+from roteador_intencoes import RoteadorIntencoes, normalizar  # noqa: E402
+
+CAMINHO_CORPUS = os.path.join(PASTA_BENCHMARKS, 'fixtures', 'corpus_intencoes.jsonl')
+
+
+def classificar_substrings(pergunta):
+    """Método anterior ao roteador: listas montadas a cada chamada e `termo in texto`"""
+    pergunta_lower = pergunta.lower()
+    termos_atualidade = [
+        "recente", "recentes", "última", "últimas", "atual", "atuais",
+        "nova", "novas", "novo", "novos", "novidade", "novidades",
+        "ontem", "hoje", "semana", "mês", "ano", "decisão", "decisões"
+    ]
+    entidades_busca_web = ["stf", "supremo", "tribunal federal", "stj", "tribunal de justiça", "jurisprudência"]
+    perguntas_diretas_criador = [
+        "quem te criou", "quem criou você", "quem é seu criador", "quem desenvolveu você",
+        "quem fez você", "quem é o seu desenvolvedor"
+    ]
+    perguntas_diretas_proposito = [
+        "qual sua finalidade", "qual seu propósito", "para que você serve",
+        "por que foi criado", "qual seu objetivo", "qual sua função"
+    ]
+    perguntas_amplas_bot = ["me fale sobre você", "me conte sobre você", "sua história", "quem é você", "sobre você"]
+    contextos_outros = [
+        "faculdade", "universidade", "recomend", "indic", "sugir", "curso",
+        "estud", "escola", "ensino", "educação", "graduação", "qual", "onde"
+    ]
+    intencoes = set()
+    if any(termo in pergunta_lower for termo in termos_atualidade):
+        intencoes.add('atualidade')
+    if any(termo in pergunta_lower for termo in entidades_busca_web):
+        intencoes.add('entidade_web')
+    if "stf" in pergunta_lower or "supremo" in pergunta_lower:
+        intencoes.add('stf')
+    if any(frase in pergunta_lower for frase in perguntas_diretas_criador):
+        intencoes.add('criador')
+    if any(frase in pergunta_lower for frase in perguntas_diretas_proposito):
+        intencoes.add('proposito')
+    if any(frase in pergunta_lower for frase in perguntas_amplas_bot):
+        intencoes.add('sobre_bot')
+    if any(contexto in pergunta_lower for contexto in contextos_outros):
+        intencoes.add('outro_contexto')
+    return intencoes
+
+
+def carregar_corpus():
+    with open(CAMINHO_CORPUS, encoding='utf-8') as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def tipo_resposta_pronta(bot, resposta):
+    if resposta is None:
+        return None
+    for tipo, pergunta in (('criador', 'Quem te criou?'), ('proposito', 'Para que você serve?'),
+                           ('sobre_bot', 'Me fale sobre você')):
+        if resposta == bot.classificar_pergunta(pergunta)['resposta_pronta']:
+            return tipo
+    return 'outra'
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    corpus = carregar_corpus()
+    roteador = RoteadorIntencoes()
+
+    os.environ.setdefault('CHATBOT_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_intencoes_'), 'chatbot.db'))
+    os.environ.setdefault('PERSISTENT_CACHE_ENABLED', '0')
+    os.environ.setdefault('SEMANTIC_CACHE_ENABLED', '0')
+    from app import AdvogadoBot
+    bot = AdvogadoBot()
+
+    divergencias = 0
+    erros_antigos = 0
+    for caso in corpus:
+        esperado = set(caso['intencoes'])
+        obtido = set(roteador.classificar(caso['pergunta']))
+        pronta = tipo_resposta_pronta(bot, bot.classificar_pergunta(caso['pergunta'])['resposta_pronta'])
+        if obtido != esperado or pronta != caso['resposta_pronta']:
+            divergencias += 1
+            print(f"DIVERGÊNCIA: {caso['pergunta']!r}: intenções {sorted(obtido)} (esperado {sorted(esperado)}), "
+                  f"resposta automática {pronta} (esperado {caso['resposta_pronta']})")
+
+        antigo = classificar_substrings(caso['pergunta'])
+        if antigo != esperado:
+            erros_antigos += 1
+            print(f"método antigo: {caso['pergunta']!r}: sobrando {sorted(antigo - esperado)}, "
+                  f"faltando {sorted(esperado - antigo)}")
+
+    perguntas = [caso['pergunta'] for caso in corpus]
+    tempo_antigo = timeit.timeit(lambda: [classificar_substrings(p) for p in perguntas], number=repeticoes)
+    tempo_roteador = timeit.timeit(lambda: [roteador.classificar(p) for p in perguntas], number=repeticoes)
+    normalizadas = [normalizar(p) for p in perguntas]
+    tempo_sem_normalizar = timeit.timeit(
+        lambda: [roteador.classificar(p, ja_normalizado=True) for p in normalizadas], number=repeticoes
+    )
+    por_pergunta = repeticoes * len(perguntas) / 1_000_000
+
+    print(f"\nCorpus: {len(corpus)} perguntas | roteador: {divergencias} divergências | "
+          f"método antigo: {erros_antigos} perguntas classificadas errado")
+    print(f"Tempo por pergunta: método antigo {tempo_antigo / por_pergunta:.1f} µs | "
+          f"roteador {tempo_roteador / por_pergunta:.1f} µs "
+          f"(só a expressão, sem normalizar: {tempo_sem_normalizar / por_pergunta:.1f} µs)")
+    sys.exit(1 if divergencias else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Custo por requisição de cada backend de sessão (sessoes.py).
+
+Monta um app Flask mínimo cuja rota faz o mesmo que o chat (lê ou cria o user_id da
+sessão) e mede o tempo por requisição de um visitante que já tem sessão, com muitas
+outras sessões já existentes no backend. A linha "sem sessão" é a mesma rota sem
+tocar na sessão; a diferença para ela é o custo do backend.
+
+Uso:
+    python benchmarks/bench_sessoes.py [--requisicoes 2000] [--sessoes 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, session  # noqa: E402
+from flask.sessions import SecureCookieSessionInterface  # noqa: E402
+
+from sessoes import InterfaceSessaoSQLite  # noqa: E402
+
+
+def criar_app(backend, pasta):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'chave-do-benchmark'
+    app.config['SESSION_PERMANENT'] = True
+
+    if backend == 'filesystem':
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_FILE_DIR'] = os.path.join(pasta, 'flask_session')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            Session(app)
+    elif backend == 'sqlite':
+        app.session_interface = InterfaceSessaoSQLite(os.path.join(pasta, 'sessoes.db'))
+    else:
+        app.session_interface = SecureCookieSessionInterface()
+
+    @app.route('/com-sessao')
+    def com_sessao():
+        if 'user_id' not in session:
+            session['user_id'] = f"web_{uuid.uuid4()}"
+            session.permanent = True
+        return session['user_id']
+
+    @app.route('/sem-sessao')
+    def sem_sessao():
+        return 'ok'
+
+    return app
+
+
+def medir(cliente, rota, requisicoes):
+    tempos = []
+    for _ in range(requisicoes):
+        inicio = time.perf_counter()
+        cliente.get(rota)
+        tempos.append((time.perf_counter() - inicio) * 1_000_000)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Custo por requisição dos backends de sessão')
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--sessoes', type=int, default=2000, help='sessões de outros visitantes criadas antes da medição')
+    args = parser.parse_args()
+
+    casos = []
+    for backend in ('cookie', 'sqlite', 'filesystem'):
+        pasta = tempfile.mkdtemp(prefix=f'bench_sessao_{backend}_')
+        app = criar_app(backend, pasta)
+
+        # Outros visitantes (cada cliente novo cria uma sessão)
+        for _ in range(args.sessoes):
+            app.test_client().get('/com-sessao')
+
+        cliente = app.test_client()
+        id_usuario = cliente.get('/com-sessao').get_data(as_text=True)
+        if backend == 'cookie':
+            # Cliente sem cookie: nenhuma sessão é lida nem gravada
+            casos.append(('sem sessão', app.test_client(), '/sem-sessao'))
+        casos.append((backend, cliente, '/com-sessao'))
+
+        # O visitante deve continuar com o mesmo id (no filesystem, sessões além de
+        # SESSION_FILE_THRESHOLD, padrão 500, são descartadas)
+        mantido = cliente.get('/com-sessao').get_data(as_text=True) == id_usuario
+        arquivos = len(os.listdir(os.path.join(pasta, 'flask_session'))) if backend == 'filesystem' else None
+        print(f"{backend}: mesmo user_id após {args.sessoes} outros visitantes: {'sim' if mantido else 'NÃO'}"
+              + (f" (arquivos de sessão: {arquivos})" if arquivos is not None else ""))
+
+    # Aquecimento e rodadas intercaladas, para que variações da máquina afetem todos os casos igualmente
+    for _, cliente, rota in casos:
+        medir(cliente, rota, 200)
+    tempos = {nome: [] for nome, _, _ in casos}
+    rodadas = 10
+    for _ in range(rodadas):
+        for nome, cliente, rota in casos:
+            tempos[nome] += medir(cliente, rota, args.requisicoes // rodadas)
+
+    base = statistics.median(tempos['sem sessão'])
+    print(f"\n{'backend':<12} {'p50 (µs)':>10} {'p95 (µs)':>10} {'custo p50 (µs)':>15}")
+    for nome, amostras in tempos.items():
+        amostras.sort()
+        p50 = statistics.median(amostras)
+        print(f"{nome:<12} {p50:>10.0f} {amostras[int(len(amostras) * 0.95) - 1]:>10.0f} {p50 - base:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Webhook do WhatsApp: tempo de confirmação, deduplicação e atraso de processamento.
+
+Sobe o servidor falso do Gemini (com latência de uma resposta real) e envia ao
+webhook notificações no formato da Cloud API, de vários números ao mesmo tempo.
+Parte das notificações é reenviada, como a Meta faz quando a confirmação demora.
+As respostas vão para o EnviadorRegistro em vez da Cloud API.
+
+Compara:
+
+- o tempo de confirmação do webhook com o tempo que ele levaria respondendo dentro
+  da requisição (obter_resposta chamado diretamente);
+- chamadas ao Gemini e respostas enviadas com as mensagens recebidas, contando
+  as repetidas (cada mensagem deve ser respondida uma única vez);
+- profundidade da fila e atraso entre a chegada e o envio da resposta.
+
+Uso:
+    python benchmarks/bench_whatsapp.py [--numeros 10] [--mensagens 3] [--latencia-gemini 1.0]
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+from servidor_gemini_falso import iniciar_em_segundo_plano  # noqa: E402
+
+
+def notificacao(id_mensagem, telefone, texto):
+    return {
+        'object': 'whatsapp_business_account',
+        'entry': [{'id': 'conta', 'changes': [{'field': 'messages', 'value': {
+            'messaging_product': 'whatsapp',
+            'contacts': [{'wa_id': telefone, 'profile': {'name': 'Cliente'}}],
+            'messages': [{
+                'from': telefone, 'id': id_mensagem, 'timestamp': str(int(time.time())),
+                'type': 'text', 'text': {'body': texto},
+            }],
+        }}]}],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook do WhatsApp com fila durável')
+    parser.add_argument('--numeros', type=int, default=10, help='números de telefone enviando ao mesmo tempo')
+    parser.add_argument('--mensagens', type=int, default=3, help='mensagens por número')
+    parser.add_argument('--latencia-gemini', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    gemini, url_gemini = iniciar_em_segundo_plano(latencia_base=args.latencia_gemini, latencia_por_token=0)
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_whatsapp_')
+    os.environ.update({
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'GEMINI_RPM': '0',
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'WHATSAPP_QUEUE_PATH': os.path.join(pasta_temporaria, 'fila_whatsapp.db'),
+        'WHATSAPP_WORKERS': str(args.workers),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'REQUEST_COALESCING': '0',
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app, chatbot
+    processador = chatbot.processador_whatsapp
+    enviador = processador.enviador
+    enviador.exibir = False
+
+    # Referência: uma resposta calculada dentro da requisição do webhook
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        chatbot.obter_resposta('Quais são os direitos de quem compra pela internet?', id_usuario='whatsapp_referencia', plataforma='whatsapp')
+        latencia_sincrona = (time.perf_counter() - inicio) * 1000
+
+    # Notificações de cada número, na ordem em que o usuário as enviou; um terço delas é
+    # entregue de novo (reenvio da Meta), depois das originais
+    por_numero = []
+    for numero in range(args.numeros):
+        telefone = f"55219{numero:08d}"
+        originais = [
+            notificacao(f"wamid.{numero}.{indice}", telefone, f"Mensagem {indice} do número {numero}: como funciona o prazo de garantia?")
+            for indice in range(args.mensagens)
+        ]
+        por_numero.append((originais, originais[numero % 3::3]))
+    notificacoes = [payload for originais, _ in por_numero for payload in originais]
+    reenvios = [payload for _, repetidas in por_numero for payload in repetidas]
+
+    chamadas_antes = gemini.contadores['requisicoes']
+    confirmacoes = []
+    profundidade_maxima = 0
+
+    def enviar_numero(notificacoes_do_numero):
+        # Os números enviam ao mesmo tempo; as mensagens de um mesmo número, uma depois da outra
+        cliente = app.test_client()
+        resultados = []
+        for payload in notificacoes_do_numero:
+            inicio = time.perf_counter()
+            resposta = cliente.post('/api/whatsapp/webhook', json=payload)
+            resultados.append((resposta.status_code, (time.perf_counter() - inicio) * 1000))
+        return resultados
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            for resultados in executor.map(enviar_numero, [originais + repetidas for originais, repetidas in por_numero]):
+                for status, latencia in resultados:
+                    assert status == 200, status
+                    confirmacoes.append(latencia)
+        profundidade_maxima = processador.fila.estatisticas()['profundidade']
+
+        esperadas = len(notificacoes)
+        limite = time.time() + 120
+        while len(enviador.enviadas) < esperadas and time.time() < limite:
+            time.sleep(0.05)
+        time.sleep(0.5)
+
+    estatisticas = processador.estatisticas()
+    confirmacoes.sort()
+    print(f"{args.numeros} números x {args.mensagens} mensagens, {len(reenvios)} reenvios, "
+          f"Gemini com {args.latencia_gemini * 1000:.0f} ms, {args.workers} workers\n")
+    print(f"Resposta dentro do webhook (referência): {latencia_sincrona:.0f} ms")
+    print(f"Confirmação do webhook com a fila:       p50 {statistics.median(confirmacoes):.1f} ms | "
+          f"p95 {confirmacoes[int(len(confirmacoes) * 0.95) - 1]:.1f} ms")
+    print(f"\nNotificações: {len(notificacoes) + len(reenvios)} | mensagens únicas: {len(notificacoes)} | "
+          f"repetidas ignoradas: {estatisticas['duplicados']}")
+    print(f"Chamadas ao Gemini: {gemini.contadores['requisicoes'] - chamadas_antes} | "
+          f"respostas enviadas: {len(enviador.enviadas)}")
+    historico = chatbot.obter_historico_usuario('whatsapp_5521900000000', limite=2 * args.mensagens)
+    perguntas = [mensagem for remetente, mensagem in historico if remetente == 'user']
+    em_ordem = perguntas == sorted(perguntas, key=lambda texto: int(texto.split()[1]))
+    chatbot.banco.descarregar(timeout=5)
+    plataformas = dict(chatbot.banco._conexao().execute(
+        "SELECT plataforma, COUNT(*) FROM historico_conversas GROUP BY plataforma"
+    ).fetchall())
+    print(f"Histórico de um número na ordem de chegada: {'sim' if em_ordem else 'NÃO'} ({len(perguntas)} perguntas) | "
+          f"mensagens gravadas por plataforma: {plataformas}")
+    print(f"\nFila: profundidade logo após o pico {profundidade_maxima} | agora {estatisticas['profundidade']} | "
+          f"atraso de processamento (ms) {estatisticas['atraso_processamento_ms']}")
+
+
+if __name__ == '__main__':
+    main()
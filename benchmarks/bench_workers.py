@@ -0,0 +1,193 @@
+"""Tempo de partida e memória por worker, com e sem o pré-carregamento antes do fork.
+
+Sobe N workers de duas formas, como um servidor de produção faria:
+
+- spawn: cada worker é um interpretador novo, que importa o app e cria o AdvogadoBot
+  (como uvicorn --workers N);
+- fork: o processo principal importa o app e chama app.precarregar(); cada worker
+  nasce por fork e só cria o próprio AdvogadoBot (como o gunicorn com gunicorn.conf.py).
+
+Os workers sobem um de cada vez. Para cada um, mede o tempo até ficar pronto
+(importação e criação do bot) e até responder a primeira pergunta (que passa pelo
+índice da legislação e pelo servidor falso do Gemini); com todos vivos, lê de
+/proc/<pid>/smaps_rollup o RSS, o PSS (páginas compartilhadas divididas entre os
+processos que as usam) e o USS (páginas exclusivas do processo).
+
+O índice da legislação é o corpus sintético de bench_legislacao.py, com embeddings de
+hash (sem o sentence-transformers, o modelo não entra na conta). Só Linux.
+
+Uso:
+    python benchmarks/bench_workers.py [--workers 4] [--artigos 5000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+DIMENSAO = 384
+
+
+def memoria(pid):
+    """(RSS, PSS, USS) do processo, em MB"""
+    campos = {}
+    with open(f'/proc/{pid}/smaps_rollup') as arquivo:
+        for linha in arquivo:
+            chave, _, valor = linha.partition(':')
+            if valor.strip().endswith('kB'):
+                campos[chave] = int(valor.split()[0]) / 1024
+    return campos['Rss'], campos['Pss'], campos['Private_Clean'] + campos['Private_Dirty']
+
+
+def trabalho_do_worker(indice, importar):
+    """Importa o app (no modo spawn), cria o bot deste processo e responde uma pergunta; retorna os tempos em ms"""
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as modulo_app
+        if importar:
+            from bench_legislacao import criar_embutir_hash
+            modulo_app.recursos_compartilhados()['legislacao']._embutir = criar_embutir_hash(DIMENSAO)
+        pronto = time.perf_counter()
+        modulo_app.obter_chatbot()
+        bot_criado = time.perf_counter()
+        resposta = modulo_app.app.test_client().post(
+            '/api/chat', json={'question': f"Posso desistir de uma compra feita pela internet? ({indice})"}
+        )
+        assert resposta.status_code == 200, resposta.status_code
+    fim = time.perf_counter()
+    return {
+        'importacao_ms': (pronto - inicio) * 1000,
+        'bot_ms': (bot_criado - pronto) * 1000,
+        'primeira_resposta_ms': (fim - bot_criado) * 1000,
+    }
+
+
+def executar_worker_spawn():
+    """Ponto de entrada de um worker do modo spawn (--worker): resultado em JSON na saída, depois espera a entrada fechar"""
+    indice = int(sys.argv[sys.argv.index('--worker') + 1])
+    resultado = trabalho_do_worker(indice, importar=True)
+    print(json.dumps(resultado), flush=True)
+    sys.stdin.read()
+
+
+def subir_spawn(quantidade):
+    workers = []
+    for indice in range(quantidade):
+        inicio = time.perf_counter()
+        processo = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', str(indice)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        resultado = json.loads(processo.stdout.readline())
+        resultado['ate_pronto_ms'] = (time.perf_counter() - inicio) * 1000 - resultado['primeira_resposta_ms']
+        workers.append((processo.pid, resultado, processo.stdin.close, processo.wait))
+    return workers
+
+
+def subir_fork(quantidade):
+    from bench_legislacao import criar_embutir_hash
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as modulo_app
+        modulo_app.recursos_compartilhados()['legislacao']._embutir = criar_embutir_hash(DIMENSAO)
+        modulo_app.precarregar()
+
+    workers = []
+    for indice in range(quantidade):
+        leitura_resultado, escrita_resultado = os.pipe()
+        inicio = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(leitura_resultado)
+            resultado = trabalho_do_worker(indice, importar=False)
+            os.write(escrita_resultado, json.dumps(resultado).encode() + b'\n')
+            # Vivo até o SIGTERM, para que a memória seja medida com todos os workers no ar
+            while True:
+                signal.pause()
+        os.close(escrita_resultado)
+        with os.fdopen(leitura_resultado) as arquivo:
+            resultado = json.loads(arquivo.readline())
+        resultado['ate_pronto_ms'] = (time.perf_counter() - inicio) * 1000 - resultado['primeira_resposta_ms']
+        workers.append((pid, resultado, lambda pid=pid: os.kill(pid, signal.SIGTERM), lambda pid=pid: os.waitpid(pid, 0)))
+    return workers
+
+
+def relatorio(modo, workers, principal=None):
+    medidas = [memoria(pid) for pid, *_ in workers]
+    tempos = [resultado for _, resultado, *_ in workers]
+    print(f"\n{modo}: {len(workers)} workers")
+    for (pid, resultado, *_), (rss, pss, uss) in zip(workers, medidas):
+        print(f"  pid {pid:>7}: pronto em {resultado['ate_pronto_ms']:6.0f} ms (importação {resultado['importacao_ms']:5.0f} ms, "
+              f"bot {resultado['bot_ms']:4.0f} ms) | 1ª resposta {resultado['primeira_resposta_ms']:5.0f} ms | "
+              f"RSS {rss:5.1f} MB | PSS {pss:5.1f} MB | USS {uss:5.1f} MB")
+    pss_total = sum(pss for _, pss, _ in medidas)
+    linha_principal = ''
+    if principal is not None:
+        rss, pss, uss = memoria(principal)
+        pss_total += pss
+        linha_principal = f" (com o processo principal: RSS {rss:.1f} MB, PSS {pss:.1f} MB)"
+    print(f"  média: pronto em {statistics.fmean(t['ate_pronto_ms'] for t in tempos):.0f} ms, "
+          f"1ª resposta em {statistics.fmean(t['primeira_resposta_ms'] for t in tempos):.0f} ms, "
+          f"USS {statistics.fmean(uss for _, _, uss in medidas):.1f} MB por worker")
+    print(f"  memória total (soma dos PSS){linha_principal}: {pss_total:.1f} MB")
+    for _, _, encerrar, esperar in workers:
+        encerrar()
+        esperar()
+
+
+def main():
+    if '--worker' in sys.argv:
+        executar_worker_spawn()
+        return
+
+    parser = argparse.ArgumentParser(description='Tempo de partida e memória por worker')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--artigos', type=int, default=5000, help='artigos do índice da legislação sintético')
+    args = parser.parse_args()
+
+    import legislacao
+    from bench_legislacao import criar_embutir_hash, gerar_corpus
+    from servidor_gemini_falso import iniciar_em_segundo_plano
+
+    pasta_temporaria = tempfile.mkdtemp(prefix='bench_workers_')
+    pasta_leis = os.path.join(pasta_temporaria, 'leis')
+    os.makedirs(pasta_leis)
+    gerar_corpus(pasta_leis, args.artigos, semente=42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        legislacao.construir_indice(
+            [os.path.join(pasta_leis, nome) for nome in os.listdir(pasta_leis)],
+            os.path.join(pasta_temporaria, 'indice'), embutir=criar_embutir_hash(DIMENSAO)
+        )
+
+    _, url_gemini = iniciar_em_segundo_plano(latencia_base=0, latencia_por_token=0)
+    os.environ.update({
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        'GEMINI_RPM': '0',
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_PATH': os.path.join(pasta_temporaria, 'cache_respostas.db'),
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'LEGISLATION_INDEX_DIR': os.path.join(pasta_temporaria, 'indice'),
+        'LEGISLATION_MIN_SCORE': '0',
+        'SECRET_KEY': 'chave-do-benchmark',
+    })
+    tamanho = sum(os.path.getsize(os.path.join(pasta_temporaria, 'indice', nome)) for nome in os.listdir(os.path.join(pasta_temporaria, 'indice')))
+    print(f"Índice da legislação: {args.artigos} artigos, {tamanho / 1024 / 1024:.1f} MB")
+
+    # Spawn primeiro: o processo deste benchmark ainda não importou o app
+    relatorio('spawn (interpretador novo por worker)', subir_spawn(args.workers))
+    relatorio('fork após app.precarregar()', subir_fork(args.workers), principal=os.getpid())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Servidor falso do DuckDuckGo (versão HTML) para benchmarks locais.
+
+Responde GET /html/ com a página salva em benchmarks/fixtures/duckduckgo_stf.html
+(três resultados sobre o STF) depois de uma latência simulada: uma base fixa mais
+uma espera aleatória com média `variacao_latencia` (distribuição exponencial, que
+produz a cauda longa de um serviço real). Com `taxa_erro`, essa fração das buscas
+recebe 503, como quando o DuckDuckGo limita o IP. Com `taxa_vazia`, essa fração
+recebe a página sem resultados.
+
+Uso isolado:
+    python benchmarks/servidor_duckduckgo_falso.py --porta 8766
+
+e aponte o bot para ele com DUCKDUCKGO_URL=http://127.0.0.1:8766/html/.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PASTA_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+with open(os.path.join(PASTA_FIXTURES, 'duckduckgo_stf.html'), 'rb') as arquivo:
+    PAGINA_RESULTADOS = arquivo.read()
+with open(os.path.join(PASTA_FIXTURES, 'duckduckgo_sem_resultados.html'), 'rb') as arquivo:
+    PAGINA_SEM_RESULTADOS = arquivo.read()
+
+
+class ManipuladorDuckDuckGo(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.buscas += 1
+            sorteio = servidor.aleatorio.random()
+            espera = servidor.latencia
+            if servidor.variacao_latencia:
+                espera += servidor.aleatorio.expovariate(1 / servidor.variacao_latencia)
+        time.sleep(espera)
+
+        if sorteio < servidor.taxa_erro:
+            with servidor.lock:
+                servidor.erros += 1
+            self._responder(503, b'<html><body>Servico indisponivel</body></html>')
+        elif sorteio < servidor.taxa_erro + servidor.taxa_vazia:
+            self._responder(200, PAGINA_SEM_RESULTADOS)
+        else:
+            self._responder(200, PAGINA_RESULTADOS)
+
+
+def criar_servidor(host='127.0.0.1', porta=0, latencia=0.2, variacao_latencia=0.0, taxa_erro=0.0,
+                   taxa_vazia=0.0, semente=None):
+    """Cria o servidor (sem iniciá-lo). Com porta=0 o sistema escolhe uma porta livre.
+
+    Os contadores buscas e erros ficam no próprio servidor (sob servidor.lock).
+    """
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorDuckDuckGo)
+    servidor.daemon_threads = True
+    servidor.lock = threading.Lock()
+    servidor.aleatorio = random.Random(semente)
+    servidor.latencia = latencia
+    servidor.variacao_latencia = variacao_latencia
+    servidor.taxa_erro = taxa_erro
+    servidor.taxa_vazia = taxa_vazia
+    servidor.buscas = 0
+    servidor.erros = 0
+    return servidor
+
+
+def iniciar_em_segundo_plano(**opcoes):
+    """Inicia o servidor em uma thread e retorna (servidor, url da busca)"""
+    servidor = criar_servidor(**opcoes)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, porta = servidor.server_address[:2]
+    return servidor, f"http://{host}:{porta}/html/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso do DuckDuckGo')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8766)
+    parser.add_argument('--latencia', type=float, default=0.2, help='segundos fixos por busca')
+    parser.add_argument('--variacao-latencia', type=float, default=0.0, help='média, em segundos, da espera aleatória somada')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração das buscas respondidas com 503')
+    parser.add_argument('--taxa-vazia', type=float, default=0.0, help='fração das buscas sem resultados')
+    parser.add_argument('--semente', type=int, default=None)
+    args = parser.parse_args()
+
+    servidor = criar_servidor(
+        args.host, args.porta, args.latencia, args.variacao_latencia, args.taxa_erro, args.taxa_vazia, args.semente
+    )
+    print(f"Servidor falso do DuckDuckGo em http://{args.host}:{args.porta}/html/")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Servidor falso da API do Gemini para benchmarks locais.
+
+Atende as rotas usadas pelo bot, sem chave real e sem rede:
+
+- POST /v1beta/models/<modelo>:generateContent
+- POST /v1beta/models/<modelo>:streamGenerateContent?alt=sse (SSE em blocos)
+- POST /v1beta/cachedContents (contextos em cache com TTL)
+
+A latência simulada é uma base fixa mais um custo por token de entrada que não está
+em cache e, com variacao_latencia, uma espera aleatória com essa média (distribuição
+exponencial, que produz a cauda longa de um serviço real). O usageMetadata informa promptTokenCount e cachedContentTokenCount, como
+a API real. Os tokens são estimados por caracteres (4 caracteres por token).
+
+Para testar o controle de tráfego, as falhas são determinísticas:
+
+- cota: com limite_rpm, as requisições além do limite dentro de cada janela de
+  janela_cota segundos recebem 429 com Retry-After (e RetryInfo no corpo, como a
+  API real) até o fim da janela;
+- roteiro: lista de status devolvidos, em ordem, pelas próximas requisições de
+  geração (ex.: [503, 503, 429]), antes de voltar ao normal;
+- indisponibilidade: até servidor.indisponivel_ate (time.time()), toda geração
+  recebe 503.
+
+Para testes de carga, taxa_erro faz uma fração aleatória das gerações receber 503
+(com `semente`, a sequência se repete entre execuções).
+
+Uso isolado:
+    python benchmarks/servidor_gemini_falso.py --porta 8765
+
+e aponte o bot para ele com GEMINI_API_BASE=http://127.0.0.1:8765/v1beta.
+"""
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+CARACTERES_POR_TOKEN = 4
+
+
+def estimar_tokens(texto):
+    return int(len(texto) / CARACTERES_POR_TOKEN) + 1 if texto else 0
+
+
+def tokens_das_partes(conteudo):
+    return sum(estimar_tokens(parte.get('text', '')) for parte in (conteudo or {}).get('parts', []))
+
+
+class ManipuladorGemini(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _enviar_json(self, status, dados):
+        corpo = json.dumps(dados).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        caminho = urlparse(self.path).path
+
+        if caminho.endswith('/cachedContents'):
+            self._criar_contexto(corpo)
+        elif ':generateContent' in caminho or ':streamGenerateContent' in caminho:
+            if not self._falha_simulada():
+                self._gerar(corpo, stream=':streamGenerateContent' in caminho)
+        else:
+            self._enviar_json(404, {'error': {'code': 404, 'message': 'Rota desconhecida'}})
+
+    def _enviar_erro(self, status, retry_after=None):
+        servidor = self.server
+        erro = {'code': status, 'message': 'Falha simulada', 'status': 'UNAVAILABLE'}
+        if status == 429:
+            erro.update(message='Resource has been exhausted (e.g. check quota).', status='RESOURCE_EXHAUSTED')
+            if retry_after is not None:
+                erro['details'] = [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': f'{retry_after}s'}]
+        with servidor.lock:
+            servidor.contadores['respostas_429' if status == 429 else 'respostas_5xx'] += 1
+        corpo = json.dumps({'error': erro}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _falha_simulada(self):
+        """Aplica o roteiro de status, a indisponibilidade, a cota e os erros aleatórios; retorna True se respondeu com erro"""
+        servidor = self.server
+        agora = time.time()
+        with servidor.lock:
+            status = servidor.roteiro.popleft() if servidor.roteiro else None
+            if status is None and agora < servidor.indisponivel_ate:
+                status = 503
+            retry_after = None
+            if status is None and servidor.limite_rpm:
+                if agora - servidor.inicio_janela >= servidor.janela_cota:
+                    servidor.inicio_janela, servidor.usadas_janela = agora, 0
+                servidor.usadas_janela += 1
+                if servidor.usadas_janela > servidor.limite_rpm:
+                    status = 429
+                    retry_after = max(1, math.ceil(servidor.inicio_janela + servidor.janela_cota - agora))
+            elif status == 429:
+                retry_after = servidor.retry_after_roteiro
+            if status is None and servidor.taxa_erro and servidor.aleatorio.random() < servidor.taxa_erro:
+                status = 503
+
+        if status is None or status == 200:
+            return False
+        self._enviar_erro(status, retry_after)
+        return True
+
+    def _criar_contexto(self, corpo):
+        servidor = self.server
+        tokens = tokens_das_partes(corpo.get('systemInstruction'))
+        tokens += sum(tokens_das_partes(conteudo) for conteudo in corpo.get('contents', []))
+        if tokens < servidor.minimo_tokens_cache:
+            self._enviar_json(400, {'error': {
+                'code': 400,
+                'message': f'Cached content is too small. total_token_count={tokens}, min_total_token_count={servidor.minimo_tokens_cache}'
+            }})
+            return
+
+        ttl = float(str(corpo.get('ttl', '3600s')).rstrip('s'))
+        nome = f"cachedContents/falso-{next(servidor.sequencia)}"
+        expira = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        with servidor.lock:
+            servidor.contextos[nome] = (tokens, time.time() + ttl)
+            servidor.contadores['contextos_criados'] += 1
+        self._enviar_json(200, {
+            'name': nome,
+            'model': corpo.get('model'),
+            'expireTime': expira.isoformat().replace('+00:00', 'Z'),
+            'usageMetadata': {'totalTokenCount': tokens},
+        })
+
+    def _gerar(self, corpo, stream):
+        servidor = self.server
+        tokens_cache = 0
+        nome_contexto = corpo.get('cachedContent')
+        if nome_contexto:
+            with servidor.lock:
+                contexto = servidor.contextos.get(nome_contexto)
+            if not contexto or contexto[1] < time.time():
+                self._enviar_json(404, {'error': {'code': 404, 'message': f'CachedContent not found: {nome_contexto}'}})
+                return
+            tokens_cache = contexto[0]
+
+        tokens_novos = tokens_das_partes(corpo.get('systemInstruction'))
+        tokens_novos += sum(tokens_das_partes(conteudo) for conteudo in corpo.get('contents', []))
+        uso = {
+            'promptTokenCount': tokens_novos + tokens_cache,
+            'cachedContentTokenCount': tokens_cache,
+            'candidatesTokenCount': 20,
+        }
+        with servidor.lock:
+            servidor.contadores['requisicoes'] += 1
+            servidor.contadores['tokens_entrada'] += tokens_novos + tokens_cache
+            servidor.contadores['tokens_em_cache'] += tokens_cache
+            variacao = servidor.aleatorio.expovariate(1 / servidor.variacao_latencia) if servidor.variacao_latencia else 0.0
+
+        time.sleep(servidor.latencia_base + tokens_novos * servidor.latencia_por_token + variacao)
+        partes = ['Resposta simulada ', 'do servidor ', 'falso do Gemini.']
+
+        if not stream:
+            self._enviar_json(200, {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': ''.join(partes)}]}}],
+                'usageMetadata': uso,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, parte in enumerate(partes):
+            evento = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': parte}]}}]}
+            if i == len(partes) - 1:
+                evento['usageMetadata'] = uso
+            dados = f"data: {json.dumps(evento)}\r\n\r\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(dados), dados))
+            self.wfile.flush()
+            time.sleep(servidor.intervalo_stream)
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def criar_servidor(host='127.0.0.1', porta=0, latencia_base=0.05, latencia_por_token=0.0002,
+                   minimo_tokens_cache=0, intervalo_stream=0.02, limite_rpm=0, janela_cota=60.0,
+                   roteiro=(), retry_after_roteiro=1, variacao_latencia=0.0, taxa_erro=0.0, semente=None):
+    """Cria o servidor (sem iniciá-lo). Com porta=0 o sistema escolhe uma porta livre.
+
+    limite_rpm=0 desativa a cota; roteiro e indisponivel_ate podem ser alterados com o
+    servidor em execução (sob servidor.lock).
+    """
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorGemini)
+    servidor.daemon_threads = True
+    servidor.latencia_base = latencia_base
+    servidor.latencia_por_token = latencia_por_token
+    servidor.minimo_tokens_cache = minimo_tokens_cache
+    servidor.intervalo_stream = intervalo_stream
+    servidor.lock = threading.Lock()
+    servidor.sequencia = itertools.count(1)
+    servidor.contextos = {}
+    servidor.limite_rpm = limite_rpm
+    servidor.janela_cota = janela_cota
+    servidor.inicio_janela = 0.0
+    servidor.usadas_janela = 0
+    servidor.roteiro = collections.deque(roteiro)
+    servidor.retry_after_roteiro = retry_after_roteiro
+    servidor.indisponivel_ate = 0.0
+    servidor.variacao_latencia = variacao_latencia
+    servidor.taxa_erro = taxa_erro
+    servidor.aleatorio = random.Random(semente)
+    servidor.contadores = {
+        'requisicoes': 0, 'tokens_entrada': 0, 'tokens_em_cache': 0, 'contextos_criados': 0,
+        'respostas_429': 0, 'respostas_5xx': 0,
+    }
+    return servidor
+
+
+def iniciar_em_segundo_plano(**opcoes):
+    """Inicia o servidor em uma thread e retorna (servidor, url_base)"""
+    servidor = criar_servidor(**opcoes)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, porta = servidor.server_address[:2]
+    return servidor, f"http://{host}:{porta}/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso da API do Gemini')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia-base', type=float, default=0.05, help='segundos por requisição')
+    parser.add_argument('--latencia-por-token', type=float, default=0.0002, help='segundos por token de entrada fora do cache')
+    parser.add_argument('--minimo-tokens-cache', type=int, default=0, help='mínimo de tokens para criar um contexto em cache')
+    parser.add_argument('--limite-rpm', type=int, default=0, help='requisições aceitas por janela de cota (0 = sem cota)')
+    parser.add_argument('--janela-cota', type=float, default=60.0, help='duração da janela de cota, em segundos')
+    parser.add_argument('--variacao-latencia', type=float, default=0.0, help='média, em segundos, da espera aleatória somada')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração das gerações respondidas com 503')
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--roteiro', default='', help='status das próximas gerações, separados por vírgula (ex.: 503,503,429)')
+    args = parser.parse_args()
+
+    servidor = criar_servidor(
+        args.host, args.porta, args.latencia_base, args.latencia_por_token, args.minimo_tokens_cache,
+        limite_rpm=args.limite_rpm, janela_cota=args.janela_cota,
+        roteiro=[int(status) for status in args.roteiro.split(',') if status.strip()],
+        variacao_latencia=args.variacao_latencia, taxa_erro=args.taxa_erro, semente=args.semente
+    )
+    print(f"Servidor falso do Gemini em http://{args.host}:{args.porta}/v1beta")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
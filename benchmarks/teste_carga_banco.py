@@ -0,0 +1,123 @@
+"""Teste de carga do banco de conversas (banco_dados.BancoConversas).
+
+Várias threads (e, opcionalmente, vários processos, como workers do servidor)
+gravam trocas de mensagens e leem o histórico ao mesmo tempo sobre o mesmo arquivo
+SQLite. Ao final, confere que nenhuma gravação se perdeu, que cada usuário tem
+exatamente as mensagens enviadas, na ordem, e que o histórico lido logo após cada
+gravação já contém a mensagem recém-enviada.
+
+Uso:
+    python benchmarks/teste_carga_banco.py [--threads 32] [--trocas 50] [--processos 2] [--sem-janela]
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco_dados import BancoConversas  # noqa: E402
+
+
+def executar_processo(caminho, indice_processo, threads, trocas, usuarios_em_memoria, resultados):
+    banco = BancoConversas(caminho, usuarios_em_memoria=usuarios_em_memoria)
+    leituras_incoerentes = []
+
+    def conversar(indice_thread):
+        id_usuario = f"carga_{indice_processo}_{indice_thread}"
+        banco.registrar_usuario(id_usuario)
+        for i in range(trocas):
+            banco.salvar_mensagens(id_usuario, [("user", f"pergunta {i}"), ("bot", f"resposta {i}")])
+            historico = banco.obter_historico(id_usuario, limite=4)
+            if historico[-1] != ("bot", f"resposta {i}"):
+                leituras_incoerentes.append((id_usuario, i, historico[-1:]))
+
+    inicio = time.perf_counter()
+    trabalhadores = [threading.Thread(target=conversar, args=(i,)) for i in range(threads)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    duracao_envio = time.perf_counter() - inicio
+    banco.encerrar()
+
+    resultados.put({
+        'processo': indice_processo,
+        'duracao_envio': duracao_envio,
+        'duracao_total': time.perf_counter() - inicio,
+        'leituras_incoerentes': len(leituras_incoerentes),
+        'estatisticas': banco.estatisticas(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do banco de conversas')
+    parser.add_argument('--threads', type=int, default=32, help='usuários simultâneos por processo')
+    parser.add_argument('--trocas', type=int, default=50, help='trocas (pergunta + resposta) por usuário')
+    parser.add_argument('--processos', type=int, default=2, help='processos gravando no mesmo arquivo')
+    parser.add_argument('--sem-janela', action='store_true', help='desativa a janela de histórico em memória')
+    args = parser.parse_args()
+
+    caminho = os.path.join(tempfile.mkdtemp(prefix='carga_banco_'), 'chatbot.db')
+    BancoConversas(caminho).encerrar()
+
+    usuarios_em_memoria = 0 if args.sem_janela else 10000
+    resultados = multiprocessing.Queue()
+    processos = [
+        multiprocessing.Process(
+            target=executar_processo,
+            args=(caminho, i, args.threads, args.trocas, usuarios_em_memoria, resultados)
+        )
+        for i in range(args.processos)
+    ]
+    for processo in processos:
+        processo.start()
+    relatorios = [resultados.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+
+    conn = sqlite3.connect(caminho)
+    esperado_por_usuario = [
+        item for i in range(args.trocas) for item in (("user", f"pergunta {i}"), ("bot", f"resposta {i}"))
+    ]
+    usuarios_incorretos = 0
+    for indice_processo in range(args.processos):
+        for indice_thread in range(args.threads):
+            id_usuario = f"carga_{indice_processo}_{indice_thread}"
+            mensagens = conn.execute(
+                "SELECT remetente, mensagem FROM historico_conversas WHERE id_usuario = ? ORDER BY id",
+                (id_usuario,)
+            ).fetchall()
+            if mensagens != esperado_por_usuario:
+                usuarios_incorretos += 1
+
+    total_esperado = args.processos * args.threads * args.trocas * 2
+    total_gravado = conn.execute("SELECT COUNT(*) FROM historico_conversas").fetchone()[0]
+    total_usuarios = conn.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0]
+    conn.close()
+
+    for relatorio in sorted(relatorios, key=lambda r: r['processo']):
+        estatisticas = relatorio['estatisticas']
+        print(f"processo {relatorio['processo']}: {estatisticas['mensagens_gravadas']} mensagens em "
+              f"{estatisticas['transacoes']} transações, envio {relatorio['duracao_envio']:.2f}s, "
+              f"total {relatorio['duracao_total']:.2f}s, erros de gravação {estatisticas['erros_gravacao']}, "
+              f"leituras sem a última mensagem {relatorio['leituras_incoerentes']}, "
+              f"leituras da janela em memória {estatisticas['janela']['acertos']}/"
+              f"{estatisticas['janela']['acertos'] + estatisticas['janela']['falhas']}")
+
+    print(f"\nmensagens esperadas: {total_esperado} | gravadas: {total_gravado}")
+    print(f"usuários esperados: {args.processos * args.threads} | gravados: {total_usuarios}")
+    print(f"usuários com histórico diferente do enviado: {usuarios_incorretos}")
+
+    ok = (total_gravado == total_esperado and total_usuarios == args.processos * args.threads
+          and usuarios_incorretos == 0 and not any(r['leituras_incoerentes'] for r in relatorios))
+    print("OK: nenhuma gravação perdida" if ok else "FALHA: gravações perdidas ou fora de ordem")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Teste de carga de /api/chat com uma mistura realista de perguntas.
+
+Usuários virtuais enviam perguntas em ciclo fechado (cada um espera a resposta,
+mais uma pausa aleatória, antes da próxima), sorteando entre os cenários de
+benchmarks/fixtures/mix_perguntas.json:
+
+- faq: perguntas frequentes, sorteadas com popularidade decrescente (as primeiras
+  se repetem muito, como em produção), incluindo perguntas sobre o bot;
+- atualidades: perguntas sobre o STF e notícias, que passam pela busca na web;
+- sessao: conversas de várias mensagens com o mesmo cookie de sessão (histórico).
+
+Sem --url, sobe os servidores falsos do Gemini e do DuckDuckGo, com a latência e a
+taxa de erro pedidas, e o app em um servidor HTTP local com threads, com banco
+temporário. Com --url, usa um servidor já em execução (com os serviços que ele
+estiver configurado para usar).
+
+O relatório traz p50/p95/p99 por cenário, requisições por segundo, erros,
+respostas por origem, taxa de acerto de cada cache, chamadas ao Gemini e buscas
+no DuckDuckGo e a contenção no SQLite (duração das transações de gravação, fila de
+gravações pendentes, erros de banco bloqueado), tudo lido de GET /metrics antes
+e depois da medição.
+
+Uso:
+    python benchmarks/teste_carga_chat.py [--usuarios 20] [--duracao 30] [--erro-gemini 0.02]
+    python benchmarks/teste_carga_chat.py --url http://127.0.0.1:5000 --usuarios 50
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCHMARKS))
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+import servidor_duckduckgo_falso  # noqa: E402
+import servidor_gemini_falso  # noqa: E402
+
+_ROTULO = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def ler_metricas(texto):
+    """Texto do Prometheus -> {(nome, ((rótulo, valor), ...)): valor}"""
+    metricas = {}
+    for linha in texto.splitlines():
+        if not linha or linha.startswith('#'):
+            continue
+        serie, _, valor = linha.rpartition(' ')
+        nome, _, rotulos = serie.partition('{')
+        metricas[(nome, tuple(sorted(_ROTULO.findall(rotulos))))] = float(valor)
+    return metricas
+
+
+def soma(metricas, nome, **filtro):
+    return sum(
+        valor for (nome_serie, rotulos), valor in metricas.items()
+        if nome_serie == nome and all(dict(rotulos).get(chave) == esperado for chave, esperado in filtro.items())
+    )
+
+
+def percentil(ordenados, fracao):
+    """Percentil pelo posto mais próximo"""
+    if not ordenados:
+        return float('nan')
+    return ordenados[max(0, math.ceil(fracao * len(ordenados)) - 1)]
+
+
+def percentil_histograma(antes, depois, etapa, fracao):
+    """Percentil aproximado (limite superior do intervalo) de uma etapa, entre dois instantes"""
+    nome = 'advogado_etapa_duracao_segundos_bucket'
+    intervalos = []
+    for (nome_serie, rotulos), valor in depois.items():
+        rotulos_dict = dict(rotulos)
+        if nome_serie == nome and rotulos_dict.get('etapa') == etapa:
+            limite = float(rotulos_dict['le'].replace('+Inf', 'inf'))
+            intervalos.append((limite, valor - antes.get((nome_serie, rotulos), 0.0)))
+    intervalos.sort()
+    if not intervalos or not intervalos[-1][1]:
+        return None
+    alvo = fracao * intervalos[-1][1]
+    return next(limite for limite, contagem in intervalos if contagem >= alvo) * 1000
+
+
+class GeradorPerguntas:
+    """Sorteia o próximo cenário e suas perguntas conforme a mistura do arquivo"""
+
+    def __init__(self, mistura, semente):
+        self.mistura = mistura
+        self.aleatorio = random.Random(semente)
+        self.cenarios = list(mistura)
+        self.pesos = [mistura[nome]['peso'] for nome in self.cenarios]
+        perguntas_faq = mistura['faq']['perguntas']
+        # Popularidade de Zipf: a n-ésima pergunta frequente aparece 1/n vezes a primeira
+        self.pesos_faq = [1 / posicao for posicao in range(1, len(perguntas_faq) + 1)]
+
+    def proximo(self):
+        """Retorna (cenário, [perguntas]); as do cenário 'sessao' usam a mesma sessão"""
+        cenario = self.aleatorio.choices(self.cenarios, self.pesos)[0]
+        dados = self.mistura[cenario]
+        if cenario == 'faq':
+            return cenario, self.aleatorio.choices(dados['perguntas'], self.pesos_faq)
+        if cenario == 'atualidades':
+            modelo = self.aleatorio.choice(dados['modelos'])
+            return cenario, [modelo.format(tema=self.aleatorio.choice(dados['temas']))]
+        return cenario, list(self.aleatorio.choice(dados['conversas']))
+
+
+def subir_app_local(args):
+    """Sobe os servidores falsos e o app em um servidor HTTP local; retorna (url, gemini, duckduckgo)"""
+    gemini, url_gemini = servidor_gemini_falso.iniciar_em_segundo_plano(
+        latencia_base=args.latencia_gemini, latencia_por_token=0,
+        variacao_latencia=args.variacao_gemini, taxa_erro=args.erro_gemini, semente=args.semente
+    )
+    duckduckgo, url_duckduckgo = servidor_duckduckgo_falso.iniciar_em_segundo_plano(
+        latencia=args.latencia_busca, variacao_latencia=args.variacao_busca,
+        taxa_erro=args.erro_busca, semente=args.semente
+    )
+    pasta_temporaria = tempfile.mkdtemp(prefix='teste_carga_chat_')
+    variaveis = {
+        'GEMINI_API_BASE': url_gemini,
+        'GEMINI_API_KEY': 'chave-falsa',
+        # Sem a cota do plano gratuito: o servidor falso não cobra por chamada
+        'GEMINI_RPM': '0',
+        'GEMINI_TPM': '0',
+        'DUCKDUCKGO_URL': url_duckduckgo,
+        'CHATBOT_DB_PATH': os.path.join(pasta_temporaria, 'chatbot.db'),
+        'PERSISTENT_CACHE_ENABLED': '0',
+        'SEMANTIC_CACHE_ENABLED': '0',
+        'SECRET_KEY': 'chave-do-teste-de-carga',
+    }
+    # Configurações passadas no ambiente (GEMINI_RPM, SESSION_BACKEND...) têm prioridade
+    for nome, valor in variaveis.items():
+        os.environ.setdefault(nome, valor)
+
+    from werkzeug.serving import make_server
+
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        from app import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}", gemini, duckduckgo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga de /api/chat')
+    parser.add_argument('--url', help='servidor já em execução (sem --url, sobe o app e os servidores falsos)')
+    parser.add_argument('--usuarios', type=int, default=20, help='usuários virtuais simultâneos')
+    parser.add_argument('--duracao', type=float, default=30.0, help='segundos de medição')
+    parser.add_argument('--aquecimento', type=float, default=5.0, help='segundos iniciais fora da medição')
+    parser.add_argument('--pausa', type=float, default=0.5, help='pausa média entre as mensagens de um usuário (s)')
+    parser.add_argument('--mistura', default=os.path.join(PASTA_BENCHMARKS, 'fixtures', 'mix_perguntas.json'))
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--latencia-gemini', type=float, default=0.8)
+    parser.add_argument('--variacao-gemini', type=float, default=0.4, help='média da espera aleatória somada (s)')
+    parser.add_argument('--erro-gemini', type=float, default=0.02, help='fração de 503 do Gemini')
+    parser.add_argument('--latencia-busca', type=float, default=0.3)
+    parser.add_argument('--variacao-busca', type=float, default=0.2)
+    parser.add_argument('--erro-busca', type=float, default=0.05, help='fração de 503 do DuckDuckGo')
+    parser.add_argument('--json', help='grava o relatório também neste arquivo')
+    args = parser.parse_args()
+
+    with open(args.mistura, encoding='utf-8') as arquivo:
+        mistura = json.load(arquivo)
+
+    gemini = duckduckgo = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        url, gemini, duckduckgo = subir_app_local(args)
+
+    registros = []
+    lock = threading.Lock()
+    parar = threading.Event()
+
+    def usuario_virtual(indice):
+        gerador = GeradorPerguntas(mistura, args.semente * 1000 + indice)
+        aleatorio = random.Random(args.semente * 7919 + indice)
+        cliente = None
+        while not parar.is_set():
+            cenario, perguntas = gerador.proximo()
+            # Cada conversa é de um novo usuário; FAQ e atualidades mantêm a sessão do usuário virtual
+            if cliente is None or cenario == 'sessao':
+                if cliente is not None:
+                    cliente.close()
+                cliente = httpx.Client(base_url=url, timeout=120)
+            for pergunta in perguntas:
+                if parar.is_set():
+                    break
+                inicio = time.perf_counter()
+                try:
+                    resposta = cliente.post('/api/chat', json={'question': pergunta})
+                    status = resposta.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                with lock:
+                    registros.append((cenario, inicio, (time.perf_counter() - inicio) * 1000, status))
+                if args.pausa:
+                    parar.wait(aleatorio.expovariate(1 / args.pausa))
+        if cliente is not None:
+            cliente.close()
+
+    maior_pendencia = 0
+
+    def amostrar_fila_gravacao():
+        nonlocal maior_pendencia
+        with httpx.Client(base_url=url, timeout=10) as cliente:
+            while not parar.wait(0.5):
+                try:
+                    metricas = ler_metricas(cliente.get('/metrics').text)
+                except httpx.HTTPError:
+                    continue
+                maior_pendencia = max(maior_pendencia, soma(metricas, 'advogado_banco_gravacoes_pendentes'))
+
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        threads = [threading.Thread(target=usuario_virtual, args=(i,), daemon=True) for i in range(args.usuarios)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.aquecimento)
+
+        antes = ler_metricas(httpx.get(f"{url}/metrics").text)
+        gemini_antes = dict(gemini.contadores) if gemini else None
+        buscas_antes = duckduckgo.buscas if duckduckgo else None
+        amostrador = threading.Thread(target=amostrar_fila_gravacao, daemon=True)
+        amostrador.start()
+        inicio_medicao = time.perf_counter()
+        time.sleep(args.duracao)
+        fim_medicao = time.perf_counter()
+        parar.set()
+        for thread in threads:
+            thread.join(150)
+        amostrador.join(5)
+        depois = ler_metricas(httpx.get(f"{url}/metrics").text)
+
+    medidos = [registro for registro in registros if inicio_medicao <= registro[1] < fim_medicao]
+    relatorio = {
+        'configuracao': {chave: valor for chave, valor in vars(args).items() if chave != 'json'},
+        'requisicoes': len(medidos),
+        'requisicoes_por_segundo': round(len(medidos) / args.duracao, 2),
+        'cenarios': {},
+    }
+    for cenario in ['total'] + list(mistura):
+        latencias = sorted(latencia for nome, _, latencia, _ in medidos if cenario in ('total', nome))
+        erros = sum(1 for nome, _, _, status in medidos if cenario in ('total', nome) and status != 200)
+        if latencias:
+            relatorio['cenarios'][cenario] = {
+                'requisicoes': len(latencias),
+                'erros_http': erros,
+                'p50_ms': round(percentil(latencias, 0.50), 1),
+                'p95_ms': round(percentil(latencias, 0.95), 1),
+                'p99_ms': round(percentil(latencias, 0.99), 1),
+                'max_ms': round(latencias[-1], 1),
+            }
+
+    def delta(nome, **filtro):
+        return soma(depois, nome, **filtro) - soma(antes, nome, **filtro)
+
+    origens = sorted({dict(rotulos)['origem'] for nome, rotulos in depois if nome == 'advogado_respostas_total'})
+    respostas = {origem: int(delta('advogado_respostas_total', origem=origem)) for origem in origens}
+    relatorio['respostas_por_origem'] = respostas
+
+    caches = sorted({dict(rotulos)['cache'] for nome, rotulos in depois if nome == 'advogado_cache_acertos_total'})
+    relatorio['taxa_acerto_caches'] = {}
+    for cache in caches:
+        acertos = delta('advogado_cache_acertos_total', cache=cache)
+        consultas = acertos + delta('advogado_cache_falhas_total', cache=cache)
+        relatorio['taxa_acerto_caches'][cache] = round(acertos / consultas, 3) if consultas else None
+
+    etapas = 'advogado_etapa_duracao_segundos_count'
+    relatorio['chamadas_externas'] = {
+        # Perguntas que esperaram pelo Gemini, incluindo as que aproveitaram uma chamada idêntica em andamento
+        'consultas_gemini': int(delta(etapas, etapa='gemini')),
+        'buscas_duckduckgo': int(delta(etapas, etapa='duckduckgo')),
+        'gemini_coalescidas': int(delta('advogado_coalescidas_total', chamada='gemini')),
+        'busca_web_coalescidas': int(delta('advogado_coalescidas_total', chamada='busca_web')),
+        'gemini_novas_tentativas': int(delta('advogado_gemini_novas_tentativas_total')),
+    }
+    if gemini:
+        relatorio['chamadas_externas']['servidor_gemini'] = {
+            chave: gemini.contadores[chave] - gemini_antes[chave] for chave in ('requisicoes', 'respostas_429', 'respostas_5xx')
+        }
+        relatorio['chamadas_externas']['servidor_duckduckgo'] = {'buscas': duckduckgo.buscas - buscas_antes}
+
+    transacoes = delta('advogado_banco_transacoes_total')
+    relatorio['sqlite'] = {
+        'transacoes_gravacao': int(transacoes),
+        'tempo_medio_transacao_ms': round(delta('advogado_banco_gravacao_segundos_total') / transacoes * 1000, 2) if transacoes else None,
+        'erros_gravacao': int(delta('advogado_banco_erros_gravacao_total')),
+        'maior_fila_gravacao': int(maior_pendencia),
+        'leituras_historico': {
+            'memoria': int(delta('advogado_banco_janela_total', origem='memoria')),
+            'sqlite': int(delta('advogado_banco_janela_total', origem='sqlite')),
+        },
+    }
+    relatorio['etapas_p95_ms'] = {
+        etapa: percentil_histograma(antes, depois, etapa, 0.95)
+        for etapa in ('requisicao', 'cache', 'historico', 'busca_web', 'duckduckgo', 'gemini', 'salvar_mensagem')
+    }
+
+    print(f"{args.usuarios} usuários virtuais, {args.duracao:.0f}s de medição após {args.aquecimento:.0f}s de aquecimento, "
+          f"pausa média {args.pausa}s ({url})")
+    if not args.url:
+        print(f"Gemini falso: {args.latencia_gemini * 1000:.0f} ms + ~{args.variacao_gemini * 1000:.0f} ms, "
+              f"{args.erro_gemini:.0%} de 503 | DuckDuckGo falso: {args.latencia_busca * 1000:.0f} ms + "
+              f"~{args.variacao_busca * 1000:.0f} ms, {args.erro_busca:.0%} de 503")
+    print(f"\n{relatorio['requisicoes']} requisições, {relatorio['requisicoes_por_segundo']} req/s\n")
+    print(f"{'cenário':<13} {'req':>6} {'erros':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9}")
+    for cenario, dados in relatorio['cenarios'].items():
+        print(f"{cenario:<13} {dados['requisicoes']:>6} {dados['erros_http']:>6} {dados['p50_ms']:>9.0f} "
+              f"{dados['p95_ms']:>9.0f} {dados['p99_ms']:>9.0f} {dados['max_ms']:>9.0f}")
+    print(f"\nRespostas por origem: {relatorio['respostas_por_origem']}")
+    print(f"Taxa de acerto dos caches: {relatorio['taxa_acerto_caches']}")
+    print(f"Chamadas externas: {relatorio['chamadas_externas']}")
+    print(f"SQLite: {relatorio['sqlite']}")
+    print(f"p95 por etapa no servidor (ms, limite do intervalo): {relatorio['etapas_p95_ms']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
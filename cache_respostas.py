@@ -0,0 +1,345 @@
+import atexit
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheRespostas:
+    """Cache em memória com expulsão LRU, validade (TTL) por entrada e limite de tamanho.
+
+    O limite é aplicado tanto em número de entradas quanto em bytes (texto em UTF-8).
+    Todas as operações são protegidas por um lock, já que o servidor Flask atende
+    requisições em várias threads.
+    """
+
+    def __init__(self, max_entradas=100, max_bytes=5 * 1024 * 1024, ttl_padrao=24 * 3600):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl_padrao = ttl_padrao
+
+        # chave -> (valor, expira_em, tamanho_em_bytes); ordem = uso mais recente por último
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.acertos = 0
+        self.falhas = 0
+        self.expulsoes = 0
+        self.expiradas = 0
+
+    @staticmethod
+    def _tamanho(chave, valor):
+        return len(chave.encode('utf-8')) + len(valor.encode('utf-8'))
+
+    def _remover(self, chave):
+        _, _, tamanho = self._entradas.pop(chave)
+        self._bytes -= tamanho
+
+    def obter(self, chave):
+        """Retorna o valor armazenado ou None se ausente ou expirado"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+
+            valor, expira_em, _ = entrada
+            if expira_em <= time.monotonic():
+                self._remover(chave)
+                self.expiradas += 1
+                self.falhas += 1
+                return None
+
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def definir(self, chave, valor, ttl=None):
+        """Armazena um valor, expulsando as entradas menos usadas se necessário"""
+        tamanho = self._tamanho(chave, valor)
+        if tamanho > self.max_bytes:
+            return False
+
+        expira_em = time.monotonic() + (ttl if ttl is not None else self.ttl_padrao)
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+
+            self._entradas[chave] = (valor, expira_em, tamanho)
+            self._bytes += tamanho
+
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                chave_antiga = next(iter(self._entradas))
+                self._remover(chave_antiga)
+                self.expulsoes += 1
+            return True
+
+    def remover(self, chave):
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def __contains__(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            return entrada is not None and entrada[1] > time.monotonic()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+
+    def estatisticas(self):
+        """Retorna contadores de uso e ocupação do cache"""
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'expulsoes': self.expulsoes,
+                'expiradas': self.expiradas,
+                'taxa_acerto': self.acertos / total if total else 0.0,
+            }
+
+
+class CacheBuscaWeb(CacheRespostas):
+    """Cache dos resultados de busca na web (listas de (título, trecho, fonte)).
+
+    Buscas vazias ou com falha também são guardadas (cache negativo), com validade
+    menor, para não repetir a consulta a cada pergunta durante uma instabilidade do
+    buscador. Cada entrada guarda quanto tempo a busca original levou, o que permite
+    estimar o tempo economizado pelos acertos.
+    """
+
+    def __init__(self, max_entradas=500, max_bytes=2 * 1024 * 1024, ttl_padrao=600, ttl_negativo=60):
+        super().__init__(max_entradas=max_entradas, max_bytes=max_bytes, ttl_padrao=ttl_padrao)
+        self.ttl_negativo = ttl_negativo
+        self.acertos_negativos = 0
+        self.tempo_economizado = 0.0
+
+    @staticmethod
+    def _tamanho(chave, valor):
+        itens, _ = valor
+        return len(chave.encode('utf-8')) + sum(len(texto.encode('utf-8')) for item in itens for texto in item)
+
+    def obter_busca(self, chave):
+        """Retorna a lista de resultados guardada (possivelmente vazia) ou None se ausente"""
+        entrada = self.obter(chave)
+        if entrada is None:
+            return None
+
+        itens, duracao = entrada
+        with self._lock:
+            self.tempo_economizado += duracao
+            if not itens:
+                self.acertos_negativos += 1
+        return itens
+
+    def definir_busca(self, chave, itens, duracao):
+        """Guarda os resultados; listas vazias usam a validade do cache negativo"""
+        ttl = self.ttl_padrao if itens else self.ttl_negativo
+        return self.definir(chave, (list(itens), duracao), ttl=ttl)
+
+    def estatisticas(self):
+        estatisticas = super().estatisticas()
+        with self._lock:
+            estatisticas.update({
+                'ttl': self.ttl_padrao,
+                'ttl_negativo': self.ttl_negativo,
+                'acertos_negativos': self.acertos_negativos,
+                'tempo_economizado_s': round(self.tempo_economizado, 3),
+            })
+        return estatisticas
+
+
+class CachePersistente:
+    """Camada persistente do cache de respostas, em um arquivo SQLite no modo WAL.
+
+    É compartilhada entre os workers do servidor e sobrevive a reinícios. As chaves
+    combinam a pergunta normalizada com um hash de versão (modelo + prompt), de modo
+    que mudar o prompt invalida as respostas antigas. As gravações são feitas em
+    segundo plano (write-behind), agrupadas em transações, para não atrasar a resposta.
+    """
+
+    def __init__(self, caminho, versao, intervalo_gravacao=0.5, tamanho_lote=100):
+        self.caminho = caminho
+        self.versao = versao
+        self.intervalo_gravacao = intervalo_gravacao
+        self.tamanho_lote = tamanho_lote
+
+        self._local = threading.local()
+        self._fila = queue.Queue()
+        self._encerrar = threading.Event()
+
+        self.acertos = 0
+        self.falhas = 0
+        self.gravacoes = 0
+
+        conn = self._conexao()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_respostas (
+            chave TEXT NOT NULL,
+            versao TEXT NOT NULL,
+            resposta TEXT NOT NULL,
+            criado_em REAL NOT NULL,
+            expira_em REAL NOT NULL,
+            acessos INTEGER DEFAULT 0,
+            PRIMARY KEY (chave, versao)
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_respostas_acessos ON cache_respostas (versao, acessos)')
+        conn.commit()
+
+        self._thread = threading.Thread(target=self._gravar_em_segundo_plano, name='cache-persistente', daemon=True)
+        self._thread.start()
+        atexit.register(self.encerrar)
+
+    def _conexao(self):
+        """Retorna a conexão SQLite da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def calcular_versao(*partes):
+        """Gera o hash de versão a partir de modelo, prompt e demais parâmetros"""
+        return hashlib.sha256('\x00'.join(str(p) for p in partes).encode('utf-8')).hexdigest()[:16]
+
+    def obter(self, chave):
+        """Retorna (resposta, segundos_restantes) ou None se ausente ou expirada"""
+        try:
+            linha = self._conexao().execute(
+                "SELECT resposta, expira_em FROM cache_respostas WHERE chave = ? AND versao = ?",
+                (chave, self.versao)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar cache persistente: {e}")
+            return None
+
+        agora = time.time()
+        if linha is None or linha[1] <= agora:
+            self.falhas += 1
+            return None
+
+        self.acertos += 1
+        self._fila.put(('acesso', chave))
+        return linha[0], linha[1] - agora
+
+    def definir(self, chave, resposta, ttl):
+        """Agenda a gravação da resposta (write-behind)"""
+        self._fila.put(('gravar', (chave, resposta, ttl, time.time())))
+
+    def mais_acessadas(self, limite):
+        """Retorna as respostas válidas mais acessadas como (chave, resposta, segundos_restantes)"""
+        agora = time.time()
+        try:
+            linhas = self._conexao().execute(
+                "SELECT chave, resposta, expira_em FROM cache_respostas "
+                "WHERE versao = ? AND expira_em > ? ORDER BY acessos DESC LIMIT ?",
+                (self.versao, agora, limite)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar cache persistente: {e}")
+            return []
+        return [(chave, resposta, expira_em - agora) for chave, resposta, expira_em in linhas]
+
+    def _gravar_lote(self, lote):
+        gravacoes = []
+        acessos = []
+        for tipo, dados in lote:
+            if tipo == 'gravar':
+                chave, resposta, ttl, criado_em = dados
+                gravacoes.append((chave, self.versao, resposta, criado_em, criado_em + ttl))
+            else:
+                acessos.append((dados, self.versao))
+
+        conn = self._conexao()
+        try:
+            with conn:
+                if gravacoes:
+                    conn.executemany(
+                        "INSERT INTO cache_respostas (chave, versao, resposta, criado_em, expira_em) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (chave, versao) DO UPDATE SET resposta = excluded.resposta, "
+                        "criado_em = excluded.criado_em, expira_em = excluded.expira_em",
+                        gravacoes
+                    )
+                if acessos:
+                    conn.executemany(
+                        "UPDATE cache_respostas SET acessos = acessos + 1 WHERE chave = ? AND versao = ?",
+                        acessos
+                    )
+            self.gravacoes += len(gravacoes)
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar cache persistente: {e}")
+
+    def _coletar_lote(self, espera):
+        lote = []
+        try:
+            lote.append(self._fila.get(timeout=espera))
+            while len(lote) < self.tamanho_lote:
+                lote.append(self._fila.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _gravar_em_segundo_plano(self):
+        ultima_limpeza = time.time()
+        while not self._encerrar.is_set():
+            lote = self._coletar_lote(self.intervalo_gravacao)
+            if lote:
+                self._gravar_lote(lote)
+                for _ in lote:
+                    self._fila.task_done()
+
+            # Remover entradas expiradas de hora em hora
+            if time.time() - ultima_limpeza > 3600:
+                try:
+                    with self._conexao() as conn:
+                        conn.execute("DELETE FROM cache_respostas WHERE expira_em <= ?", (time.time(),))
+                except sqlite3.Error as e:
+                    print(f"Erro ao limpar cache persistente: {e}")
+                ultima_limpeza = time.time()
+
+    def descarregar(self):
+        """Aguarda até que todas as gravações pendentes tenham sido feitas"""
+        self._fila.join()
+
+    def encerrar(self):
+        """Grava o que estiver pendente e para a thread de gravação"""
+        if self._encerrar.is_set():
+            return
+        self._encerrar.set()
+        self._thread.join(timeout=5)
+        lote = self._coletar_lote(0)
+        while lote:
+            self._gravar_lote(lote)
+            for _ in lote:
+                self._fila.task_done()
+            lote = self._coletar_lote(0)
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'caminho': self.caminho,
+            'versao': self.versao,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'gravacoes': self.gravacoes,
+            'pendentes': self._fila.qsize(),
+            'taxa_acerto': self.acertos / total if total else 0.0,
+        }
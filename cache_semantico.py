@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+
+from embeddings import carregar_modelo
+
+
+class CacheSemantico:
+    """Cache de respostas que reconhece perguntas parecidas por similaridade de embeddings.
+
+    Os vetores das perguntas ficam numa matriz NumPy contígua (uma linha por pergunta,
+    já normalizada), de modo que a busca é um único produto matriz-vetor seguido de argmax.
+    O modelo do sentence-transformers só é carregado na primeira consulta (embeddings.py),
+    e é o mesmo usado pelo índice de legislação quando os nomes coincidem.
+    """
+
+    def __init__(self, nome_modelo='paraphrase-multilingual-MiniLM-L12-v2', limiar=0.9, capacidade=1000):
+        self.nome_modelo = nome_modelo
+        self.limiar = limiar
+        self.capacidade = capacidade
+        self.habilitado = True
+
+        self._modelo = None
+        self._lock = threading.Lock()
+
+        # Matriz de vetores alocada quando a dimensão do modelo é conhecida
+        self._vetores = None
+        self._perguntas = [None] * capacidade
+        self._respostas = [None] * capacidade
+        self._tamanho = 0
+        self._proxima_posicao = 0
+
+        # Contadores para ajuste do limiar
+        self.acertos = 0
+        self.falhas = 0
+
+    def _carregar_modelo(self):
+        """Carrega o modelo de embeddings sob demanda (importação pesada)"""
+        if self._modelo is not None or not self.habilitado:
+            return self._modelo
+
+        with self._lock:
+            if self._modelo is None and self.habilitado:
+                try:
+                    modelo = carregar_modelo(self.nome_modelo)
+                    dimensao = modelo.get_sentence_embedding_dimension()
+                    self._vetores = np.zeros((self.capacidade, dimensao), dtype=np.float32)
+                    self._modelo = modelo
+                except Exception as e:
+                    print(f"Cache semântico desabilitado: {e}")
+                    self.habilitado = False
+        return self._modelo
+
+    def embutir(self, texto):
+        """Gera o vetor normalizado (norma 1) de um texto; None se o cache estiver desabilitado"""
+        modelo = self._carregar_modelo()
+        if modelo is None:
+            return None
+        vetor = modelo.encode(texto, normalize_embeddings=True, convert_to_numpy=True)
+        return np.ascontiguousarray(vetor, dtype=np.float32)
+
+    def buscar(self, pergunta, exibir=False, vetor=None):
+        """Retorna a resposta de uma pergunta semelhante já respondida, ou None
+
+        `vetor`, se informado, é o embedding da pergunta já calculado com embutir(). Com
+        exibir=True (LOG_VERBOSE=1 no app), mostra a similaridade de cada acerto.
+        """
+        if not self.habilitado:
+            return None
+
+        if vetor is None:
+            vetor = self.embutir(pergunta)
+        if vetor is None:
+            return None
+
+        with self._lock:
+            if self._tamanho == 0:
+                self.falhas += 1
+                return None
+
+            # Com vetores normalizados, o produto escalar é a similaridade de cosseno
+            similaridades = self._vetores[:self._tamanho] @ vetor
+            indice = int(np.argmax(similaridades))
+            similaridade = float(similaridades[indice])
+
+            if similaridade >= self.limiar:
+                self.acertos += 1
+                if exibir:
+                    print(f"Resposta encontrada no cache semântico (similaridade {similaridade:.3f})")
+                return self._respostas[indice]
+
+            self.falhas += 1
+            return None
+
+    def adicionar(self, pergunta, resposta, vetor=None):
+        """Armazena a pergunta e sua resposta; ao atingir a capacidade, sobrescreve a mais antiga"""
+        if not self.habilitado:
+            return
+
+        if vetor is None:
+            vetor = self.embutir(pergunta)
+        if vetor is None:
+            return
+
+        with self._lock:
+            posicao = self._proxima_posicao
+            self._vetores[posicao] = vetor
+            self._perguntas[posicao] = pergunta
+            self._respostas[posicao] = resposta
+            self._proxima_posicao = (posicao + 1) % self.capacidade
+            self._tamanho = min(self._tamanho + 1, self.capacidade)
+
+    def estatisticas(self):
+        """Retorna contadores de acertos e falhas do cache semântico"""
+        total = self.acertos + self.falhas
+        return {
+            'habilitado': self.habilitado,
+            'modelo_carregado': self._modelo is not None,
+            'limiar': self.limiar,
+            'entradas': self._tamanho,
+            'capacidade': self.capacidade,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': self.acertos / total if total else 0.0,
+        }
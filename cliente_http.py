@@ -0,0 +1,154 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ClienteHTTP:
+    """Cliente HTTP compartilhado, com pool de conexões keep-alive por host.
+
+    Reaproveita conexões TCP/TLS entre requisições (Gemini, DuckDuckGo), aplica
+    timeouts separados de conexão e de leitura e contabiliza quantas requisições
+    reutilizaram uma conexão já aberta.
+    """
+
+    def __init__(self, pool_conexoes=10, pool_max=20, bloquear_pool=False,
+                 timeout_conexao=5, timeout_leitura=30, limites_por_host=None):
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+
+        self.sessao = requests.Session()
+        self._adaptadores = {}
+
+        # Adaptador padrão: pool_conexoes = quantos hosts manter em cache, pool_max = conexões por host
+        adaptador_padrao = HTTPAdapter(pool_connections=pool_conexoes, pool_maxsize=pool_max, pool_block=bloquear_pool)
+        self.sessao.mount('https://', adaptador_padrao)
+        self.sessao.mount('http://', adaptador_padrao)
+
+        # Limites específicos por host, ex.: {'https://html.duckduckgo.com': 4}
+        for prefixo, maximo in (limites_por_host or {}).items():
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=maximo, pool_block=bloquear_pool)
+            self.sessao.mount(prefixo, adaptador)
+
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _registrar(self, url, erro=False):
+        """Atualiza as métricas de reuso a partir dos contadores do pool do urllib3"""
+        partes = urlsplit(url)
+        host = f"{partes.scheme}://{partes.netloc}"
+        conexoes = None
+        try:
+            # Somar as conexões abertas pelos pools do host (a chave do pool inclui parâmetros de TLS)
+            pools = self.sessao.get_adapter(url).poolmanager.pools
+            conexoes = sum(
+                pools[chave].num_connections for chave in pools.keys()
+                if chave.key_host == partes.hostname and chave.key_scheme == partes.scheme
+            )
+        except Exception:
+            pass
+
+        with self._lock:
+            metricas = self._hosts.setdefault(host, {'requisicoes': 0, 'erros': 0, 'conexoes_novas': 0})
+            metricas['requisicoes'] += 1
+            if erro:
+                metricas['erros'] += 1
+            if conexoes is not None:
+                # Pools descartados pelo urllib3 zeram seus contadores; manter o maior valor visto
+                metricas['conexoes_novas'] = max(metricas['conexoes_novas'], conexoes)
+
+    def requisitar(self, metodo, url, timeout_leitura=None, **kwargs):
+        """Faz a requisição pelo pool compartilhado com timeouts (conexão, leitura)"""
+        kwargs.setdefault('timeout', (self.timeout_conexao, timeout_leitura or self.timeout_leitura))
+        try:
+            resposta = self.sessao.request(metodo, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self._registrar(url, erro=True)
+            raise
+        self._registrar(url)
+        return resposta
+
+    def get(self, url, **kwargs):
+        return self.requisitar('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.requisitar('POST', url, **kwargs)
+
+    def estatisticas(self):
+        """Retorna, por host, requisições feitas, conexões abertas e taxa de reuso"""
+        with self._lock:
+            hosts = {}
+            for host, metricas in self._hosts.items():
+                reutilizadas = max(metricas['requisicoes'] - metricas['conexoes_novas'], 0)
+                hosts[host] = dict(
+                    metricas,
+                    reutilizadas=reutilizadas,
+                    taxa_reuso=reutilizadas / metricas['requisicoes'] if metricas['requisicoes'] else 0.0
+                )
+            return {
+                'timeout_conexao': self.timeout_conexao,
+                'timeout_leitura': self.timeout_leitura,
+                'hosts': hosts,
+            }
+
+    def fechar(self):
+        self.sessao.close()
+
+
+class ClienteHTTPAsync:
+    """Equivalente assíncrono de ClienteHTTP, baseado em httpx.AsyncClient.
+
+    Usado pelo modo ASGI. As exceções do httpx são convertidas nas de requests,
+    para que o código que chama trate os dois clientes da mesma forma.
+    """
+
+    def __init__(self, max_conexoes=100, max_keepalive=20, timeout_conexao=5, timeout_leitura=30):
+        import httpx
+
+        self._httpx = httpx
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.cliente = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_keepalive),
+            timeout=httpx.Timeout(timeout_leitura, connect=timeout_conexao),
+        )
+
+        self._hosts = {}
+
+    def _registrar(self, url, erro=False):
+        partes = urlsplit(url)
+        host = f"{partes.scheme}://{partes.netloc}"
+        metricas = self._hosts.setdefault(host, {'requisicoes': 0, 'erros': 0})
+        metricas['requisicoes'] += 1
+        if erro:
+            metricas['erros'] += 1
+
+    async def requisitar(self, metodo, url, timeout_leitura=None, **kwargs):
+        timeout = self._httpx.Timeout(timeout_leitura or self.timeout_leitura, connect=self.timeout_conexao)
+        try:
+            resposta = await self.cliente.request(metodo, url, timeout=timeout, **kwargs)
+        except self._httpx.TimeoutException as e:
+            self._registrar(url, erro=True)
+            raise requests.exceptions.Timeout(str(e)) from e
+        except self._httpx.TransportError as e:
+            self._registrar(url, erro=True)
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        self._registrar(url)
+        return resposta
+
+    async def get(self, url, **kwargs):
+        return await self.requisitar('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.requisitar('POST', url, **kwargs)
+
+    def estatisticas(self):
+        return {
+            'timeout_conexao': self.timeout_conexao,
+            'timeout_leitura': self.timeout_leitura,
+            'hosts': {host: dict(metricas) for host, metricas in self._hosts.items()},
+        }
+
+    async def fechar(self):
+        await self.cliente.aclose()
@@ -0,0 +1,115 @@
+"""Coalescência de chamadas idênticas em andamento (single-flight).
+
+Quando várias requisições pedem a mesma coisa ao mesmo tempo (por exemplo, a mesma
+pergunta sobre uma decisão recente do STF), só a primeira faz a chamada externa; as
+demais esperam por ela e recebem o mesmo resultado, inclusive uma exceção. Assim que
+a chamada termina, a chave é liberada: a próxima requisição igual já encontra a
+resposta no cache ou, se ela não foi guardada, faz uma nova chamada.
+
+A chave precisa incluir tudo o que muda o resultado: a chamada ao Gemini usa a
+pergunta e um hash do histórico enviado no prompt (ver AdvogadoBot.chave_coalescencia),
+para que um usuário nunca receba a resposta montada com a conversa de outro.
+"""
+import asyncio
+import threading
+
+
+class _Chamada:
+    __slots__ = ('concluida', 'resultado', 'erro', 'seguidores')
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.seguidores = 0
+
+
+class VooUnico:
+    """Agrupa chamadas concorrentes com a mesma chave em uma única execução
+
+    Funciona com threads (executar, ou entrar/concluir para geradores) e dentro de um
+    event loop (executar_async). As duas formas não compartilham chamadas entre si,
+    apenas os contadores.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self._em_andamento_async = {}
+
+        self.chamadas = 0
+        self.coalescidas = 0
+        self.maximo_seguidores = 0
+
+    def entrar(self, chave):
+        """Retorna (chamada, lider). Só o líder executa; ele deve chamar concluir() em seguida"""
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            if chamada is not None:
+                chamada.seguidores += 1
+                self.coalescidas += 1
+                self.maximo_seguidores = max(self.maximo_seguidores, chamada.seguidores)
+                return chamada, False
+            chamada = self._em_andamento[chave] = _Chamada()
+            self.chamadas += 1
+            return chamada, True
+
+    def concluir(self, chave, chamada, resultado=None, erro=None):
+        """Libera a chave e entrega o resultado (ou a exceção) aos seguidores"""
+        with self._lock:
+            if self._em_andamento.get(chave) is chamada:
+                del self._em_andamento[chave]
+        chamada.resultado = resultado
+        chamada.erro = erro
+        chamada.concluida.set()
+
+    @staticmethod
+    def aguardar(chamada):
+        chamada.concluida.wait()
+        if chamada.erro is not None:
+            raise chamada.erro
+        return chamada.resultado
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        """Executa funcao(*args, **kwargs) ou espera a execução já em andamento com a mesma chave"""
+        chamada, lider = self.entrar(chave)
+        if not lider:
+            return self.aguardar(chamada)
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException as e:
+            self.concluir(chave, chamada, erro=e)
+            raise
+        self.concluir(chave, chamada, resultado)
+        return resultado
+
+    async def executar_async(self, chave, fabrica):
+        """Versão para o event loop: `fabrica()` cria a corrotina, executada uma vez por chave
+
+        A corrotina roda em uma tarefa própria, de modo que o cancelamento de uma das
+        requisições (cliente desconectado) não cancela a chamada das demais.
+        """
+        tarefa = self._em_andamento_async.get(chave)
+        with self._lock:
+            if tarefa is None:
+                tarefa = asyncio.ensure_future(fabrica())
+                self._em_andamento_async[chave] = tarefa
+                tarefa.add_done_callback(lambda _: self._liberar_async(chave, tarefa))
+                self.chamadas += 1
+            else:
+                self.coalescidas += 1
+        return await asyncio.shield(tarefa)
+
+    def _liberar_async(self, chave, tarefa):
+        if self._em_andamento_async.get(chave) is tarefa:
+            del self._em_andamento_async[chave]
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'chamadas': self.chamadas,
+                'coalescidas': self.coalescidas,
+                'em_andamento': len(self._em_andamento) + len(self._em_andamento_async),
+                'maximo_seguidores': self.maximo_seguidores,
+            }
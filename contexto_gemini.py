@@ -0,0 +1,105 @@
+import datetime
+import threading
+import time
+
+
+class ContextoCacheGemini:
+    """Mantém no servidor do Gemini um contexto em cache (cachedContents) com a persona do bot.
+
+    Em vez de reenviar o prompt de sistema a cada pergunta, as requisições passam apenas
+    o nome do contexto em cache. O contexto é recriado pouco antes de expirar. Se a
+    criação falhar (por exemplo, quando o modelo exige um número mínimo de tokens maior
+    que o da persona), obter_nome() retorna None por um tempo e o chamador volta a enviar
+    a persona em systemInstruction.
+    """
+
+    def __init__(self, http, url_base, modelo, ler_chave_api, texto_sistema, ttl=3600, margem_renovacao=300,
+                 espera_apos_falha=600):
+        self.http = http
+        self.url_base = url_base
+        self.modelo = modelo
+        self.ler_chave_api = ler_chave_api
+        self.texto_sistema = texto_sistema
+        self.ttl = ttl
+        self.margem_renovacao = margem_renovacao
+        self.espera_apos_falha = espera_apos_falha
+
+        self._lock = threading.Lock()
+        self._nome = None
+        self._expira_em = 0.0
+        self._proxima_tentativa = 0.0
+
+        self.criacoes = 0
+        self.falhas = 0
+        self.reusos = 0
+
+    def _criar(self):
+        chave_api = self.ler_chave_api()
+        if not chave_api:
+            return None
+
+        corpo = {
+            "model": f"models/{self.modelo}",
+            "systemInstruction": {"parts": [{"text": self.texto_sistema}]},
+            "ttl": f"{self.ttl}s",
+        }
+        resposta = self.http.post(
+            f"{self.url_base}/cachedContents",
+            headers={'Content-Type': 'application/json'},
+            params={'key': chave_api},
+            json=corpo,
+            timeout_leitura=30
+        )
+        if resposta.status_code != 200:
+            print(f"Não foi possível criar o contexto em cache do Gemini: {resposta.status_code} - {resposta.text}")
+            return None
+
+        dados = resposta.json()
+        expira_em = time.time() + self.ttl
+        if dados.get('expireTime'):
+            try:
+                expira_em = datetime.datetime.fromisoformat(dados['expireTime'].replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                pass
+        return dados.get('name'), expira_em
+
+    def obter_nome(self):
+        """Retorna o nome do contexto em cache válido (cachedContents/...) ou None"""
+        agora = time.time()
+        if self._nome and agora < self._expira_em - self.margem_renovacao:
+            self.reusos += 1
+            return self._nome
+
+        with self._lock:
+            agora = time.time()
+            if self._nome and agora < self._expira_em - self.margem_renovacao:
+                self.reusos += 1
+                return self._nome
+            if agora < self._proxima_tentativa:
+                return None
+
+            try:
+                criado = self._criar()
+            except Exception as e:
+                print(f"Erro ao criar o contexto em cache do Gemini: {e}")
+                criado = None
+
+            if not criado or not criado[0]:
+                self.falhas += 1
+                self._nome = None
+                self._proxima_tentativa = agora + self.espera_apos_falha
+                return None
+
+            self._nome, self._expira_em = criado
+            self.criacoes += 1
+            print(f"Contexto em cache do Gemini criado: {self._nome}")
+            return self._nome
+
+    def estatisticas(self):
+        return {
+            'nome': self._nome,
+            'expira_em': self._expira_em or None,
+            'criacoes': self.criacoes,
+            'falhas': self.falhas,
+            'reusos': self.reusos,
+        }
@@ -0,0 +1,32 @@
+"""Modelos de embeddings do sentence-transformers, carregados uma única vez por processo.
+
+O cache semântico e o índice de legislação usam, por padrão, o mesmo modelo: cada
+modelo é carregado na primeira vez em que é pedido (a importação do
+sentence-transformers e do PyTorch leva alguns segundos e ocupa centenas de MB) e
+compartilhado dali em diante.
+"""
+import threading
+
+import numpy as np
+
+_modelos = {}
+_lock = threading.Lock()
+
+
+def carregar_modelo(nome_modelo):
+    """Retorna o SentenceTransformer `nome_modelo` (nome no Hugging Face ou pasta local), carregando-o na primeira chamada"""
+    modelo = _modelos.get(nome_modelo)
+    if modelo is not None:
+        return modelo
+    with _lock:
+        if nome_modelo not in _modelos:
+            from sentence_transformers import SentenceTransformer
+            _modelos[nome_modelo] = SentenceTransformer(nome_modelo)
+            print(f"Modelo de embeddings carregado: {nome_modelo}")
+        return _modelos[nome_modelo]
+
+
+def embutir(modelo, textos, tamanho_lote=32):
+    """Vetores normalizados (norma 1) dos textos, em uma matriz float32 contígua com uma linha por texto"""
+    vetores = modelo.encode(textos, batch_size=tamanho_lote, normalize_embeddings=True, convert_to_numpy=True)
+    return np.ascontiguousarray(vetores, dtype=np.float32)
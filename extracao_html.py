@@ -0,0 +1,82 @@
+"""Extração dos resultados da página HTML de busca do DuckDuckGo.
+
+Há dois extratores com a mesma saída, uma lista de (título, trecho, fonte):
+
+- extrair_resultados_lxml: alimenta o HTML em blocos a um parser incremental do
+  lxml e para assim que os primeiros N elementos .result estiverem completos, sem
+  montar a árvore da página inteira;
+- extrair_resultados_bs4: o caminho original com BeautifulSoup e seletores CSS,
+  mantido como alternativa caso o primeiro falhe.
+
+O lxml e o BeautifulSoup só são importados na primeira extração (ou antes do fork
+dos workers, em app.precarregar).
+"""
+TAMANHO_BLOCO = 16 * 1024
+
+
+def _tem_classe(elemento, classe):
+    return classe in (elemento.get('class') or '').split()
+
+
+def _texto(elemento):
+    # Mesmo resultado de BeautifulSoup.get_text(strip=True)
+    return ''.join(parte.strip() for parte in elemento.itertext())
+
+
+def _primeiro_com_classe(elemento, classe):
+    for descendente in elemento.iter():
+        if descendente is not elemento and _tem_classe(descendente, classe):
+            return descendente
+    return None
+
+
+def extrair_resultados_lxml(html, limite=3):
+    """Extrai até `limite` resultados com o parser incremental do lxml"""
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=('end',))
+    resultados = []
+    encontrados = 0
+
+    for inicio in range(0, len(html), TAMANHO_BLOCO):
+        parser.feed(html[inicio:inicio + TAMANHO_BLOCO])
+        for _, elemento in parser.read_events():
+            if not isinstance(elemento.tag, str) or not _tem_classe(elemento, 'result'):
+                continue
+
+            encontrados += 1
+            titulo_elemento = _primeiro_com_classe(elemento, 'result__title')
+            snippet_elemento = _primeiro_com_classe(elemento, 'result__snippet')
+            url_elemento = _primeiro_com_classe(elemento, 'result__url')
+
+            if titulo_elemento is not None and snippet_elemento is not None:
+                url = _texto(url_elemento) if url_elemento is not None else "URL não disponível"
+                resultados.append((_texto(titulo_elemento), _texto(snippet_elemento), url))
+
+            if encontrados >= limite:
+                return resultados
+
+    parser.close()
+    return resultados
+
+
+def extrair_resultados_bs4(html, limite=3):
+    """Extrai até `limite` resultados montando a árvore completa com BeautifulSoup"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'lxml')
+    resultados = []
+
+    for resultado in soup.select('.result')[:limite]:
+        titulo_elemento = resultado.select_one('.result__title')
+        snippet_elemento = resultado.select_one('.result__snippet')
+        url_elemento = resultado.select_one('.result__url')
+
+        if titulo_elemento and snippet_elemento:
+            titulo = titulo_elemento.get_text(strip=True)
+            snippet = snippet_elemento.get_text(strip=True)
+            url = url_elemento.get_text(strip=True) if url_elemento else "URL não disponível"
+
+            resultados.append((titulo, snippet, url))
+
+    return resultados
@@ -0,0 +1,259 @@
+"""Fila de trabalhos durável em SQLite, com deduplicação e ordem por grupo.
+
+Usada para processar as mensagens do WhatsApp fora da requisição do webhook: o
+webhook só grava a mensagem na fila e responde na hora, e workers em segundo plano
+fazem o trabalho demorado (Gemini, busca na web, envio da resposta).
+
+- Cada trabalho tem uma chave única (o id da mensagem no WhatsApp): a mesma
+  mensagem entregue de novo pelo webhook é ignorada enquanto o registro dela
+  estiver na fila, inclusive depois de processada (até `retencao` segundos).
+- Trabalhos do mesmo grupo (o mesmo usuário) são processados um de cada vez e na
+  ordem de chegada, para que as respostas e o histórico não se misturem.
+- Um worker reserva o trabalho por `prazo_reserva` segundos. Se o processo cair no
+  meio, o trabalho volta para a fila quando o prazo vence; se já tiver usado as
+  `max_tentativas`, fica como 'falhou' (um trabalho que derruba o worker não trava o
+  grupo para sempre).
+- Falhas são repetidas com backoff exponencial até `max_tentativas`; depois o
+  trabalho fica como 'falhou', com o último erro.
+
+Como a fila fica no SQLite (modo WAL, reservas em transações BEGIN IMMEDIATE),
+vários processos podem consumir o mesmo arquivo sem processar um trabalho duas vezes.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+CONCLUIDO = 'concluido'
+FALHOU = 'falhou'
+
+
+class FilaTrabalhos:
+    """Fila de trabalhos em um arquivo SQLite, segura entre threads e processos"""
+
+    def __init__(self, caminho, max_tentativas=5, atraso_inicial=2.0, prazo_reserva=300.0,
+                 retencao=7 * 24 * 3600, busy_timeout_ms=5000, amostras_atraso=1000):
+        self.caminho = caminho
+        self.max_tentativas = max_tentativas
+        self.atraso_inicial = atraso_inicial
+        self.prazo_reserva = prazo_reserva
+        self.retencao = retencao
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        # Acordada a cada trabalho novo, para que os workers não dependam só do intervalo de consulta
+        self._novos = threading.Condition()
+        self._lock = threading.Lock()
+        # Atraso (segundos) entre a chegada e a conclusão dos últimos trabalhos deste processo
+        self._atrasos = deque(maxlen=amostras_atraso)
+
+        self.recebidos = 0
+        self.duplicados = 0
+        self.concluidos = 0
+        self.novas_tentativas = 0
+        self.falhas_definitivas = 0
+
+        conn = self._conexao()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS trabalhos (
+            id INTEGER PRIMARY KEY,
+            chave TEXT NOT NULL UNIQUE,
+            grupo TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            criado_em REAL NOT NULL,
+            disponivel_em REAL NOT NULL,
+            reservado_ate REAL,
+            concluido_em REAL,
+            erro TEXT
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trabalhos_estado ON trabalhos (estado, disponivel_em)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trabalhos_grupo ON trabalhos (grupo, estado)')
+        conn.commit()
+
+    def _conexao(self):
+        """Retorna a conexão SQLite da thread atual, em modo de autocommit (transações explícitas)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    def enfileirar(self, trabalhos):
+        """Grava uma lista de (chave, grupo, dados) em uma só transação
+
+        Returns:
+            list: as chaves realmente enfileiradas (as repetidas são ignoradas)
+        """
+        agora = time.time()
+        novos = []
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for chave, grupo, dados in trabalhos:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO trabalhos (chave, grupo, dados, criado_em, disponivel_em) VALUES (?, ?, ?, ?, ?)",
+                    (chave, grupo, json.dumps(dados, ensure_ascii=False), agora, agora)
+                )
+                if cursor.rowcount:
+                    novos.append(chave)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self.recebidos += len(novos)
+            self.duplicados += len(trabalhos) - len(novos)
+        if novos:
+            with self._novos:
+                self._novos.notify(len(novos))
+        return novos
+
+    def reservar(self):
+        """Reserva o próximo trabalho disponível; retorna (id, chave, grupo, dados, tentativas) ou None
+
+        Só entra um trabalho cujo grupo não tenha outro mais antigo ainda pendente ou
+        em processamento. Reservas vencidas (worker que caiu) voltam antes para a fila,
+        ou ficam como 'falhou' se já esgotaram as tentativas.
+        """
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            esgotados = conn.execute(
+                "UPDATE trabalhos SET estado = ?, concluido_em = ?, reservado_ate = NULL, erro = ? "
+                "WHERE estado = ? AND reservado_ate < ? AND tentativas >= ?",
+                (FALHOU, agora, 'prazo de reserva vencido na última tentativa (worker travou ou caiu)',
+                 PROCESSANDO, agora, self.max_tentativas)
+            ).rowcount
+            conn.execute(
+                "UPDATE trabalhos SET estado = ?, disponivel_em = ? WHERE estado = ? AND reservado_ate < ?",
+                (PENDENTE, agora, PROCESSANDO, agora)
+            )
+            linha = conn.execute('''
+                SELECT id, chave, grupo, dados, tentativas FROM trabalhos AS t
+                WHERE estado = ? AND disponivel_em <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM trabalhos AS anterior
+                      WHERE anterior.grupo = t.grupo AND anterior.id < t.id AND anterior.estado IN (?, ?)
+                  )
+                ORDER BY id LIMIT 1
+            ''', (PENDENTE, agora, PENDENTE, PROCESSANDO)).fetchone()
+            if linha is not None:
+                conn.execute(
+                    "UPDATE trabalhos SET estado = ?, tentativas = tentativas + 1, reservado_ate = ? WHERE id = ?",
+                    (PROCESSANDO, agora + self.prazo_reserva, linha[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if esgotados:
+            with self._lock:
+                self.falhas_definitivas += esgotados
+        if linha is None:
+            return None
+        id_trabalho, chave, grupo, dados, tentativas = linha
+        return id_trabalho, chave, grupo, json.loads(dados), tentativas + 1
+
+    def aguardar(self, timeout):
+        """Dorme até `timeout` segundos ou até um novo trabalho ser enfileirado neste processo"""
+        with self._novos:
+            self._novos.wait(timeout)
+
+    def acordar_todos(self):
+        with self._novos:
+            self._novos.notify_all()
+
+    def concluir(self, id_trabalho):
+        agora = time.time()
+        conn = self._conexao()
+        linha = conn.execute("SELECT criado_em FROM trabalhos WHERE id = ?", (id_trabalho,)).fetchone()
+        conn.execute(
+            "UPDATE trabalhos SET estado = ?, concluido_em = ?, reservado_ate = NULL, erro = NULL WHERE id = ?",
+            (CONCLUIDO, agora, id_trabalho)
+        )
+        with self._lock:
+            self.concluidos += 1
+            if linha is not None:
+                self._atrasos.append(agora - linha[0])
+
+    def falhar(self, id_trabalho, tentativas, erro, dados=None):
+        """Registra uma falha: o trabalho volta para a fila com backoff ou, na última tentativa, fica como 'falhou'
+
+        `dados`, se informado, substitui os dados do trabalho (por exemplo, para guardar
+        um resultado parcial que a próxima tentativa não precisa refazer).
+        """
+        agora = time.time()
+        conn = self._conexao()
+        if dados is not None:
+            conn.execute("UPDATE trabalhos SET dados = ? WHERE id = ?", (json.dumps(dados, ensure_ascii=False), id_trabalho))
+        if tentativas >= self.max_tentativas:
+            conn.execute(
+                "UPDATE trabalhos SET estado = ?, concluido_em = ?, reservado_ate = NULL, erro = ? WHERE id = ?",
+                (FALHOU, agora, str(erro), id_trabalho)
+            )
+            with self._lock:
+                self.falhas_definitivas += 1
+            return False
+
+        espera = self.atraso_inicial * 2 ** (tentativas - 1)
+        conn.execute(
+            "UPDATE trabalhos SET estado = ?, disponivel_em = ?, reservado_ate = NULL, erro = ? WHERE id = ?",
+            (PENDENTE, agora + espera, str(erro), id_trabalho)
+        )
+        with self._lock:
+            self.novas_tentativas += 1
+        return True
+
+    def limpar(self):
+        """Apaga os trabalhos encerrados há mais de `retencao` segundos; retorna quantos foram apagados"""
+        cursor = self._conexao().execute(
+            "DELETE FROM trabalhos WHERE estado IN (?, ?) AND concluido_em < ?",
+            (CONCLUIDO, FALHOU, time.time() - self.retencao)
+        )
+        return cursor.rowcount
+
+    def estatisticas(self):
+        agora = time.time()
+        conn = self._conexao()
+        por_estado = dict(conn.execute("SELECT estado, COUNT(*) FROM trabalhos GROUP BY estado").fetchall())
+        mais_antigo = conn.execute(
+            "SELECT MIN(criado_em) FROM trabalhos WHERE estado IN (?, ?)", (PENDENTE, PROCESSANDO)
+        ).fetchone()[0]
+
+        with self._lock:
+            atrasos = sorted(self._atrasos)
+            contadores = {
+                'recebidos': self.recebidos,
+                'duplicados': self.duplicados,
+                'concluidos': self.concluidos,
+                'novas_tentativas': self.novas_tentativas,
+                'falhas_definitivas': self.falhas_definitivas,
+            }
+
+        def percentil(fracao):
+            return round(atrasos[min(len(atrasos) - 1, int(len(atrasos) * fracao))] * 1000, 1) if atrasos else None
+
+        return {
+            'caminho': self.caminho,
+            'profundidade': por_estado.get(PENDENTE, 0),
+            'em_processamento': por_estado.get(PROCESSANDO, 0),
+            'concluidos_retidos': por_estado.get(CONCLUIDO, 0),
+            'falhas_retidas': por_estado.get(FALHOU, 0),
+            # Há quanto tempo o trabalho mais antigo ainda não terminado está esperando
+            'atraso_mais_antigo_s': round(agora - mais_antigo, 1) if mais_antigo is not None else 0.0,
+            # Da chegada no webhook até a resposta enviada (últimos trabalhos deste processo)
+            'atraso_processamento_ms': {'p50': percentil(0.5), 'p95': percentil(0.95), 'max': percentil(1.0)},
+            **contadores,
+        }
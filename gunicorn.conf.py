@@ -0,0 +1,36 @@
+"""Configuração do gunicorn para produção, com vários processos (lida automaticamente da pasta atual).
+
+    gunicorn app:app                                       # rotas Flask, com threads em cada worker
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker     # /api/chat assíncrona (ver asgi.py)
+
+O app é importado uma vez no processo principal (preload_app) e os dados só de
+leitura (classificador de intenções, respostas prontas, índice da legislação) são
+carregados antes do fork (app.precarregar), compartilhados entre os workers. Cada
+worker cria o próprio AdvogadoBot logo depois do fork, com suas conexões SQLite,
+threads e pools HTTP, antes de aceitar requisições.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+# Threads por worker no modo WSGI: as requisições passam a maior parte do tempo esperando o Gemini
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+if workers > 1:
+    # Sem roteamento fixo por usuário, mensagens seguidas caem em workers diferentes e a
+    # janela do histórico de cada um não veria as gravadas pelos outros: ler sempre do SQLite
+    os.environ.setdefault('HISTORY_WINDOW_USERS', '0')
+worker_class = 'gthread'
+preload_app = True
+# Uma pergunta pode esperar a cota e as novas tentativas do Gemini
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+
+
+def when_ready(server):
+    import app
+    app.precarregar()
+
+
+def post_fork(server, worker):
+    import app
+    app.obter_chatbot()
@@ -0,0 +1,206 @@
+"""Medição das etapas do chat e exportação no formato de texto do Prometheus.
+
+- medir(etapa): mede a duração de um trecho (normalização, caches, histórico,
+  busca na web, Gemini, gravação no histórico) e a acumula em um histograma por
+  etapa. Custa cerca de 1 µs, então pode ficar sempre ligado.
+- coletar_tempos(): dentro de uma requisição, também guarda as durações dessa
+  requisição, para que /api/chat as devolva quando o cliente pedir. A coleta vale
+  para a thread ou tarefa asyncio atual (contextvars); trabalhos enviados a um pool
+  de threads precisam levar o contexto junto (contextvars.copy_context().run).
+- contar(nome, **rotulos): contadores simples.
+- registrar_coletor(funcao): valores lidos na hora da exportação a partir das
+  estatísticas que os componentes já mantêm (caches, fila, disjuntor...).
+
+exportar() gera o texto servido em GET /metrics.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+# Limites dos intervalos dos histogramas, em segundos (de 0,5 ms a 30 s)
+LIMITES_PADRAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Durações (ms) por etapa da requisição em andamento, ou None fora de uma coleta
+_tempos_requisicao = contextvars.ContextVar('tempos_requisicao', default=None)
+
+
+class Histograma:
+    """Contagem de observações por intervalo, soma e total (seguro entre threads)"""
+
+    __slots__ = ('limites', 'contagens', 'soma', 'total', '_lock')
+
+    def __init__(self, limites=LIMITES_PADRAO):
+        self.limites = limites
+        # Um intervalo por limite e um último para valores acima do maior limite
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.contagens[indice] += 1
+            self.soma += valor
+            self.total += 1
+
+    def amostra(self):
+        """Retorna (contagens acumuladas por limite, soma, total)"""
+        with self._lock:
+            contagens, soma, total = list(self.contagens), self.soma, self.total
+        acumuladas = []
+        acumulado = 0
+        for contagem in contagens[:-1]:
+            acumulado += contagem
+            acumuladas.append(acumulado)
+        return acumuladas, soma, total
+
+
+class _Medicao:
+    __slots__ = ('instrumentacao', 'etapa', 'inicio')
+
+    def __init__(self, instrumentacao, etapa):
+        self.instrumentacao = instrumentacao
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        self.instrumentacao.registrar_duracao(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+class Instrumentacao:
+    """Histogramas de duração por etapa, contadores e coletores de métricas de um processo"""
+
+    def __init__(self, prefixo='advogado', limites=LIMITES_PADRAO):
+        self.prefixo = prefixo
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._duracoes = {}
+        self._contadores = {}
+        self._coletores = []
+
+    def medir(self, etapa):
+        """Context manager que registra a duração do bloco na etapa indicada"""
+        return _Medicao(self, etapa)
+
+    def registrar_duracao(self, etapa, segundos):
+        histograma = self._duracoes.get(etapa)
+        if histograma is None:
+            with self._lock:
+                histograma = self._duracoes.setdefault(etapa, Histograma(self.limites))
+        histograma.observar(segundos)
+
+        tempos = _tempos_requisicao.get()
+        if tempos is not None:
+            # Etapas repetidas na mesma requisição (ex.: várias buscas no DuckDuckGo) são somadas
+            tempos[etapa] = round(tempos.get(etapa, 0.0) + segundos * 1000, 3)
+
+    def contar(self, nome, quantidade=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + quantidade
+
+    def registrar_coletor(self, funcao):
+        """`funcao()` retorna uma lista de (nome, tipo, ajuda, [(rótulos, valor), ...]), lida a cada exportação"""
+        self._coletores.append(funcao)
+
+    @staticmethod
+    def coletar_tempos():
+        """Passa a guardar as durações das etapas da requisição atual; retorna (tempos, token)
+
+        Chame encerrar_coleta(token) no fim da requisição (threads de servidores WSGI são reaproveitadas).
+        """
+        tempos = {}
+        return tempos, _tempos_requisicao.set(tempos)
+
+    @staticmethod
+    def encerrar_coleta(token):
+        _tempos_requisicao.reset(token)
+
+    @staticmethod
+    def _rotulos(rotulos):
+        if not rotulos:
+            return ''
+        pares = ','.join(
+            '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for nome, valor in rotulos
+        )
+        return f'{{{pares}}}'
+
+    @staticmethod
+    def _valor(valor):
+        # Inteiros por extenso (contadores grandes não podem perder dígitos)
+        if isinstance(valor, (bool, int)):
+            return str(int(valor))
+        return repr(float(valor))
+
+    def exportar(self):
+        """Métricas no formato de texto do Prometheus (versão 0.0.4)"""
+        linhas = []
+        nome = f'{self.prefixo}_etapa_duracao_segundos'
+        linhas.append(f'# HELP {nome} Duração das etapas do atendimento de uma pergunta')
+        linhas.append(f'# TYPE {nome} histogram')
+        with self._lock:
+            duracoes = sorted(self._duracoes.items())
+            contadores = sorted(self._contadores.items())
+            coletores = list(self._coletores)
+        for etapa, histograma in duracoes:
+            acumuladas, soma, total = histograma.amostra()
+            for limite, contagem in zip(histograma.limites, acumuladas):
+                linhas.append(f'{nome}_bucket{{etapa="{etapa}",le="{limite:g}"}} {contagem}')
+            linhas.append(f'{nome}_bucket{{etapa="{etapa}",le="+Inf"}} {total}')
+            linhas.append(f'{nome}_sum{{etapa="{etapa}"}} {soma:.6f}')
+            linhas.append(f'{nome}_count{{etapa="{etapa}"}} {total}')
+
+        por_nome = {}
+        for (nome_contador, rotulos), valor in contadores:
+            por_nome.setdefault(nome_contador, []).append((rotulos, valor))
+        for nome_contador, valores in por_nome.items():
+            nome = f'{self.prefixo}_{nome_contador}_total'
+            linhas.append(f'# TYPE {nome} counter')
+            linhas.extend(f'{nome}{self._rotulos(rotulos)} {valor}' for rotulos, valor in valores)
+
+        for coletor in coletores:
+            try:
+                metricas = coletor()
+            except Exception as e:
+                linhas.append(f'# coletor {getattr(coletor, "__name__", coletor)} falhou: {e}')
+                continue
+            for nome_metrica, tipo, ajuda, valores in metricas:
+                nome = f'{self.prefixo}_{nome_metrica}'
+                linhas.append(f'# HELP {nome} {ajuda}')
+                linhas.append(f'# TYPE {nome} {tipo}')
+                linhas.extend(
+                    f'{nome}{self._rotulos(sorted(rotulos.items()))} {self._valor(valor)}' for rotulos, valor in valores
+                )
+        return '\n'.join(linhas) + '\n'
+
+    def resumo(self):
+        """Contagem, média e percentis aproximados (pelo limite do intervalo) de cada etapa, em ms"""
+        with self._lock:
+            duracoes = sorted(self._duracoes.items())
+        resumo = {}
+        for etapa, histograma in duracoes:
+            acumuladas, soma, total = histograma.amostra()
+            if not total:
+                continue
+
+            def percentil(fracao):
+                alvo = fracao * total
+                for limite, contagem in zip(histograma.limites, acumuladas):
+                    if contagem >= alvo:
+                        return limite * 1000
+                return float('inf')
+
+            resumo[etapa] = {
+                'contagem': total,
+                'media_ms': round(soma / total * 1000, 3),
+                'p50_ms_ate': percentil(0.5),
+                'p95_ms_ate': percentil(0.95),
+            }
+        return resumo
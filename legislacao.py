@@ -0,0 +1,457 @@
+"""Busca nos textos da legislação (CLT, CDC, Código Civil, CF/88) a partir de um índice local.
+
+A ingestão lê os textos das leis de uma pasta (.txt, ou .htm/.html salvos do site do
+Planalto, descartando o texto tachado das redações revogadas), divide-os por artigo
+(artigos longos em partes, nos limites dos parágrafos e incisos), remove as notas
+de alteração ("Redação dada pela Lei...") e os dispositivos vetados ou revogados,
+gera os embeddings com o sentence-transformers e grava o índice em uma pasta:
+
+- vetores.npy: matriz float32 (uma linha normalizada por trecho), aberta com
+  mmap_mode='r' — o sistema operacional carrega as páginas sob demanda e as
+  compartilha entre os processos que abrem o mesmo arquivo;
+- trechos.jsonl e posicoes.npy: os trechos (lei, artigo, títulos, texto), um por
+  linha, e a posição de cada linha no arquivo, também mapeados em memória: uma
+  busca só lê e decodifica os k trechos escolhidos;
+- indice.json: manifesto (modelo, dimensão, quantidade de trechos, arquivos de origem).
+
+Uma busca é um produto matriz-vetor sobre os vetores mapeados, sem rede: só o
+embedding da pergunta depende do modelo, carregado uma vez por processo.
+
+O nome de cada lei vem do nome do arquivo (clt, cdc, codigo_civil, cf88...) ou,
+se a primeira linha do arquivo começar com "#", do texto dessa linha.
+
+Uso:
+    python legislacao.py ingerir pasta_com_as_leis/ [--indice indice_legislacao] [--modelo ...]
+    python legislacao.py buscar "prazo para desistir de compra pela internet" [-k 5]
+    python legislacao.py estatisticas
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+import embeddings
+
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+PASTA_INDICE = os.environ.get('LEGISLATION_INDEX_DIR', os.path.join(PASTA_APP, 'indice_legislacao'))
+MODELO_PADRAO = os.environ.get('SEMANTIC_CACHE_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2')
+
+ARQUIVO_MANIFESTO = 'indice.json'
+ARQUIVO_VETORES = 'vetores.npy'
+ARQUIVO_TRECHOS = 'trechos.jsonl'
+ARQUIVO_POSICOES = 'posicoes.npy'
+VERSAO_INDICE = 1
+
+# Nome do arquivo (sem extensão) -> nome da lei mostrado ao Gemini
+LEIS = {
+    'clt': 'CLT (Decreto-Lei 5.452/1943)',
+    'cdc': 'CDC (Lei 8.078/1990)',
+    'codigo_civil': 'Código Civil (Lei 10.406/2002)',
+    'cc': 'Código Civil (Lei 10.406/2002)',
+    'cf88': 'Constituição Federal de 1988',
+    'constituicao': 'Constituição Federal de 1988',
+}
+
+_ARTIGO = re.compile(r'^\s*Art\.\s*(\d[\d.]*\s*[º°o]?(?:\s*-\s*[A-Z]+)?)\s*[.\-–]?\s*', re.MULTILINE)
+_DIVISAO = re.compile(r'^\s*(LIVRO|T[ÍI]TULO|CAP[ÍI]TULO|SE[ÇC][ÃA]O|SUBSE[ÇC][ÃA]O)\s+([IVXLCDM]+|[ÚU]NIC[OA])\b', re.IGNORECASE)
+_NIVEIS = ('LIVRO', 'TITULO', 'CAPITULO', 'SECAO', 'SUBSECAO')
+_NOTA = re.compile(
+    r'\s*\((?:Reda[çc][ãa]o dada|Inclu[íi]d[oa]|Revogad[oa]|Vide|Acrescid[oa]|Renumerad[oa]|Regulamento|'
+    r'Vig[êe]ncia|Produ[çc][ãa]o de efeito|Express[ãa]o suprimida|Promulga[çc][ãa]o)[^)]*\)'
+    # Link "Vigência" solto no fim da linha, sem parênteses
+    r'|\s+Vig[êe]ncia\s*$',
+    re.IGNORECASE
+)
+_SO_VETADO_OU_REVOGADO = re.compile(
+    r'^(?:[IVXLCDM]+\s*[-–]\s*|[a-z]\)\s*|§\s*\d+\s*[º°o]?\s*[.\-–]?\s*|Par[áa]grafo [úu]nico\.?\s*[-–]?\s*)?'
+    r'\(?\s*(?:vetad[oa]|revogad[oa])\s*\)?\s*[.;]?$',
+    re.IGNORECASE
+)
+
+
+def ler_arquivo(caminho):
+    """Lê o texto de uma lei (.txt em UTF-8 ou Windows-1252, ou .htm/.html); retorna (nome da lei, texto)"""
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+
+    if caminho.lower().endswith(('.htm', '.html')):
+        import lxml.html
+        documento = lxml.html.fromstring(conteudo)
+        # O Planalto mantém as redações antigas tachadas no mesmo documento
+        for elemento in documento.xpath('//strike | //s | //del'):
+            elemento.drop_tree()
+        for quebra in documento.xpath('//br | //p | //div'):
+            quebra.tail = '\n' + (quebra.tail or '')
+        texto = documento.text_content()
+    else:
+        try:
+            texto = conteudo.decode('utf-8')
+        except UnicodeDecodeError:
+            texto = conteudo.decode('cp1252')
+
+    base = os.path.splitext(os.path.basename(caminho))[0].lower()
+    nome = LEIS.get(base, base.replace('_', ' ').strip().upper())
+    primeira_linha = texto.lstrip().split('\n', 1)[0].strip()
+    if primeira_linha.startswith('#'):
+        nome = primeira_linha.lstrip('#').strip()
+    return nome, texto.replace('\r\n', '\n').replace('\xa0', ' ')
+
+
+def _limpar_linhas(texto):
+    linhas = []
+    for linha in texto.split('\n'):
+        linha = ' '.join(_NOTA.sub('', linha).split())
+        if linha and not _SO_VETADO_OU_REVOGADO.match(linha):
+            linhas.append(linha)
+    return linhas
+
+
+def dividir_em_artigos(texto, lei, max_caracteres=800):
+    """Divide o texto de uma lei em trechos de até `max_caracteres`, um artigo (ou parte dele) por trecho
+
+    Returns:
+        list: dicts com lei, artigo, contexto (livro/título/capítulo/seção em que o
+        artigo está), parte (0 para o início do artigo) e texto.
+    """
+    trechos = []
+    divisoes = {}
+    inicios = [marca for marca in _ARTIGO.finditer(texto)]
+
+    def atualizar_divisoes(trecho_texto):
+        linhas = [linha.strip() for linha in trecho_texto.split('\n') if linha.strip()]
+        for indice, linha in enumerate(linhas):
+            marca = _DIVISAO.match(linha)
+            if not marca:
+                continue
+            nivel = marca.group(1).upper().translate(str.maketrans('ÍÇÃ', 'ICA'))
+            posicao = _NIVEIS.index(nivel)
+            for inferior in _NIVEIS[posicao:]:
+                divisoes.pop(inferior, None)
+            titulo = linha
+            # A linha seguinte costuma trazer o nome da divisão ("Dos Direitos Básicos do Consumidor")
+            if indice + 1 < len(linhas) and not _DIVISAO.match(linhas[indice + 1]):
+                titulo = f"{linha} - {linhas[indice + 1]}"
+            divisoes[nivel] = _NOTA.sub('', titulo)
+
+    atualizar_divisoes(texto[:inicios[0].start()] if inicios else texto)
+    for numero, marca in enumerate(inicios):
+        fim = inicios[numero + 1].start() if numero + 1 < len(inicios) else len(texto)
+        corpo = texto[marca.start():fim]
+        # Títulos e capítulos que aparecem depois do artigo valem para os próximos
+        primeira_divisao = next((m.start() for m in re.finditer(r'^.*$', corpo, re.MULTILINE) if _DIVISAO.match(m.group())), None)
+        if primeira_divisao is not None:
+            corpo, seguinte = corpo[:primeira_divisao], corpo[primeira_divisao:]
+        else:
+            seguinte = ''
+
+        artigo = 'Art. ' + re.sub(r'\s+', '', marca.group(1)).rstrip('.').replace('o', 'º').replace('°', 'º')
+        linhas = _limpar_linhas(corpo)
+        # Caput revogado ou vetado: fica só o número do artigo (os parágrafos em vigor continuam)
+        if linhas and _SO_VETADO_OU_REVOGADO.match(_ARTIGO.sub('', linhas[0], count=1)):
+            linhas[0] = artigo
+        if len(linhas) > 1 or (linhas and _ARTIGO.sub('', linhas[0], count=1).strip()):
+            contexto = ' > '.join(divisoes[nivel] for nivel in _NIVEIS if nivel in divisoes)
+            partes = []
+            atual = []
+            for linha in linhas:
+                if atual and len('\n'.join(atual)) + len(linha) + 1 > max_caracteres:
+                    partes.append(atual)
+                    atual = [f"{artigo} (continuação)"]
+                atual.append(linha)
+            partes.append(atual)
+            for indice, parte in enumerate(partes):
+                trechos.append({'lei': lei, 'artigo': artigo, 'contexto': contexto, 'parte': indice, 'texto': '\n'.join(parte)})
+
+        if seguinte:
+            atualizar_divisoes(seguinte)
+    return trechos
+
+
+def texto_para_embutir(trecho):
+    """Texto de um trecho usado no embedding: lei, artigo e títulos ajudam a casar perguntas genéricas"""
+    contexto = f" ({trecho['contexto']})" if trecho['contexto'] else ''
+    return f"{trecho['lei']}{contexto}\n{trecho['texto']}"
+
+
+def formatar_trechos(trechos):
+    """Trechos encontrados em linhas "- Lei, Art. N: texto", como os dados da web enviados ao Gemini"""
+    return '\n'.join(
+        f"- {trecho['lei']}, {trecho['texto'].replace(chr(10), ' ')}" for trecho in trechos
+    )
+
+
+def construir_indice(arquivos, pasta_indice, nome_modelo=MODELO_PADRAO, max_caracteres=800, tamanho_lote=64,
+                     embutir=None, copiar_modelo=False):
+    """Gera o índice a partir dos arquivos das leis; retorna o manifesto
+
+    `embutir(textos)` substitui o modelo (deve retornar vetores normalizados). Os
+    arquivos novos substituem os antigos só no final, o manifesto por último.
+    """
+    inicio = time.perf_counter()
+    trechos = []
+    fontes = {}
+    for caminho in sorted(arquivos):
+        lei, texto = ler_arquivo(caminho)
+        novos = dividir_em_artigos(texto, lei, max_caracteres)
+        with open(caminho, 'rb') as arquivo:
+            resumo = hashlib.sha256(arquivo.read()).hexdigest()
+        fontes[os.path.basename(caminho)] = {'lei': lei, 'trechos': len(novos), 'sha256': resumo}
+        trechos.extend(novos)
+        print(f"📄 {os.path.basename(caminho)}: {lei}, {len(novos)} trechos")
+    if not trechos:
+        raise ValueError("Nenhum artigo encontrado nos arquivos informados")
+
+    os.makedirs(pasta_indice, exist_ok=True)
+    caminho_modelo = None
+    if embutir is None:
+        modelo = embeddings.carregar_modelo(nome_modelo)
+        if copiar_modelo:
+            caminho_modelo = 'modelo'
+            modelo.save(os.path.join(pasta_indice, caminho_modelo))
+
+        def embutir(textos):
+            return embeddings.embutir(modelo, textos, tamanho_lote)
+
+    temporario = f".tmp-{os.getpid()}"
+    caminho_vetores = os.path.join(pasta_indice, ARQUIVO_VETORES + temporario)
+    vetores = None
+    for posicao in range(0, len(trechos), tamanho_lote):
+        lote = embutir([texto_para_embutir(trecho) for trecho in trechos[posicao:posicao + tamanho_lote]])
+        if vetores is None:
+            # Gravado direto no arquivo, lote a lote: o corpus não precisa caber na memória duas vezes
+            vetores = np.lib.format.open_memmap(caminho_vetores, mode='w+', dtype=np.float32, shape=(len(trechos), lote.shape[1]))
+        vetores[posicao:posicao + len(lote)] = lote
+        print(f"\r🔢 {min(posicao + tamanho_lote, len(trechos))}/{len(trechos)} trechos", end='', flush=True)
+    print()
+    dimensao = vetores.shape[1]
+    vetores.flush()
+    del vetores
+
+    caminho_trechos = os.path.join(pasta_indice, ARQUIVO_TRECHOS + temporario)
+    posicoes = np.zeros(len(trechos) + 1, dtype=np.int64)
+    with open(caminho_trechos, 'wb') as arquivo:
+        for indice, trecho in enumerate(trechos):
+            arquivo.write(json.dumps(trecho, ensure_ascii=False).encode('utf-8') + b'\n')
+            posicoes[indice + 1] = arquivo.tell()
+    caminho_posicoes = os.path.join(pasta_indice, ARQUIVO_POSICOES + temporario)
+    with open(caminho_posicoes, 'wb') as arquivo:
+        np.save(arquivo, posicoes)
+
+    manifesto = {
+        'versao': VERSAO_INDICE,
+        'modelo': nome_modelo,
+        'caminho_modelo': caminho_modelo,
+        'dimensao': int(dimensao),
+        'trechos': len(trechos),
+        'max_caracteres': max_caracteres,
+        'fontes': fontes,
+        'criado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    caminho_manifesto = os.path.join(pasta_indice, ARQUIVO_MANIFESTO + temporario)
+    with open(caminho_manifesto, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+
+    for nome in (ARQUIVO_VETORES, ARQUIVO_TRECHOS, ARQUIVO_POSICOES, ARQUIVO_MANIFESTO):
+        os.replace(os.path.join(pasta_indice, nome + temporario), os.path.join(pasta_indice, nome))
+    print(f"✅ Índice com {len(trechos)} trechos ({dimensao} dimensões) gravado em {pasta_indice} "
+          f"em {time.perf_counter() - inicio:.1f}s")
+    return manifesto
+
+
+class IndiceLegislacao:
+    """Busca por similaridade nos trechos de um índice gerado por `python legislacao.py ingerir`
+
+    O índice é aberto (mapeado em memória) em abrir() e o modelo de embeddings é
+    carregado na primeira busca ou em carregar(). Sem índice na pasta, a busca fica
+    desabilitada.
+    """
+
+    def __init__(self, pasta=PASTA_INDICE, k=3, limiar=0.35, embutir=None):
+        self.pasta = pasta
+        self.k = k
+        self.limiar = limiar
+        self.habilitado = True
+        # Função textos -> vetores normalizados; por padrão, o modelo indicado no manifesto
+        self._embutir = embutir
+        self._embutir_proprio = embutir is not None
+        self._lock = threading.Lock()
+        self.manifesto = None
+        self._vetores = None
+        self._posicoes = None
+        self._trechos = None
+
+        self.consultas = 0
+        self.consultas_com_resultado = 0
+        self.tempo_busca = 0.0
+
+    def existe(self):
+        return os.path.exists(os.path.join(self.pasta, ARQUIVO_MANIFESTO))
+
+    def abrir(self, aquecer=False):
+        """Mapeia em memória os arquivos do índice, sem carregar o modelo; retorna se a busca está habilitada
+
+        Aberto antes do fork dos workers (app.precarregar), o mapeamento é herdado por
+        todos eles. Com `aquecer`, os vetores são lidos uma vez, para que já estejam no
+        cache de páginas do sistema na primeira busca.
+        """
+        if self._vetores is None and self.habilitado:
+            with self._lock:
+                if self._vetores is None and self.habilitado:
+                    self._abrir_arquivos()
+        if aquecer and self._vetores is not None:
+            float(np.sum(self._vetores))
+        return self.habilitado
+
+    def _abrir_arquivos(self):
+        try:
+            with open(os.path.join(self.pasta, ARQUIVO_MANIFESTO), encoding='utf-8') as arquivo:
+                manifesto = json.load(arquivo)
+            vetores = np.load(os.path.join(self.pasta, ARQUIVO_VETORES), mmap_mode='r')
+            posicoes = np.load(os.path.join(self.pasta, ARQUIVO_POSICOES), mmap_mode='r')
+            with open(os.path.join(self.pasta, ARQUIVO_TRECHOS), 'rb') as arquivo:
+                trechos = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+            if vetores.shape != (manifesto['trechos'], manifesto['dimensao']) or len(posicoes) != manifesto['trechos'] + 1:
+                raise ValueError("os arquivos do índice não correspondem ao manifesto (ingestão em andamento?)")
+            self.manifesto, self._posicoes, self._trechos = manifesto, posicoes, trechos
+            self._vetores = vetores
+            leis = sorted({fonte['lei'] for fonte in manifesto['fontes'].values()})
+            print(f"📚 Índice de legislação: {manifesto['trechos']} trechos ({', '.join(leis)})")
+        except FileNotFoundError:
+            print(f"ℹ️ Índice de legislação não encontrado em {self.pasta} (gere com: python legislacao.py ingerir <pasta>)")
+            self.habilitado = False
+        except Exception as e:
+            print(f"⚠️ Busca na legislação desabilitada: {e}")
+            self.habilitado = False
+
+    def carregar(self):
+        """Abre o índice e o modelo de embeddings, se ainda não abertos; retorna se a busca está habilitada"""
+        if not self.abrir() or self._embutir is not None:
+            return self.habilitado
+        with self._lock:
+            if self._embutir is None and self.habilitado:
+                try:
+                    caminho_modelo = self.manifesto.get('caminho_modelo')
+                    modelo = embeddings.carregar_modelo(
+                        os.path.join(self.pasta, caminho_modelo) if caminho_modelo else self.manifesto['modelo']
+                    )
+
+                    def embutir(textos):
+                        return embeddings.embutir(modelo, textos)
+
+                    self._embutir = embutir
+                except Exception as e:
+                    print(f"⚠️ Busca na legislação desabilitada: {e}")
+                    self.habilitado = False
+        return self.habilitado
+
+    def trecho(self, indice):
+        inicio, fim = int(self._posicoes[indice]), int(self._posicoes[indice + 1])
+        return json.loads(self._trechos[inicio:fim])
+
+    def usa_modelo(self, nome_modelo):
+        """Se os vetores do índice são do modelo `nome_modelo` (e um embedding da pergunta feito com ele serve para buscar)"""
+        if self._embutir_proprio or not self.abrir():
+            return False
+        return not self.manifesto.get('caminho_modelo') and self.manifesto.get('modelo') == nome_modelo
+
+    def buscar(self, pergunta, k=None, vetor=None):
+        """Os `k` trechos mais parecidos com a pergunta e com similaridade acima do limiar
+
+        `vetor`, se informado, é o embedding normalizado da pergunta, feito com o mesmo
+        modelo do índice (ver usa_modelo); assim a pergunta não é embutida de novo.
+
+        Returns:
+            list: dicts do trecho (lei, artigo, contexto, parte, texto) com a similaridade.
+        """
+        if not self.carregar():
+            return []
+        k = k or self.k
+        inicio = time.perf_counter()
+        if vetor is None:
+            vetor = self._embutir([pergunta])[0]
+        # Com vetores normalizados, o produto escalar é a similaridade de cosseno
+        similaridades = self._vetores @ vetor
+        k = min(k, len(similaridades))
+        melhores = np.argpartition(-similaridades, k - 1)[:k]
+        melhores = melhores[np.argsort(-similaridades[melhores])]
+        encontrados = [
+            {**self.trecho(int(indice)), 'similaridade': round(float(similaridades[indice]), 4)}
+            for indice in melhores if similaridades[indice] >= self.limiar
+        ]
+        with self._lock:
+            self.consultas += 1
+            self.consultas_com_resultado += bool(encontrados)
+            self.tempo_busca += time.perf_counter() - inicio
+        return encontrados
+
+    def estatisticas(self):
+        manifesto = self.manifesto or {}
+        with self._lock:
+            consultas, consultas_com_resultado, tempo_busca = self.consultas, self.consultas_com_resultado, self.tempo_busca
+        return {
+            'habilitado': self.habilitado,
+            'carregado': self._vetores is not None,
+            'pasta': self.pasta,
+            'modelo': manifesto.get('modelo'),
+            'trechos': manifesto.get('trechos', 0),
+            'leis': sorted({fonte['lei'] for fonte in manifesto.get('fontes', {}).values()}),
+            'k': self.k,
+            'limiar': self.limiar,
+            'consultas': consultas,
+            'consultas_com_resultado': consultas_com_resultado,
+            'tempo_medio_ms': round(tempo_busca / consultas * 1000, 2) if consultas else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Índice local da legislação')
+    parser.add_argument('--indice', default=PASTA_INDICE, help='pasta do índice')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    comando_ingerir = comandos.add_parser('ingerir', help='gera o índice a partir dos textos das leis')
+    comando_ingerir.add_argument('pasta', help='pasta com os arquivos .txt/.htm/.html das leis')
+    comando_ingerir.add_argument('--modelo', default=MODELO_PADRAO, help='modelo do sentence-transformers')
+    comando_ingerir.add_argument('--max-caracteres', type=int, default=800, help='tamanho máximo de cada trecho')
+    comando_ingerir.add_argument('--lote', type=int, default=64, help='trechos por lote de embeddings')
+    comando_ingerir.add_argument('--copiar-modelo', action='store_true',
+                                 help='salva uma cópia do modelo no índice (servidores sem acesso ao Hugging Face)')
+
+    comando_buscar = comandos.add_parser('buscar', help='mostra os trechos mais parecidos com uma pergunta')
+    comando_buscar.add_argument('pergunta')
+    comando_buscar.add_argument('-k', type=int, default=5)
+
+    comandos.add_parser('estatisticas', help='manifesto do índice')
+
+    args = parser.parse_args()
+
+    if args.comando == 'ingerir':
+        arquivos = [
+            os.path.join(args.pasta, nome) for nome in os.listdir(args.pasta)
+            if nome.lower().endswith(('.txt', '.htm', '.html'))
+        ]
+        if not arquivos:
+            sys.exit(f"Nenhum arquivo .txt, .htm ou .html em {args.pasta}")
+        construir_indice(arquivos, args.indice, args.modelo, args.max_caracteres, args.lote, copiar_modelo=args.copiar_modelo)
+    elif args.comando == 'buscar':
+        indice = IndiceLegislacao(args.indice, limiar=-1.0)
+        if not indice.carregar():
+            sys.exit(1)
+        inicio = time.perf_counter()
+        trechos = indice.buscar(args.pergunta, args.k)
+        for trecho in trechos:
+            print(f"\n[{trecho['similaridade']:.3f}] {trecho['lei']}, {trecho['artigo']} — {trecho['contexto']}\n{trecho['texto']}")
+        print(f"\n⏱️ {(time.perf_counter() - inicio) * 1000:.1f} ms", file=sys.stderr)
+    else:
+        with open(os.path.join(args.indice, ARQUIVO_MANIFESTO), encoding='utf-8') as arquivo:
+            print(json.dumps(json.load(arquivo), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Controle de tráfego para a API do Gemini: cota, disjuntor e novas tentativas.
+
+- LimitadorCota: dois baldes de fichas (requisições e tokens de entrada por minuto),
+  compartilhados por todas as threads e corrotinas do processo. Cada chamada
+  reserva suas fichas e recebe quanto deve esperar; se a espera passar do máximo
+  aceitável, a chamada é recusada na hora em vez de ir para a fila. Cada ficha
+  volta ao balde um período (mais uma pequena margem) depois de usada, de modo
+  que nenhum intervalo de um minuto passa da cota (um balde reposto continuamente
+  deixaria passar até o dobro: o balde cheio mais a reposição). A margem cobre a
+  diferença entre o instante da reserva e o da chegada da requisição ao servidor,
+  que é quando a cota é contada. Um 429 com Retry-After pausa todas as chamadas
+  até o prazo indicado.
+- Disjuntor: depois de várias falhas seguidas do servidor (5xx, timeouts, erros de
+  conexão), recusa as chamadas por um tempo e depois deixa passar uma única
+  chamada de teste; se ela funcionar, volta ao normal.
+- ControleGemini: junta os dois e calcula a espera entre tentativas (backoff
+  exponencial com jitter, respeitando Retry-After).
+
+O módulo não faz esperas: ele só calcula quanto esperar, e quem chama usa
+time.sleep ou asyncio.sleep, conforme o caso.
+"""
+import bisect
+import email.utils
+import random
+import threading
+import time
+
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+# Fração do período somada à devolução de cada ficha (1,2s em uma cota por minuto)
+MARGEM_DEVOLUCAO = 0.02
+
+
+class BaldeFichas:
+    """Até `capacidade` fichas; cada ficha usada volta ao balde `periodo` segundos depois do uso"""
+
+    def __init__(self, capacidade, periodo=60.0):
+        self.capacidade = capacidade
+        self.periodo = periodo
+        self.fichas = capacidade
+        # (instante da devolução, quantidade), em ordem de instante
+        self._devolucoes = []
+
+    def repor(self, agora):
+        devolvidas = 0
+        for instante, quantidade in self._devolucoes:
+            if instante > agora:
+                break
+            self.fichas += quantidade
+            devolvidas += 1
+        del self._devolucoes[:devolvidas]
+
+    def espera_para(self, quantidade, agora):
+        """Segundos até haver `quantidade` fichas, contando as já reservadas (saldo negativo)"""
+        quantidade = min(quantidade, self.capacidade)
+        disponiveis = self.fichas
+        if disponiveis >= quantidade:
+            return 0.0
+        for instante, devolvida in self._devolucoes:
+            disponiveis += devolvida
+            if disponiveis >= quantidade:
+                return instante - agora
+        return self.periodo
+
+    def retirar(self, quantidade, inicio):
+        """Usa `quantidade` fichas em uma chamada que começa em `inicio`"""
+        quantidade = min(quantidade, self.capacidade)
+        self.fichas -= quantidade
+        bisect.insort(self._devolucoes, (inicio + self.periodo * (1 + MARGEM_DEVOLUCAO), quantidade))
+
+
+class LimitadorCota:
+    """Limite de requisições (rpm) e de tokens de entrada (tpm) por período; 0 desativa cada limite"""
+
+    def __init__(self, rpm=0, tpm=0, periodo=60.0):
+        self.periodo = periodo
+        self.requisicoes = BaldeFichas(rpm, periodo) if rpm else None
+        self.tokens = BaldeFichas(tpm, periodo) if tpm else None
+        self._lock = threading.Lock()
+        self._pausado_ate = 0.0
+
+        self.liberadas = 0
+        self.atrasadas = 0
+        self.recusadas = 0
+        self.pausas = 0
+        self.espera_total = 0.0
+
+    def reservar(self, tokens, espera_maxima):
+        """Reserva uma requisição com `tokens` de entrada; retorna a espera em segundos ou None se recusada"""
+        with self._lock:
+            agora = time.monotonic()
+            espera = max(0.0, self._pausado_ate - agora)
+            for balde, quantidade in ((self.requisicoes, 1), (self.tokens, tokens)):
+                if balde is not None:
+                    balde.repor(agora)
+                    espera = max(espera, balde.espera_para(quantidade, agora))
+
+            if espera > espera_maxima:
+                self.recusadas += 1
+                return None
+
+            for balde, quantidade in ((self.requisicoes, 1), (self.tokens, tokens)):
+                if balde is not None:
+                    balde.retirar(quantidade, agora + espera)
+            self.liberadas += 1
+            if espera > 0:
+                self.atrasadas += 1
+                self.espera_total += espera
+            return espera
+
+    def pausar(self, segundos):
+        """Suspende todas as reservas por `segundos` (usado quando o Gemini responde 429)"""
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self.pausas += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'rpm': self.requisicoes.capacidade if self.requisicoes else None,
+                'tpm': self.tokens.capacidade if self.tokens else None,
+                'periodo': self.periodo,
+                'liberadas': self.liberadas,
+                'atrasadas': self.atrasadas,
+                'recusadas': self.recusadas,
+                'pausas_por_429': self.pausas,
+                'espera_media_ms': round(self.espera_total / self.atrasadas * 1000, 1) if self.atrasadas else 0.0,
+            }
+
+
+class Disjuntor:
+    """Circuit breaker: fechado (normal), aberto (recusa tudo) e meio aberto (uma chamada de teste)"""
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio_aberto'
+
+    def __init__(self, limiar_falhas=5, tempo_aberto=30.0):
+        self.limiar_falhas = limiar_falhas
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self.estado = self.FECHADO
+        self.falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+        self.aberturas = 0
+        self.recusadas = 0
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.ABERTO and time.monotonic() >= self._aberto_ate:
+                self.estado = self.MEIO_ABERTO
+                self._teste_em_andamento = False
+            if self.estado == self.MEIO_ABERTO and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            self.recusadas += 1
+            return False
+
+    def desistir(self):
+        """A chamada liberada não chegou a ser feita: outra pode ser o teste"""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            if self.estado != self.FECHADO:
+                print("🟢 Gemini respondeu: disjuntor fechado")
+            self.estado = self.FECHADO
+            self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            if self.estado == self.MEIO_ABERTO or (self.estado == self.FECHADO and self.falhas_seguidas >= self.limiar_falhas):
+                self.estado = self.ABERTO
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+                self._teste_em_andamento = False
+                self.aberturas += 1
+                print(f"🔴 {self.falhas_seguidas} falhas seguidas do Gemini: disjuntor aberto por {self.tempo_aberto:.0f}s")
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'estado': self.estado,
+                'falhas_seguidas': self.falhas_seguidas,
+                'aberturas': self.aberturas,
+                'recusadas': self.recusadas,
+            }
+
+
+def ler_retry_after(response):
+    """Segundos pedidos pelo servidor: cabeçalho Retry-After (segundos ou data) ou RetryInfo.retryDelay do corpo"""
+    valor = response.headers.get('Retry-After')
+    if valor:
+        valor = valor.strip()
+        if valor.isdigit():
+            return float(valor)
+        try:
+            data = email.utils.parsedate_to_datetime(valor)
+            return max(0.0, data.timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    try:
+        dados = response.json()
+    except ValueError:
+        return None
+    erro = dados.get('error') if isinstance(dados, dict) else None
+    detalhes = erro.get('details') if isinstance(erro, dict) else None
+    for detalhe in detalhes if isinstance(detalhes, list) else []:
+        atraso = detalhe.get('retryDelay') if isinstance(detalhe, dict) else None
+        if isinstance(atraso, str) and atraso.endswith('s'):
+            try:
+                return float(atraso[:-1])
+            except ValueError:
+                pass
+    return None
+
+
+class ControleGemini:
+    """Cota, disjuntor e política de novas tentativas das chamadas ao Gemini"""
+
+    def __init__(self, limitador, disjuntor, espera_maxima_fila=10.0, espera_maxima_tentativa=20.0):
+        self.limitador = limitador
+        self.disjuntor = disjuntor
+        self.espera_maxima_fila = espera_maxima_fila
+        self.espera_maxima_tentativa = espera_maxima_tentativa
+        self._lock = threading.Lock()
+        self.novas_tentativas = 0
+        self.respostas_429 = 0
+
+    def liberar(self, tokens):
+        """Retorna (espera, None) para seguir após `espera` segundos ou (None, motivo): 'disjuntor' ou 'cota'"""
+        if not self.disjuntor.permitir():
+            return None, 'disjuntor'
+        espera = self.limitador.reservar(tokens, self.espera_maxima_fila)
+        if espera is None:
+            self.disjuntor.desistir()
+            return None, 'cota'
+        return espera, None
+
+    def espera_nova_tentativa(self, tentativa, atraso_inicial, retry_after=None):
+        """Backoff exponencial com jitter completo; com Retry-After, espera pelo menos o pedido"""
+        espera = random.uniform(0, atraso_inicial * 2 ** (tentativa - 1))
+        if retry_after is not None:
+            espera = retry_after + random.uniform(0, atraso_inicial)
+        if espera > self.espera_maxima_tentativa:
+            return None
+        with self._lock:
+            self.novas_tentativas += 1
+        return espera
+
+    def registrar_resposta(self, response, tentativa, atraso_inicial, ultima=False):
+        """Registra a resposta HTTP; retorna a espera antes de uma nova tentativa ou None para não repetir"""
+        if response.status_code >= 500:
+            self.disjuntor.registrar_falha()
+        else:
+            # 4xx também mostra que o servidor está respondendo
+            self.disjuntor.registrar_sucesso()
+
+        if response.status_code not in STATUS_REPETIR:
+            return None
+
+        retry_after = ler_retry_after(response)
+        if response.status_code == 429:
+            with self._lock:
+                self.respostas_429 += 1
+            # Pausar as demais chamadas: a cota do servidor acabou
+            self.limitador.pausar(retry_after if retry_after is not None else atraso_inicial * 2 ** (tentativa - 1))
+        if ultima:
+            return None
+        return self.espera_nova_tentativa(tentativa, atraso_inicial, retry_after)
+
+    def registrar_erro_conexao(self, tentativa, atraso_inicial, ultima=False):
+        """Timeout ou falha de conexão: conta para o disjuntor; retorna a espera antes de repetir"""
+        self.disjuntor.registrar_falha()
+        if ultima:
+            return None
+        return self.espera_nova_tentativa(tentativa, atraso_inicial)
+
+    def estatisticas(self):
+        with self._lock:
+            tentativas = {'novas_tentativas': self.novas_tentativas, 'respostas_429': self.respostas_429}
+        return {
+            'cota': self.limitador.estatisticas(),
+            'disjuntor': self.disjuntor.estatisticas(),
+            **tentativas,
+        }
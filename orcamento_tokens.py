@@ -0,0 +1,105 @@
+class OrcamentoTokens:
+    """Controla o tamanho do prompt enviado ao Gemini dentro de um orçamento de tokens de entrada.
+
+    A contagem é uma estimativa por número de caracteres (sem tokenizador), suficiente
+    para manter o prompt abaixo do limite. Quando o orçamento estoura, o ajuste segue a
+    ordem: resumir (encurtar) as mensagens antigas do histórico, descartar as mais
+    antigas, cortar os trechos vindos da web e, só então, descartar as mensagens recentes.
+    """
+
+    MARCADOR_CORTE = ' [...]'
+
+    def __init__(self, orcamento=6000, caracteres_por_token=4, mensagens_recentes=2, caracteres_mensagem_antiga=600):
+        self.orcamento = orcamento
+        self.caracteres_por_token = caracteres_por_token
+        # Mensagens mais recentes do histórico, que nunca são resumidas
+        self.mensagens_recentes = mensagens_recentes
+        self.caracteres_mensagem_antiga = caracteres_mensagem_antiga
+
+    def estimar(self, texto):
+        """Estimativa do número de tokens de um texto"""
+        if not texto:
+            return 0
+        return int(len(texto) / self.caracteres_por_token) + 1
+
+    def _encurtar(self, texto, maximo_caracteres):
+        if len(texto) <= maximo_caracteres:
+            return texto
+        return texto[:max(maximo_caracteres - len(self.MARCADOR_CORTE), 0)].rstrip() + self.MARCADOR_CORTE
+
+    def ajustar(self, tokens_fixos, historico, dados_web):
+        """Ajusta histórico e dados da web para caber no orçamento
+
+        Args:
+            tokens_fixos (int): Tokens que não podem ser cortados (persona, pergunta, instruções).
+            historico (list): Lista de (remetente, mensagem), da mais antiga para a mais recente.
+            dados_web (str): Resultados da web, um por linha, ou None.
+
+        Returns:
+            tuple: (historico, dados_web, ajustes) já dentro do orçamento, quando possível.
+        """
+        historico = list(historico or [])
+        ajustes = {'mensagens_resumidas': 0, 'mensagens_removidas': 0, 'resultados_web_removidos': 0, 'web_cortada': False}
+
+        disponivel = self.orcamento - tokens_fixos
+        tokens_web = self.estimar(dados_web)
+
+        def tokens_historico():
+            return sum(self.estimar(mensagem) for _, mensagem in historico)
+
+        if tokens_historico() + tokens_web <= disponivel:
+            return historico, dados_web, ajustes
+
+        # 1. Resumir as mensagens antigas (todas menos as mais recentes)
+        limite_antigas = max(len(historico) - self.mensagens_recentes, 0)
+        for i in range(limite_antigas):
+            remetente, mensagem = historico[i]
+            encurtada = self._encurtar(mensagem, self.caracteres_mensagem_antiga)
+            if encurtada != mensagem:
+                historico[i] = (remetente, encurtada)
+                ajustes['mensagens_resumidas'] += 1
+
+        # 2. Descartar as mensagens antigas, da mais antiga para a mais nova
+        while len(historico) > self.mensagens_recentes and tokens_historico() + tokens_web > disponivel:
+            historico.pop(0)
+            ajustes['mensagens_removidas'] += 1
+
+        if not dados_web or tokens_historico() + tokens_web <= disponivel:
+            return self._ajustar_recentes(historico, tokens_web, disponivel, ajustes), dados_web, ajustes
+
+        # 3. Remover os últimos resultados da web (os menos relevantes), mantendo o primeiro
+        linhas = dados_web.split('\n')
+        while (sum(linha.startswith('- ') for linha in linhas) > 1 and linhas[-1].startswith('- ')
+               and tokens_historico() + self.estimar('\n'.join(linhas)) > disponivel):
+            linhas.pop()
+            ajustes['resultados_web_removidos'] += 1
+        dados_web = '\n'.join(linhas)
+        tokens_web = self.estimar(dados_web)
+
+        # 4. Resumir e, se preciso, descartar as mensagens recentes
+        historico = self._ajustar_recentes(historico, tokens_web, disponivel, ajustes)
+
+        # 5. Se ainda assim não couber, cortar o texto restante da web
+        if dados_web and tokens_web > disponivel:
+            dados_web = self._encurtar(dados_web, int(max(disponivel, 0) * self.caracteres_por_token))
+            ajustes['web_cortada'] = True
+
+        return historico, dados_web, ajustes
+
+    def _ajustar_recentes(self, historico, tokens_web, disponivel, ajustes):
+        """Último recurso para o histórico: resumir e depois descartar as mensagens recentes"""
+        def tokens_historico():
+            return sum(self.estimar(mensagem) for _, mensagem in historico)
+
+        for i, (remetente, mensagem) in enumerate(historico):
+            if tokens_historico() + tokens_web <= disponivel:
+                return historico
+            encurtada = self._encurtar(mensagem, self.caracteres_mensagem_antiga)
+            if encurtada != mensagem:
+                historico[i] = (remetente, encurtada)
+                ajustes['mensagens_resumidas'] += 1
+
+        while historico and tokens_historico() + tokens_web > disponivel:
+            historico.pop(0)
+            ajustes['mensagens_removidas'] += 1
+        return historico
@@ -0,0 +1,117 @@
+"""Tabela estática de respostas prontas, consultada antes de qualquer outra etapa.
+
+Há dois tipos de entrada:
+
+- respostas sobre o próprio bot (criador, propósito, "quem é você"), escolhidas pela
+  intenção detectada pelo roteador de intenções (roteador_intencoes.py);
+- perguntas frequentes (FAQ) lidas de um arquivo JSON, que casam com a pergunta
+  inteira depois de normalizada (minúsculas, sem acentos e sem pontuação), por
+  busca em dicionário.
+
+Formato do arquivo de FAQ (ver respostas_prontas.exemplo.json):
+
+    [
+        {"perguntas": ["O que é usucapião?", "O que significa usucapião?"],
+         "resposta": "Usucapião é ..."}
+    ]
+"""
+import json
+import os
+import threading
+
+from roteador_intencoes import normalizar
+
+# Intenção do roteador -> resposta automática sobre o bot
+RESPOSTAS_SOBRE_O_BOT = {
+    'criador': "Fui criado por Paulo Ricardo, um desenvolvedor estudante de análise e desenvolvimento de sistemas pela Unicarioca.",
+    'proposito': "Fui criado por Paulo Ricardo para ser um apoio nos estudos da sua esposa Esther Rodrigues, estudante de direito pela Unicarioca. Sou um assistente jurídico virtual que fornece informações sobre leis e procedimentos legais no Brasil.",
+    'sobre_bot': """Sou um assistente jurídico virtual chamado Advogado Virtual, criado por Paulo Ricardo, estudante de análise e desenvolvimento de sistemas pela Unicarioca.
+
+Fui desenvolvido para apoiar os estudos da sua esposa dele, Esther Rodrigues, que estuda direito na mesma universidade. Minha função é fornecer informações gerais sobre leis e procedimentos legais no Brasil.""",
+}
+
+
+class RespostasProntas:
+    """Respostas sobre o bot e perguntas frequentes, com contagem de uso por entrada"""
+
+    def __init__(self, caminho_faq=None):
+        self.respostas_bot = dict(RESPOSTAS_SOBRE_O_BOT)
+        # Pergunta normalizada -> (índice da entrada no arquivo, resposta)
+        self.faq = {}
+        self.caminho_faq = caminho_faq
+        self._lock = threading.Lock()
+        self.acertos = {}
+        if caminho_faq:
+            self.carregar_faq(caminho_faq)
+
+    def carregar_faq(self, caminho):
+        """Lê as perguntas frequentes do arquivo JSON; entradas inválidas são ignoradas com aviso"""
+        try:
+            with open(caminho, 'r', encoding='utf-8') as arquivo:
+                entradas = json.load(arquivo)
+        except FileNotFoundError:
+            print(f"Arquivo de perguntas frequentes não encontrado: {caminho}")
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler as perguntas frequentes de {caminho}: {e}")
+            return 0
+
+        faq = {}
+        for indice, entrada in enumerate(entradas if isinstance(entradas, list) else []):
+            perguntas = entrada.get('perguntas') if isinstance(entrada, dict) else None
+            resposta = entrada.get('resposta') if isinstance(entrada, dict) else None
+            if not perguntas or not isinstance(perguntas, list) or not resposta:
+                print(f"⚠️ Pergunta frequente #{indice} ignorada: use 'perguntas' (lista) e 'resposta'")
+                continue
+            for pergunta in perguntas:
+                chave = normalizar(pergunta)
+                if chave in faq:
+                    print(f"⚠️ Pergunta frequente repetida: {pergunta!r} (vale a primeira)")
+                    continue
+                faq[chave] = (f"faq_{indice}", resposta)
+
+        self.faq = faq
+        print(f"Perguntas frequentes carregadas de {caminho}: {len(faq)} perguntas")
+        return len(faq)
+
+    def _contar(self, chave):
+        with self._lock:
+            self.acertos[chave] = self.acertos.get(chave, 0) + 1
+
+    def buscar(self, pergunta_normalizada, intencao_bot=None):
+        """Retorna a resposta pronta para a pergunta (já normalizada) ou None
+
+        Args:
+            pergunta_normalizada (str): Pergunta após roteador_intencoes.normalizar
+            intencao_bot (str, optional): 'criador', 'proposito' ou 'sobre_bot', quando a
+                pergunta for diretamente sobre o bot
+        """
+        entrada = self.faq.get(pergunta_normalizada)
+        if entrada is not None:
+            chave, resposta = entrada
+            self._contar(chave)
+            return resposta
+
+        if intencao_bot in self.respostas_bot:
+            self._contar(intencao_bot)
+            return self.respostas_bot[intencao_bot]
+        return None
+
+    def estatisticas(self):
+        with self._lock:
+            acertos = dict(self.acertos)
+        return {
+            'arquivo_faq': self.caminho_faq,
+            'perguntas_faq': len(self.faq),
+            'acertos': acertos,
+            'total_acertos': sum(acertos.values()),
+        }
+
+
+def caminho_faq_padrao(pasta):
+    """FAQ_PATH do ambiente ou respostas_prontas.json na pasta do app, se existir"""
+    caminho = os.environ.get('FAQ_PATH')
+    if caminho:
+        return caminho
+    caminho = os.path.join(pasta, 'respostas_prontas.json')
+    return caminho if os.path.exists(caminho) else None
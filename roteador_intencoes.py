@@ -0,0 +1,108 @@
+"""Classificação das intenções de uma pergunta em uma única passada.
+
+Os termos de cada intenção são compilados uma vez, na inicialização, em uma única
+expressão regular. Ela é aplicada ao texto sem acentos, em minúsculas e com a
+pontuação trocada por espaços, e exige limite de palavra nas duas pontas: "decisao"
+casa com "decisão", e "ano" não casa dentro de "dano" nem de "humano". Um termo
+terminado em "*" casa com qualquer palavra que comece com ele ("recomend*" casa
+com "recomenda" e "recomendação").
+
+Todos os termos formam uma única expressão (uma alternância, com os termos mais
+longos antes), percorrida uma vez com finditer(). Cada termo termina em um grupo
+vazio, e lastindex indica qual termo casou. Cada termo sabe, desde a compilação, a
+quais intenções pertence, incluindo as dos termos menores contidos nele: "qual sua
+finalidade" indica "proposito" e também "outro_contexto" (por conter "qual"), embora
+a varredura só encontre o termo mais longo naquela posição.
+"""
+import re
+import unicodedata
+
+# Intenção -> termos (já escritos sem acento; "*" no fim indica prefixo de palavra)
+INTENCOES = {
+    # Perguntas sobre atualidades/notícias recentes, que exigem busca na web
+    'atualidade': [
+        "recente", "recentes", "ultima", "ultimas", "ultimo", "ultimos", "atual*",
+        "nova", "novas", "novo", "novos", "novidade", "novidades",
+        "ontem", "hoje", "semana", "mes", "ano", "decisao", "decisoes",
+    ],
+    # Entidades sobre as quais sempre buscar na web
+    'entidade_web': ["stf", "supremo", "tribunal federal", "stj", "tribunal de justica", "jurisprudencia*"],
+    # Perguntas que pedem a busca nos sites do STF, Conjur e JOTA
+    'stf': ["stf", "supremo"],
+    # Perguntas diretas sobre o criador do bot
+    'criador': [
+        "quem te criou", "quem criou voce", "quem e seu criador", "quem desenvolveu voce",
+        "quem fez voce", "quem e o seu desenvolvedor",
+    ],
+    # Perguntas diretas sobre o propósito do bot
+    'proposito': [
+        "qual sua finalidade", "qual seu proposito", "para que voce serve",
+        "por que foi criado", "qual seu objetivo", "qual sua funcao",
+    ],
+    # Perguntas amplas sobre o bot
+    'sobre_bot': ["me fale sobre voce", "me conte sobre voce", "sua historia", "quem e voce", "sobre voce"],
+    # Contexto de conversa sobre outros assuntos (desativa as respostas automáticas sobre o bot)
+    'outro_contexto': [
+        "faculdade*", "universidade*", "recomend*", "indic*", "sugir*", "sugest*", "curso*",
+        "estud*", "escola*", "ensino", "educacao", "graduacao", "qual", "quais", "onde",
+    ],
+}
+
+
+_NAO_PALAVRA = re.compile(r'[^\w]+')
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos, com pontuação trocada por espaço e espaços simples"""
+    texto = unicodedata.normalize('NFKD', texto.lower()).encode('ASCII', 'ignore').decode('ASCII')
+    return _NAO_PALAVRA.sub(' ', texto).strip()
+
+
+class RoteadorIntencoes:
+    """Compila as intenções em uma expressão regular e classifica perguntas com ela"""
+
+    def __init__(self, intencoes=None):
+        self.intencoes = dict(intencoes or INTENCOES)
+
+        # Termo -> intenções às quais ele pertence
+        termos = {}
+        for nome, lista in self.intencoes.items():
+            for termo in lista:
+                termos.setdefault(self._normalizar_termo(termo), set()).add(nome)
+
+        # Intenções de cada termo, somadas às dos termos contidos nele
+        intencoes_termo = {}
+        for termo, nomes in termos.items():
+            intencoes_termo[termo] = set(nomes)
+            exemplo = termo.rstrip('*')
+            for outro, outros_nomes in termos.items():
+                if outro != termo and re.search(r'\b' + self._padrao_termo(outro), exemplo):
+                    intencoes_termo[termo] |= outros_nomes
+
+        # Termos mais longos primeiro, para que "qual sua finalidade" vença "qual" na mesma posição
+        self._intencoes_grupo = [None]
+        alternativas = []
+        for termo in sorted(termos, key=lambda termo: (-len(termo), termo)):
+            self._intencoes_grupo.append(frozenset(intencoes_termo[termo]))
+            alternativas.append(self._padrao_termo(termo) + '()')
+        self.expressao = re.compile(r'\b(?:' + '|'.join(alternativas) + ')')
+
+    @staticmethod
+    def _normalizar_termo(termo):
+        return normalizar(termo.rstrip('*')) + ('*' if termo.endswith('*') else '')
+
+    @staticmethod
+    def _padrao_termo(termo):
+        if termo.endswith('*'):
+            return re.escape(termo[:-1]) + r'\w*'
+        return re.escape(termo) + r'\b'
+
+    def classificar(self, texto, ja_normalizado=False):
+        """Retorna {intenção: termo encontrado} com todas as intenções presentes no texto"""
+        if not ja_normalizado:
+            texto = normalizar(texto)
+        encontradas = {}
+        for correspondencia in self.expressao.finditer(texto):
+            for intencao in self._intencoes_grupo[correspondencia.lastindex]:
+                encontradas.setdefault(intencao, correspondencia.group())
+        return encontradas
@@ -0,0 +1,266 @@
+"""Backends de sessão do Flask para o Advogado Virtual.
+
+A sessão guarda apenas o id do usuário (web_...). SESSION_BACKEND escolhe onde:
+
+- cookie: cookie assinado, sem estado no servidor (SecureCookieSessionInterface do
+  Flask). Nenhum acesso a disco por requisição e funciona com vários processos e
+  servidores, desde que todos usem a mesma SECRET_KEY;
+- sqlite: tabela de sessões em um arquivo SQLite (modo WAL), com limpeza periódica
+  das sessões expiradas. O cookie leva só um identificador aleatório;
+- filesystem: o comportamento antigo (Flask-Session, um arquivo por visitante).
+
+Ao trocar de backend, os visitantes com sessões antigas em flask_session/ mantêm o
+mesmo id de usuário: na primeira visita, o id é lido da sessão antiga e copiado
+para a nova (MigracaoSessaoArquivo).
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class SessaoSQLite(CallbackDict, SessionMixin):
+    def __init__(self, dados=None, sid=None, nova=False):
+        def ao_modificar(_):
+            self.modified = True
+
+        super().__init__(dados, ao_modificar)
+        self.sid = sid
+        self.new = nova
+        self.modified = False
+
+
+class InterfaceSessaoSQLite(SessionInterface):
+    """Sessões do lado do servidor em SQLite
+
+    A validade é renovada no máximo uma vez por `intervalo_renovacao` segundos, para
+    que uma requisição comum seja só uma leitura por chave primária.
+    """
+
+    def __init__(self, caminho, intervalo_limpeza=3600, intervalo_renovacao=24 * 3600):
+        self.caminho = caminho
+        self.intervalo_limpeza = intervalo_limpeza
+        self.intervalo_renovacao = intervalo_renovacao
+        self._local = threading.local()
+        self._lock_limpeza = threading.Lock()
+        self._ultima_limpeza = time.time()
+        self.removidas = 0
+
+        conn = self._conexao()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessoes (
+            sid TEXT PRIMARY KEY,
+            dados TEXT NOT NULL,
+            expira_em REAL NOT NULL
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessoes_expira_em ON sessoes (expira_em)')
+        conn.commit()
+
+        # Conexões SQLite não podem ser usadas por um processo criado por fork (workers
+        # do gunicorn com --preload): cada worker abre as suas
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._descartar_conexoes)
+
+    def _descartar_conexoes(self):
+        # As herdadas não são fechadas no filho: fechar uma conexão em WAL pode fazer um checkpoint no arquivo que o pai usa
+        self._conexoes_herdadas = self._local
+        self._local = threading.local()
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _limpar_expiradas(self):
+        agora = time.time()
+        if agora - self._ultima_limpeza < self.intervalo_limpeza or not self._lock_limpeza.acquire(blocking=False):
+            return
+        try:
+            self._ultima_limpeza = agora
+            with self._conexao() as conn:
+                self.removidas += conn.execute("DELETE FROM sessoes WHERE expira_em <= ?", (agora,)).rowcount
+        except sqlite3.Error as e:
+            print(f"Erro ao limpar sessões expiradas: {e}")
+        finally:
+            self._lock_limpeza.release()
+
+    def open_session(self, app, request):
+        self._limpar_expiradas()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            linha = self._conexao().execute(
+                "SELECT dados, expira_em FROM sessoes WHERE sid = ? AND expira_em > ?", (sid, time.time())
+            ).fetchone()
+            if linha:
+                sessao = SessaoSQLite(json.loads(linha[0]), sid)
+                sessao.expira_em = linha[1]
+                return sessao
+        # Sem cookie ou sessão desconhecida/expirada: novo identificador (evita fixação de sessão)
+        return SessaoSQLite(sid=secrets.token_urlsafe(32), nova=True)
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                with self._conexao() as conn:
+                    conn.execute("DELETE FROM sessoes WHERE sid = ?", (session.sid,))
+                response.delete_cookie(nome, domain=dominio, path=caminho)
+            return
+
+        agora = time.time()
+        validade = app.permanent_session_lifetime.total_seconds()
+        renovar = agora + validade - getattr(session, 'expira_em', 0) > self.intervalo_renovacao
+        if not (session.modified or renovar):
+            return
+
+        with self._conexao() as conn:
+            conn.execute(
+                "INSERT INTO sessoes (sid, dados, expira_em) VALUES (?, ?, ?) "
+                "ON CONFLICT (sid) DO UPDATE SET dados = excluded.dados, expira_em = excluded.expira_em",
+                (session.sid, json.dumps(dict(session)), agora + validade)
+            )
+        response.set_cookie(
+            nome,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=dominio,
+            path=caminho,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def estatisticas(self):
+        return {
+            'sessoes': self._conexao().execute("SELECT COUNT(*) FROM sessoes").fetchone()[0],
+            'expiradas_removidas': self.removidas,
+        }
+
+
+class MigracaoSessaoArquivo(SessionInterface):
+    """Envolve o novo backend e recupera o id do usuário das sessões antigas em arquivo
+
+    A sessão antiga só é lida quando o visitante traz um cookie mas ainda não tem id
+    no novo backend, ou seja, uma única vez por visitante.
+    """
+
+    def __init__(self, interface, interface_antiga):
+        self.interface = interface
+        self.interface_antiga = interface_antiga
+        self.migradas = 0
+
+    def open_session(self, app, request):
+        sessao = self.interface.open_session(app, request)
+        if sessao is not None and 'user_id' not in sessao and request.cookies.get(self.get_cookie_name(app)):
+            try:
+                antiga = self.interface_antiga.open_session(app, request)
+            except Exception as e:
+                print(f"Erro ao ler sessão antiga: {e}")
+                antiga = None
+            if antiga and 'user_id' in antiga:
+                sessao['user_id'] = antiga['user_id']
+                sessao.permanent = True
+                self.migradas += 1
+        return sessao
+
+    def save_session(self, app, session, response):
+        return self.interface.save_session(app, session, response)
+
+    def is_null_session(self, obj):
+        return self.interface.is_null_session(obj)
+
+    def estatisticas(self):
+        estatisticas = {'migradas_de_arquivo': self.migradas}
+        if hasattr(self.interface, 'estatisticas'):
+            estatisticas.update(self.interface.estatisticas())
+        return estatisticas
+
+
+def ler_chave_secreta(pasta):
+    """SECRET_KEY do ambiente ou, se ausente, uma chave gerada uma vez e guardada em secret_key.txt
+
+    Uma chave fixa é necessária para que cookies assinados continuem válidos após
+    reinícios e sejam aceitos por todos os workers.
+    """
+    chave = os.environ.get('SECRET_KEY')
+    if chave:
+        return chave
+
+    caminho = os.path.join(pasta, 'secret_key.txt')
+    try:
+        with open(caminho, 'r', encoding='utf-8') as arquivo:
+            return arquivo.read().strip()
+    except FileNotFoundError:
+        pass
+
+    chave = secrets.token_hex(32)
+    try:
+        # O_EXCL: se outro worker criar o arquivo ao mesmo tempo, usar a chave dele
+        descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(chave)
+    except FileExistsError:
+        time.sleep(0.1)
+        with open(caminho, 'r', encoding='utf-8') as arquivo:
+            return arquivo.read().strip()
+    return chave
+
+
+def configurar_sessao(app, pasta):
+    """Instala em `app` o backend escolhido em SESSION_BACKEND e retorna a interface de sessão"""
+    backend = os.environ.get('SESSION_BACKEND', 'cookie')
+    pasta_sessoes_antigas = os.environ.get('SESSION_FILE_DIR', os.path.join(os.getcwd(), 'flask_session'))
+
+    if backend == 'filesystem':
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_FILE_DIR'] = pasta_sessoes_antigas
+        Session(app)
+        return app.session_interface
+
+    if backend == 'sqlite':
+        interface = InterfaceSessaoSQLite(
+            os.environ.get('SESSION_SQLITE_PATH', os.path.join(pasta, 'sessoes.db')),
+            intervalo_limpeza=int(os.environ.get('SESSION_SWEEP_INTERVAL', '3600'))
+        )
+    elif backend == 'cookie':
+        interface = SecureCookieSessionInterface()
+    else:
+        raise ValueError(f"SESSION_BACKEND inválido: {backend} (use cookie, sqlite ou filesystem)")
+
+    migrar = os.environ.get('SESSION_MIGRATE_FILESYSTEM', '1') == '1' and os.path.isdir(pasta_sessoes_antigas)
+    if migrar:
+        try:
+            from flask_session.filesystem import FileSystemSessionInterface
+        except ImportError as e:
+            raise RuntimeError(
+                "A migração das sessões em arquivo precisa do Flask-Session 0.7 ou mais novo "
+                "(pip install -U 'Flask-Session>=0.7'); ou desative com SESSION_MIGRATE_FILESYSTEM=0"
+            ) from e
+        import warnings
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            interface_antiga = FileSystemSessionInterface(app, cache_dir=pasta_sessoes_antigas)
+        interface = MigracaoSessaoArquivo(interface, interface_antiga)
+        print(f"Sessões antigas em {pasta_sessoes_antigas} serão migradas para o backend '{backend}'")
+
+    app.session_interface = interface
+    return interface
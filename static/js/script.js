@@ -53,6 +53,49 @@ document.addEventListener("DOMContentLoaded", function () {
     // Salvar última pergunta
     lastQuestion = message;
 
+    // Navegadores com suporte a ReadableStream recebem a resposta em partes
+    if (window.ReadableStream && window.TextDecoder) {
+      streamMessage(message);
+    } else {
+      requestMessage(message);
+    }
+  }
+
+  function showAnswer(data, messageDiv) {
+    // Esconder indicador de digitação
+    typingIndicator.style.display = "none";
+
+    if (messageDiv) {
+      // Mensagem já exibida durante a transmissão: garantir o texto final
+      messageDiv.querySelector(".message-content").textContent = data.answer;
+      if (data.web_search) {
+        addWebBadge(messageDiv);
+      }
+    } else {
+      // Adicionar resposta do bot
+      addMessage(data.answer, "bot", data.web_search);
+    }
+
+    // Salvar última resposta
+    lastAnswer = data.answer;
+    usedAPI = data.used_api;
+
+    // Mostrar opções de feedback apenas se usou API
+    if (usedAPI) {
+      feedbackContainer.style.display = "flex";
+    }
+  }
+
+  function showError(error) {
+    console.error("Erro:", error);
+    typingIndicator.style.display = "none";
+    addMessage(
+      "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.",
+      "bot"
+    );
+  }
+
+  function requestMessage(message) {
     // Fazer requisição para a API
     fetch("/api/chat", {
       method: "POST",
@@ -62,31 +105,70 @@ document.addEventListener("DOMContentLoaded", function () {
       body: JSON.stringify({ question: message }),
     })
       .then((response) => response.json())
-      .then((data) => {
-        // Esconder indicador de digitação
-        typingIndicator.style.display = "none";
-
-        // Adicionar resposta do bot
-        addMessage(data.answer, "bot", data.web_search);
+      .then((data) => showAnswer(data))
+      .catch(showError);
+  }
 
-        // Salvar última resposta
-        lastAnswer = data.answer;
-        usedAPI = data.used_api;
+  function streamMessage(message) {
+    let messageDiv = null;
+    let buffer = "";
+    let finished = false;
+    const decoder = new TextDecoder();
+
+    // Cada evento SSE chega como "data: {json}" seguido de uma linha em branco
+    function handleEvent(rawEvent) {
+      const line = rawEvent.trim();
+      if (!line.startsWith("data:")) return;
+      const data = JSON.parse(line.slice(5));
+
+      if (data.type === "chunk") {
+        if (!messageDiv) {
+          typingIndicator.style.display = "none";
+          messageDiv = addMessage("", "bot");
+        }
+        messageDiv.querySelector(".message-content").textContent += data.text;
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+      } else if (data.type === "done") {
+        finished = true;
+        showAnswer(data, messageDiv);
+      }
+    }
 
-        // Mostrar opções de feedback apenas se usou API
-        if (usedAPI) {
-          feedbackContainer.style.display = "flex";
+    fetch("/api/chat/stream", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ question: message }),
+    })
+      .then((response) => {
+        if (!response.ok || !response.body) {
+          throw new Error(`Status ${response.status}`);
+        }
+        const reader = response.body.getReader();
+
+        function read() {
+          return reader.read().then(({ done, value }) => {
+            if (value) {
+              buffer += decoder.decode(value, { stream: true });
+              const events = buffer.split("\n\n");
+              buffer = events.pop();
+              events.forEach(handleEvent);
+            }
+            if (done) {
+              if (buffer) handleEvent(buffer);
+              if (!finished) throw new Error("Transmissão interrompida");
+              return;
+            }
+            return read();
+          });
         }
+
+        return read();
       })
-      .catch((error) => {
-        console.error("Erro:", error);
-        typingIndicator.style.display = "none";
-        addMessage(
-          "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.",
-          "bot"
-        );
-      });
+      .catch(showError);
   }
+
   function addMessage(text, sender, webSearch = false) {
     const messageDiv = document.createElement("div");
     messageDiv.classList.add("message", sender);
@@ -97,12 +179,7 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // Adicionar indicador de busca na web se aplicável
     if (webSearch && sender === "bot") {
-      const webBadge = document.createElement("div");
-      webBadge.classList.add("web-badge");
-      webBadge.innerHTML = "ℹ️ Com dados da web";
-      webBadge.title =
-        "Esta resposta inclui informações atualizadas de sites jurídicos";
-      messageDiv.appendChild(webBadge);
+      addWebBadge(messageDiv);
     }
 
     messageDiv.appendChild(contentDiv);
@@ -110,6 +187,17 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // Rolar para o final da conversa
     chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return messageDiv;
+  }
+
+  function addWebBadge(messageDiv) {
+    const webBadge = document.createElement("div");
+    webBadge.classList.add("web-badge");
+    webBadge.innerHTML = "ℹ️ Com dados da web";
+    webBadge.title =
+      "Esta resposta inclui informações atualizadas de sites jurídicos";
+    messageDiv.insertBefore(webBadge, messageDiv.firstChild);
   }
 
   function sendFeedback(isHelpful) {
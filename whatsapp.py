@@ -0,0 +1,226 @@
+"""Atendimento pelo WhatsApp Business (Cloud API), processado fora do webhook.
+
+O webhook só valida a assinatura, extrai as mensagens de texto e as grava na fila
+durável (fila_trabalhos.py), respondendo 200 na hora: a Meta reenvia as
+notificações que demoram a ser confirmadas, o que geraria respostas duplicadas se
+o Gemini fosse consultado durante a requisição. Um pool de workers consome a fila,
+obtém a resposta do AdvogadoBot com plataforma='whatsapp' e a envia pelo enviador
+configurado:
+
+- EnviadorCloudAPI: POST /{phone_number_id}/messages na Graph API da Meta;
+- EnviadorRegistro: só guarda e exibe as mensagens, para desenvolvimento local,
+  testes e benchmarks (usado quando não há token configurado).
+
+Qualquer objeto com um método enviar(telefone, texto) pode substituí-los. Respostas
+longas são divididas em partes antes do envio, uma chamada por parte, e o trabalho
+guarda quantas já foram enviadas.
+"""
+import hashlib
+import hmac
+import threading
+import time
+import traceback
+
+# Limite de caracteres do corpo de uma mensagem de texto na Cloud API
+LIMITE_TEXTO = 4096
+
+
+def assinatura_valida(corpo, cabecalho, segredo):
+    """Confere o cabeçalho X-Hub-Signature-256 (HMAC-SHA256 do corpo com o App Secret)"""
+    if not cabecalho or not cabecalho.startswith('sha256='):
+        return False
+    esperado = hmac.new(segredo.encode('utf-8'), corpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, cabecalho[len('sha256='):])
+
+
+def extrair_mensagens(payload):
+    """Mensagens de texto de uma notificação do webhook, como dicts com id, telefone, texto e timestamp
+
+    Notificações de status (entregue, lida) e mensagens de outros tipos são ignoradas.
+    """
+    mensagens = []
+    for entrada in payload.get('entry') or []:
+        for mudanca in entrada.get('changes') or []:
+            valor = mudanca.get('value') or {}
+            for mensagem in valor.get('messages') or []:
+                if mensagem.get('type') != 'text' or not mensagem.get('id') or not mensagem.get('from'):
+                    continue
+                texto = (mensagem.get('text') or {}).get('body', '').strip()
+                if texto:
+                    mensagens.append({
+                        'id': mensagem['id'],
+                        'telefone': mensagem['from'],
+                        'texto': texto,
+                        'timestamp': mensagem.get('timestamp'),
+                    })
+    return mensagens
+
+
+def dividir_texto(texto, limite=LIMITE_TEXTO):
+    """Divide respostas longas em partes de até `limite` caracteres, de preferência entre parágrafos"""
+    partes = []
+    while len(texto) > limite:
+        corte = texto.rfind('\n', 0, limite)
+        if corte <= 0:
+            corte = texto.rfind(' ', 0, limite)
+        if corte <= 0:
+            corte = limite
+        partes.append(texto[:corte].rstrip())
+        texto = texto[corte:].lstrip()
+    if texto:
+        partes.append(texto)
+    return partes
+
+
+class EnviadorCloudAPI:
+    """Envia mensagens de texto pela WhatsApp Cloud API"""
+
+    def __init__(self, http, token, id_telefone, url_base='https://graph.facebook.com/v20.0'):
+        self.http = http
+        self.token = token
+        self.url = f"{url_base.rstrip('/')}/{id_telefone}/messages"
+
+    def enviar(self, telefone, texto):
+        for parte in dividir_texto(texto):
+            response = self.http.post(
+                self.url,
+                headers={'Authorization': f"Bearer {self.token}"},
+                json={
+                    'messaging_product': 'whatsapp',
+                    'to': telefone,
+                    'type': 'text',
+                    'text': {'body': parte},
+                }
+            )
+            if response.status_code >= 400:
+                # A exceção devolve o trabalho à fila, que tenta de novo com backoff
+                raise RuntimeError(f"Cloud API respondeu {response.status_code}: {response.text[:200]}")
+
+
+class EnviadorRegistro:
+    """Enviador local: guarda as mensagens em memória em vez de enviá-las"""
+
+    def __init__(self, exibir=True, maximo=1000):
+        self.exibir = exibir
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self.enviadas = []
+
+    def enviar(self, telefone, texto):
+        with self._lock:
+            self.enviadas.append((telefone, texto))
+            del self.enviadas[:-self.maximo]
+        if self.exibir:
+            print(f"📤 WhatsApp (não enviado, sem token) para {telefone}: {texto[:80]!r}")
+
+
+class ProcessadorWhatsApp:
+    """Pool de workers que consome a fila de mensagens do WhatsApp e envia as respostas
+
+    `responder(telefone, texto)` obtém a resposta (AdvogadoBot.responder_whatsapp, que usa
+    obter_resposta com plataforma='whatsapp') e retorna (resposta, sucesso).
+    """
+
+    def __init__(self, fila, responder, enviador, workers=2, intervalo_consulta=1.0, intervalo_limpeza=3600.0):
+        self.fila = fila
+        self.responder = responder
+        self.enviador = enviador
+        self.workers = workers
+        self.intervalo_consulta = intervalo_consulta
+        self.intervalo_limpeza = intervalo_limpeza
+        self._encerrar = threading.Event()
+        self._threads = []
+        self._ultima_limpeza = time.monotonic()
+        self._lock = threading.Lock()
+        self.ocupados = 0
+
+    def receber(self, payload):
+        """Enfileira as mensagens de texto de uma notificação; retorna (novas, repetidas)"""
+        mensagens = extrair_mensagens(payload)
+        if not mensagens:
+            return 0, 0
+        novas = self.fila.enfileirar([
+            (mensagem['id'], mensagem['telefone'], mensagem) for mensagem in mensagens
+        ])
+        return len(novas), len(mensagens) - len(novas)
+
+    def iniciar(self):
+        if self._threads:
+            return
+        for numero in range(self.workers):
+            thread = threading.Thread(target=self._executar, name=f'whatsapp-{numero}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"📱 Processamento do WhatsApp iniciado com {self.workers} worker(s)")
+
+    def encerrar(self, timeout=5):
+        self._encerrar.set()
+        self.fila.acordar_todos()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _executar(self):
+        while not self._encerrar.is_set():
+            try:
+                self._limpar_se_preciso()
+                trabalho = self.fila.reservar()
+            except Exception as e:
+                print(f"Erro ao consultar a fila do WhatsApp: {e}")
+                self._encerrar.wait(self.intervalo_consulta)
+                continue
+            if trabalho is None:
+                self.fila.aguardar(self.intervalo_consulta)
+                continue
+            self.processar(trabalho)
+
+    def _limpar_se_preciso(self):
+        with self._lock:
+            if time.monotonic() - self._ultima_limpeza < self.intervalo_limpeza:
+                return
+            self._ultima_limpeza = time.monotonic()
+        apagados = self.fila.limpar()
+        if apagados:
+            print(f"🧹 {apagados} mensagem(ns) antigas do WhatsApp removidas da fila")
+
+    def processar(self, trabalho):
+        id_trabalho, chave, telefone, mensagem, tentativa = trabalho
+        with self._lock:
+            self.ocupados += 1
+        # Numa nova tentativa depois de uma falha no envio, a resposta e as partes já enviadas
+        # estão no trabalho: só o envio das partes restantes é repetido (sem nova consulta ao
+        # Gemini, nova entrada no histórico nem mensagens duplicadas para o usuário)
+        resposta = mensagem.get('resposta')
+        enviadas = mensagem.get('partes_enviadas', 0)
+        try:
+            if resposta is None:
+                resposta, sucesso = self.responder(telefone, mensagem['texto'])
+                if not sucesso and tentativa < self.fila.max_tentativas:
+                    # Falha passageira (Gemini fora do ar, cota): tentar de novo mais tarde em vez de
+                    # enviar o aviso como resposta final; na última tentativa, o aviso é enviado
+                    aviso, resposta = resposta, None
+                    raise RuntimeError(f"sem resposta do bot: {aviso}")
+            partes = dividir_texto(resposta)
+            for indice in range(enviadas, len(partes)):
+                self.enviador.enviar(telefone, partes[indice])
+                enviadas = indice + 1
+        except Exception as e:
+            print(f"Erro ao processar a mensagem {chave} do WhatsApp (tentativa {tentativa}): {e}")
+            traceback.print_exc()
+            dados = {**mensagem, 'resposta': resposta, 'partes_enviadas': enviadas} if resposta else None
+            self.fila.falhar(id_trabalho, tentativa, e, dados=dados)
+        else:
+            self.fila.concluir(id_trabalho)
+        finally:
+            with self._lock:
+                self.ocupados -= 1
+
+    def estatisticas(self):
+        with self._lock:
+            ocupados = self.ocupados
+        return {
+            'workers': len(self._threads),
+            'workers_ocupados': ocupados,
+            'enviador': type(self.enviador).__name__,
+            **self.fila.estatisticas(),
+        }